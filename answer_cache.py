@@ -0,0 +1,74 @@
+"""
+Semantic Answer Cache
+=====================
+Reuses a generated answer when a new question is a near-duplicate of an earlier
+one: same index version, same retrieved chunk set, and query embeddings with a
+cosine similarity of at least `threshold`. The chunk-set check is what makes a
+loose threshold safe: two rephrasings only share an answer if retrieval handed
+the LLM exactly the same context.
+
+Entries are grouped per (index version, chunk ids) in an LRUCache, so publishing
+a new snapshot makes every older answer unreachable; clear() frees them.
+"""
+
+import threading
+import numpy as np
+from lru_cache import LRUCache
+
+
+class SemanticAnswerCache:
+    def __init__(self, max_groups=512, threshold=0.95, ttl=0, per_group=8):
+        self.groups = LRUCache(max_groups, ttl, name="answers")
+        self.threshold = threshold
+        self.per_group = per_group
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _key(version, chunk_ids):
+        return version, tuple(sorted(int(i) for i in chunk_ids))
+
+    @staticmethod
+    def _unit(query_vector):
+        vector = np.asarray(query_vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, version, chunk_ids, query_vector):
+        """Returns the cached (context_data, answer) of the closest earlier question, or None"""
+        entries = self.groups.get(self._key(version, chunk_ids)) or []
+        best, best_sim = None, self.threshold
+        if entries:
+            query = self._unit(query_vector)
+            for vector, payload in entries:
+                sim = float(vector @ query)
+                if sim >= best_sim:
+                    best, best_sim = payload, sim
+        with self.lock:
+            if best is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return best
+
+    def store(self, version, chunk_ids, query_vector, context_data, answer):
+        key = self._key(version, chunk_ids)
+        with self.lock:
+            # Copy-on-write: concurrent lookups keep iterating the list they got
+            entries = list(self.groups.get(key) or [])
+            entries.append((self._unit(query_vector), (context_data, answer)))
+            self.groups.put(key, entries[-self.per_group:])
+
+    def clear(self):
+        self.groups.clear()
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "groups": self.groups.stats()["entries"],
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
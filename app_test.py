@@ -1,25 +1,43 @@
-from flask import Flask, request, jsonify, render_template, Response, stream_with_context
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context, after_this_request
 from flask_cors import CORS
-import ollama
 import time
 import os
-import numpy as np
 import json
 import threading
+import queue
 import re
 from werkzeug.utils import secure_filename
-import tempfile
+import uuid
+import hashlib
 import sys
 import webbrowser
 from threading import Timer
 import traceback
-from flashrank import Ranker, RerankRequest
+import multiprocessing
+import logging
+from dataclasses import dataclass, field
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
 
 # --- CUSTOM MODULES ---
 # Using your existing filenames
 from multi_parser_test import SmartMultiColumnParser 
-from index_test import build_rag_index, to_float16
-from config import EMBEDDING_MODEL, LANGUAGE_MODEL
+from index_test import IndexBuilder, to_float32, embed_query, get_embed_client, query_embedding_cache, query_dispatcher
+from index_store import save_index, load_index, clear_index
+from jobs import IngestJobQueue
+from lru_cache import LRUCache
+from answer_cache import SemanticAnswerCache
+from rewrite_classifier import classify, SKIP, REWRITE
+from reranker import CascadeReranker
+from warmup import WarmUp, PENDING, LOADING
+from session_store import SessionStore, new_session_id, valid_session_id
+from metrics import (REGISTRY, CONTENT_TYPE, STAGE_SECONDS, CHAT_REQUESTS, GENERATED_TOKENS, TOKENS_PER_SECOND,
+                     INGEST_CHUNKS, INGEST_SECONDS, INGEST_THROUGHPUT, INGEST_JOB_SECONDS)
+from config import EMBEDDING_MODEL, LANGUAGE_MODEL, STREAM_QUEUE_SIZE, STREAM_EMBED_BATCH, REWRITE_CACHE_SIZE, REWRITE_CACHE_TTL
+from config import ANSWER_CACHE_SIZE, ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_TTL
+from config import RERANK_MODEL, RERANK_FAST_MODEL, RERANK_MODEL_DIR, RERANK_CANDIDATES, RERANK_PRUNE_KEEP
+from config import RERANK_EARLY_EXIT_GAP, RERANK_CACHE_SIZE
+from config import SESSION_MAX_TURNS, SESSION_MAX_SESSIONS, SESSION_IDLE_TTL, SESSION_MEMORY_MB, LOG_LEVEL
 
 # --- CONFIGURATION ---
 if getattr(sys, 'frozen', False):
@@ -41,84 +59,148 @@ if os.path.exists(settings_path):
 
 print(f"Using Models -> Language: {LANGUAGE_MODEL} | Embedding: {EMBEDDING_MODEL}")
 
+# Query-path logging: INFO for one line per step, DEBUG adds the reranked chunk texts
+logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+log = logging.getLogger("rag")
+
 app = Flask(__name__)
 CORS(app)
 
 # --- GLOBAL STATE ---
+@dataclass(frozen=True)
+class IndexSnapshot:
+    """
+    Everything a query needs, published as one immutable object.
+    Readers grab state.snapshot once (no lock); writers build a new snapshot
+    and swap it in, so a search never sees a half-updated index.
+    """
+    vector_index: object = None
+    bm25_index: object = None   # Keyword Index
+    chunk_map: dict = field(default_factory=dict)
+    version: int = 0
+
+    @property
+    def is_ready(self):
+        return self.vector_index is not None and self.bm25_index is not None
+
 class RAGState:
     def __init__(self):
-        self.vector_index = None
-        self.bm25_index = None   # <--- NEW: Stores the Keyword Index
-        self.chunk_map = {}
-        self.all_chunks = [] 
-        self.is_ready = False
-        self.is_processing = False
-        self.lock = threading.Lock()
-        self.chat_history = []
-        self.ranker = Ranker(model_name="ms-marco-MiniLM-L-12-v2")
+        self.snapshot = IndexSnapshot()
+        self.lock = threading.Lock()        # small shared flags
+        self.write_lock = threading.Lock()  # serializes index writers (upload / reset), never taken by queries
+        # Conversation history per session id (sent by the frontend), bounded per session and overall
+        self.sessions = SessionStore(SESSION_MAX_TURNS, SESSION_MAX_SESSIONS, SESSION_IDLE_TTL,
+                                     int(SESSION_MEMORY_MB * 1024 * 1024))
+        # TinyBERT prune -> MiniLM rescore; models load on the first query, not at import
+        self.reranker = CascadeReranker(RERANK_MODEL, RERANK_FAST_MODEL, RERANK_MODEL_DIR, RERANK_PRUNE_KEEP,
+                                        RERANK_EARLY_EXIT_GAP, RERANK_CACHE_SIZE)
+        self.rewrite_cache = LRUCache(REWRITE_CACHE_SIZE, REWRITE_CACHE_TTL, name="query_rewrites")
+        self.answer_cache = SemanticAnswerCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_TTL)
         
 state = RAGState()
 
+# --- RESTORE PERSISTED KNOWLEDGE BASE ---
+def restore_knowledge_base():
+    version = state.snapshot.version
+    v_index, b_index, mapping = load_index(embedding_model=EMBEDDING_MODEL)
+    if v_index is None:
+        return
+    with state.write_lock:
+        if state.snapshot.version != version:
+            print("⚠️ Knowledge base was reset while it was restoring, discarding the restored copy")
+            return
+        state.snapshot = IndexSnapshot(v_index, b_index, mapping, state.snapshot.version + 1)
+
+def load_pdf_stack():
+    import fitz  # noqa: F401  (PyMuPDF)
+    import pymupdf4llm  # noqa: F401
+
+def load_ollama_client():
+    import ollama  # noqa: F401
+    get_embed_client()
+
+# --- WARM-UP (background thread: the server answers /health right away) ---
+# Started by the entry points, not at import: parser processes (spawned on Windows / macOS)
+# re-import this module and must not restore the index or load the rerankers themselves.
+warmup = WarmUp()
+warmup.add("knowledge_base", restore_knowledge_base)
+warmup.add("reranker", lambda: state.reranker.warm_up())
+warmup.add("ollama_client", load_ollama_client, required=False)
+warmup.add("pdf_parser", load_pdf_stack, required=False)
+
+@app.before_request
+def start_warmup():
+    # No-op after the first call; covers WSGI servers and test clients that only import `app`
+    warmup.start()
+
 # --- HELPER: HYBRID SEARCH (RRF) ---
-def perform_hybrid_search(query, k=60):
-    with state.lock:
-        if not state.vector_index or not state.bm25_index:
-            return []
-            
-        # 1. Vector Search
-        response = ollama.embed(model=EMBEDDING_MODEL, input=query)
-        embed_np = np.array(response['embeddings'][0]).reshape(1, -1)
-        D, I = state.vector_index.search(to_float16(embed_np), k)
+def perform_hybrid_search(query, k=60, snapshot=None, max_results=5):
+    # Lock-free: pin one snapshot for the whole query. Pass the caller's snapshot
+    # so ids and chunk_map lookups afterwards refer to the same index version.
+    snap = snapshot or state.snapshot
+    if not snap.is_ready:
+        return []
         
-        # 2. BM25 Search
+    # 1. Vector Search (query vectors are cached, repeated questions skip Ollama)
+    with STAGE_SECONDS.time(stage="query_embed"):
+        embed_np = embed_query(query)
+    with STAGE_SECONDS.time(stage="vector_search"):
+        D, I = snap.vector_index.search(to_float32(embed_np), k)
+    
+    # 2. BM25 Search
+    with STAGE_SECONDS.time(stage="bm25"):
         tokenized_query = re.findall(r'\w+', query.lower())
-        bm25_scores = state.bm25_index.get_scores(tokenized_query)
-        top_n_bm25 = np.argsort(bm25_scores)[::-1][:k]
-        
-        # 3. Fuse Rankings (RRF)
-        final_scores = {}
-        RRF_K = 60
+        # Only documents sharing a term with the query are scored (posting lists, not the corpus)
+        top_n_bm25, _ = snap.bm25_index.top_k(tokenized_query, k)
+    
+    # 3. Fuse Rankings (RRF)
+    with STAGE_SECONDS.time(stage="rrf_fusion"):
+        return fuse_rankings(query, snap, I[0], top_n_bm25, max_results)
+
+def fuse_rankings(query, snap, vector_ids, bm25_ids, max_results):
+    final_scores = {}
+    RRF_K = 60
+    
+    red_flags = ["political", "donation", "bribe", "gift", "trust", "conflict", "relative"]
+    active_flags = [word for word in red_flags if word in query.lower()]
+
+    def get_boost(chunk_idx):
+        if not active_flags: return 0.0
+        text = snap.chunk_map.get(chunk_idx, "").lower()
+        return 0.15 if any(flag in text for flag in active_flags) else 0.0
+
+    for rank, idx in enumerate(vector_ids):
+        if idx == -1: continue
+        if idx not in final_scores: final_scores[idx] = 0.0
+        final_scores[idx] += (1.0 / (rank + RRF_K)) + get_boost(idx)
         
-        red_flags = ["political", "donation", "bribe", "gift", "trust", "conflict", "relative"]
-        active_flags = [word for word in red_flags if word in query.lower()]
-
-        def get_boost(chunk_idx):
-            if not active_flags: return 0.0
-            text = state.chunk_map.get(chunk_idx, "").lower()
-            return 0.15 if any(flag in text for flag in active_flags) else 0.0
-
-        for rank, idx in enumerate(I[0]):
-            if idx == -1: continue
-            if idx not in final_scores: final_scores[idx] = 0.0
-            final_scores[idx] += (1.0 / (rank + RRF_K)) + get_boost(idx)
-            
-        for rank, idx in enumerate(top_n_bm25):
-            if idx not in final_scores: final_scores[idx] = 0.0
-            final_scores[idx] += (1.0 / (rank + RRF_K)) + get_boost(idx)
-            
-        # --- 4. NEW LOGIC: Dynamic Cutoff (The "Noise Gate") ---
-        # Sort all candidates by score
-        sorted_candidates = sorted(final_scores.items(), key=lambda x: x[1], reverse=True)
+    for rank, idx in enumerate(bm25_ids):
+        if idx not in final_scores: final_scores[idx] = 0.0
+        final_scores[idx] += (1.0 / (rank + RRF_K)) + get_boost(idx)
         
-        if not sorted_candidates:
-            return []
+    # --- 4. NEW LOGIC: Dynamic Cutoff (The "Noise Gate") ---
+    # Sort all candidates by score
+    sorted_candidates = sorted(final_scores.items(), key=lambda x: x[1], reverse=True)
+    
+    if not sorted_candidates:
+        return []
 
-        # Get the score of the absolute best match
-        best_score = sorted_candidates[0][1]
+    # Get the score of the absolute best match
+    best_score = sorted_candidates[0][1]
+    
+    # Only keep chunks that are at least 50% as good as the winner
+    # This deletes the "long tail" of garbage results
+    filtered_results = []
+    for idx, score in sorted_candidates:
+        if score >= (best_score * 0.5):
+            filtered_results.append((idx, score))
         
-        # Only keep chunks that are at least 50% as good as the winner
-        # This deletes the "long tail" of garbage results
-        filtered_results = []
-        for idx, score in sorted_candidates:
-            if score >= (best_score * 0.5):
-                filtered_results.append((idx, score))
+        # Stop if we have enough good ones (e.g., top 20 candidates max)
+        if len(filtered_results) >= 20:
+            break
             
-            # Stop if we have enough good ones (e.g., top 20 candidates max)
-            if len(filtered_results) >= 20:
-                break
-                
-        # Return the top k from the FILTERED list
-        return filtered_results[:5]  # STRICTLY return 5
+    # Return the top k from the FILTERED list
+    return filtered_results[:max_results]  # 5 unless the reranker gets a wider pool
 
 def rewrite_query(user_question, history):
     """
@@ -129,7 +211,8 @@ def rewrite_query(user_question, history):
     if not history:
         return user_question
 
-    print("🔄 Rewriting query with history...")
+    import ollama
+    log.info("Rewriting query with history...")
     
     system_prompt = (
         "You are a Search Query Generator. Your task is to rephrase the User's last question "
@@ -147,272 +230,568 @@ def rewrite_query(user_question, history):
     history_str = "\n".join([f"{msg['role']}: {msg['content']}" for msg in history[-4:]]) # Keep last 4 turns
     
     prompt = f"History:\n{history_str}\n\nUser's Last Question: {user_question}\n\nRewritten Standalone Query:"
+
+    # The prompt is everything the rewrite depends on, so it is the cache key
+    cache_key = (LANGUAGE_MODEL, hashlib.sha1(prompt.encode('utf-8')).hexdigest())
+    new_query = state.rewrite_cache.get(cache_key)
+    if new_query is not None:
+        log.info("Rewrite cache hit: %r -> %r", user_question, new_query)
+        return new_query
     
-    response = ollama.chat(model=LANGUAGE_MODEL, messages=[
-        {'role': 'system', 'content': system_prompt},
-        {'role': 'user', 'content': prompt}
-    ])
+    with STAGE_SECONDS.time(stage="rewrite"):
+        response = ollama.chat(model=LANGUAGE_MODEL, messages=[
+            {'role': 'system', 'content': system_prompt},
+            {'role': 'user', 'content': prompt}
+        ])
     
     new_query = response['message']['content'].strip()
-    print(f"✨ Original: '{user_question}' -> Rewritten: '{new_query}'")
+    state.rewrite_cache.put(cache_key, new_query)
+    log.info("Original: %r -> Rewritten: %r", user_question, new_query)
     return new_query
 
+def remember_turn(session_id, question, answer):
+    # Keeps the last SESSION_MAX_TURNS exchanges of this session only
+    state.sessions.append_turn(session_id, question, answer)
+
+# Rewrites that run next to a speculative search on the raw question
+rewrite_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="rewrite")
+
+def retrieve_for_chat(raw_query, history, snap, k=25, max_results=5):
+    """
+    Returns (search_query, initial_results), paying for the rewrite LLM call only when needed:
+    - SKIP:    standalone question, search it right away
+    - REWRITE: follow-up, rewrite first and search the rewritten query
+    - UNCLEAR: rewrite in the background while the raw question is searched; the
+               speculative results win when the rewrite comes back equivalent
+    """
+    decision = classify(raw_query, history)
+    log.info("Rewrite decision: %s", decision)
+    if decision == SKIP:
+        return raw_query, perform_hybrid_search(raw_query, k=k, snapshot=snap, max_results=max_results)
+    if decision == REWRITE:
+        search_query = rewrite_query(raw_query, history)
+        return search_query, perform_hybrid_search(search_query, k=k, snapshot=snap, max_results=max_results)
+
+    pending = rewrite_pool.submit(rewrite_query, raw_query, list(history))
+    speculative = perform_hybrid_search(raw_query, k=k, snapshot=snap, max_results=max_results)
+    search_query = pending.result()
+    if re.findall(r'\w+', search_query.lower()) == re.findall(r'\w+', raw_query.lower()):
+        log.info("Speculative search kept (rewrite changed nothing)")
+        return raw_query, speculative
+    return search_query, perform_hybrid_search(search_query, k=k, snapshot=snap, max_results=max_results)
+
 # --- ROUTES ---
 @app.route('/')
 def home():
     # return render_template('index.html')
     return render_template('index2.html')
 
-@app.route('/upload', methods=['POST'])
-def upload_files():
-    # --- 1. SET BUSY FLAG ---
-    with state.lock:
-        state.is_processing = True
-
-    try:
-        start_time = time.time()
-        files = request.files.getlist("files")
-        if not files:
-            return jsonify({"error": "No files received"}), 400
+TEMP_DIR = "temp_uploads"
 
-        print("\n=== Processing Upload (Hybrid Search Enabled) ===")
-        TEMP_DIR = "temp_uploads"
-        os.makedirs(TEMP_DIR, exist_ok=True)
-        
-        # Initialize Smart Parser
-        parser = SmartMultiColumnParser(chunk_size=1000, chunk_overlap=400) # Ensure overlap is 400!
-        new_chunks_text = []
+class IngestStopped(Exception):
+    """Raised in the parser thread when the indexing side of the job has given up"""
 
-        for f in files:
-            filename = secure_filename(f.filename)
-            print(f"📄 Reading: {filename}")
-            file_path = os.path.join(TEMP_DIR, filename)
-            f.save(file_path)
+def ingest_job(job):
+    """
+    Runs on the ingest worker thread as a streaming pipeline:
+        parser thread: pages -> chunks -> bounded queue
+        this thread:   queue -> embedding batches -> private index copy -> publish snapshot
+    Embedding starts with the first parsed pages, and the bounded queue keeps memory
+    flat however long the documents are.
+    """
+    # Build on top of the persisted knowledge base, not on the empty one it replaces
+    warmup.wait("knowledge_base")
+    start_time = time.time()
+    print(f"\n=== Processing Upload Job {job.id} (Hybrid Search Enabled) ===")
+
+    # Initialize Smart Parser
+    parser = SmartMultiColumnParser(chunk_size=1000, chunk_overlap=400) # Ensure overlap is 400!
+    chunk_queue = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+    end_of_stream = object()
+    throughput = {"parse": [0, 0.0], "embed": [0, 0.0]}  # stage -> [chunks, seconds] for this job
+    stop = threading.Event()  # set when indexing fails: the parser must not wait on a full queue forever
+
+    def put(item):
+        while True:
+            if stop.is_set():
+                raise IngestStopped()
+            try:
+                chunk_queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def produce():
+        try:
+            for file_idx, entry in enumerate(job.files):
+                if stop.is_set():
+                    break
+                filename, file_path = entry["name"], entry["path"]
+                print(f"📄 Reading: {filename}")
+                job.file_status(file_idx, "parsing")
+                n_chunks = 0
+                parse_start = time.perf_counter()
 
+                try:
+                    # --- PARSE & CHUNK ---
+                    if filename.lower().endswith('.pdf'):
+                        clean_filename = filename.replace(".pdf", "").replace("_", " ")
+                        with closing(parser.iter_chunks([file_path], verbose=True)) as chunks:
+                            for _, chunk_obj in chunks:
+                                formatted_text = (
+                                    f"[{clean_filename}] [Page {chunk_obj.page_num} | {chunk_obj.chunk_type}]\n"
+                                    f"{chunk_obj.content}"
+                                )
+                                put((file_idx, formatted_text))  # blocks while embedding catches up
+                                n_chunks += 1
+                        print(f"   -> Extracted {n_chunks} chunks from {filename}")
+                    else:
+                        # Text fallback
+                        with open(file_path, 'r', encoding='utf-8', errors='ignore') as txt_f:
+                            text = txt_f.read()
+                            clean_filename = filename.replace("_", " ")
+                            put((file_idx, f"[{clean_filename}] {text}"))
+                            n_chunks = 1
+                        print(f"   -> Added text file: {filename}")
+                    job.file_status(file_idx, "parsed", n_chunks)
+
+                except IngestStopped:
+                    job.file_status(file_idx, "failed", n_chunks)
+                    break
+                except Exception as e:
+                    print(f"❌ Error processing {filename}: {e}")
+                    traceback.print_exc()
+                    job.file_status(file_idx, "failed", n_chunks)
+                finally:
+                    # Includes time blocked on a full queue, i.e. parse throughput as the pipeline saw it
+                    parse_seconds = time.perf_counter() - parse_start
+                    throughput["parse"][0] += n_chunks
+                    throughput["parse"][1] += parse_seconds
+                    INGEST_CHUNKS.inc(n_chunks, stage="parsed")
+                    INGEST_SECONDS.inc(parse_seconds, stage="parse")
+                    try:
+                        if os.path.exists(file_path): os.remove(file_path)
+                    except Exception as e: print(f"⚠️ Cleanup warning: {e}")
+        finally:
             try:
-                # --- PARSE & CHUNK ---
-                if filename.lower().endswith('.pdf'):
-                    raw_chunk_objects = parser.parse_and_chunk(file_path, verbose=True)
-                    clean_filename = filename.replace(".pdf", "").replace("_", " ")
-                    
-                    for chunk_obj in raw_chunk_objects:
-                        formatted_text = (
-                            f"[{clean_filename}] [Page {chunk_obj.page_num} | {chunk_obj.chunk_type}]\n"
-                            f"{chunk_obj.content}"
-                        )
-                        new_chunks_text.append(formatted_text)
-                    print(f"   -> Extracted {len(raw_chunk_objects)} chunks from {filename}")
-                else:
-                    # Text fallback
-                    with open(file_path, 'r', encoding='utf-8', errors='ignore') as txt_f:
-                        text = txt_f.read()
-                        clean_filename = filename.replace("_", " ")
-                        new_chunks_text.append(f"[{clean_filename}] {text}")
-                    print(f"   -> Added text file: {filename}")
+                put(end_of_stream)
+            except IngestStopped:
+                pass
 
-            except Exception as e:
-                print(f"❌ Error processing {filename}: {e}")
-                traceback.print_exc()
-            finally:
-                time.sleep(0.1)
+    producer = threading.Thread(target=produce, name=f"parse-{job.id}", daemon=True)
+
+    # --- INDEXING ---
+    # Queries keep reading the current snapshot while we embed; only writers queue here
+    with state.write_lock:
+        current = state.snapshot
+        builder = IndexBuilder(current.vector_index, current.bm25_index, current.chunk_map)
+        new_chunks_text = []
+        added_per_file = [0] * len(job.files)
+        producer.start()
+
+        try:
+            finished = False
+            while not finished:
+                # Take whatever is ready (at least one chunk), up to one embedding batch
+                batch = [chunk_queue.get()]
+                while len(batch) < STREAM_EMBED_BATCH:
+                    try:
+                        batch.append(chunk_queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if batch[-1] is end_of_stream:
+                    batch.pop()
+                    finished = True
+                if not batch:
+                    continue
+
+                already_done = len(new_chunks_text)
+                texts = [text for _, text in batch]
+                new_chunks_text.extend(texts)
+                embed_start = time.perf_counter()
+                kept = builder.add(texts, progress_callback=lambda done, _total: job.embed_progress(already_done + done, len(new_chunks_text)))
+                for i in kept:
+                    added_per_file[batch[i][0]] += 1
+                embed_seconds = time.perf_counter() - embed_start
+                throughput["embed"][0] += len(batch)
+                throughput["embed"][1] += embed_seconds
+                INGEST_CHUNKS.inc(len(batch), stage="embedded")
+                INGEST_SECONDS.inc(embed_seconds, stage="embed")
+        finally:
+            # On an indexing error: release the parser (it stops at its next put, closing the
+            # parse generator) and delete the uploads it never got to
+            stop.set()
+            producer.join()
+            for entry in job.files:
                 try:
-                    if os.path.exists(file_path): os.remove(file_path)
+                    if os.path.exists(entry["path"]): os.remove(entry["path"])
                 except Exception as e: print(f"⚠️ Cleanup warning: {e}")
 
-        # --- 2. INDEXING ---
-        with state.lock:
-            state.all_chunks.extend(new_chunks_text)
-            print(f"📊 Building Hybrid Index with {len(state.all_chunks)} chunks...")
-            
+        print(f"📊 Added {builder.added}/{len(new_chunks_text)} chunks to Hybrid Index ({len(builder.chunk_map)} total)")
+
+        if builder.added:
+            v_index, b_index, mapping = builder.finish()
+
+            # Atomic publish: one attribute assignment
+            state.snapshot = IndexSnapshot(v_index, b_index, mapping, current.version + 1)
+            state.answer_cache.clear()  # cached answers belong to the old version
+
+            # Persist so a restart does not need a full re-embed
             try:
-                v_index, b_index, mapping = build_rag_index(state.all_chunks)
-                
-                state.vector_index = v_index
-                state.bm25_index = b_index
-                state.chunk_map = mapping
-                state.is_ready = True
-                
-            except ValueError as ve:
-                print(f"❌ Indexer Error: {ve}")
-                return jsonify({"error": "Indexer mismatch."}), 500
-
-        elapsed_time = time.time() - start_time
-        print(f"✅ Processing complete in {elapsed_time:.2f} seconds")
-
-        return jsonify({
-            "message": f"Successfully indexed {len(new_chunks_text)} new chunks.",
-            "count": len(state.all_chunks),
-            "processing_time": f"{elapsed_time:.2f}s"
-        })
+                save_index(v_index, b_index, mapping, embedding_model=EMBEDDING_MODEL)
+            except Exception as e:
+                print(f"⚠️ Could not persist index: {e}")
+
+        total_chunks = len(state.snapshot.chunk_map)
+
+    # A chunk that failed to embed is not retried later: report the file so it can be re-uploaded
+    incomplete = []
+    for file_idx, entry in enumerate(job.files):
+        if entry["status"] != "parsed":
+            incomplete.append(entry["name"])
+        elif added_per_file[file_idx] == entry["chunks"]:
+            job.file_status(file_idx, "indexed")
+        else:
+            print(f"⚠️ {entry['name']}: only {added_per_file[file_idx]}/{entry['chunks']} chunks could be embedded")
+            job.file_status(file_idx, "partial" if added_per_file[file_idx] else "failed")
+            incomplete.append(entry["name"])
+    if new_chunks_text and not builder.added:
+        raise RuntimeError("No chunks could be embedded. Check that Ollama is running, then upload again.")
+
+    elapsed_time = time.time() - start_time
+    print(f"✅ Job {job.id} complete in {elapsed_time:.2f} seconds")
+    INGEST_JOB_SECONDS.observe(elapsed_time)
+    for stage, (chunks, seconds) in throughput.items():
+        if seconds > 0:
+            INGEST_THROUGHPUT.set(round(chunks / seconds, 3), stage=stage)
+
+    message = f"Successfully indexed {builder.added} new chunks."
+    if incomplete:
+        message = f"Indexed {builder.added}/{len(new_chunks_text)} new chunks. Re-upload: {', '.join(incomplete)}"
+    return {
+        "message": message,
+        "count": total_chunks,
+        "incomplete_files": incomplete,
+        "processing_time": f"{elapsed_time:.2f}s"
+    }
+
+ingest_queue = IngestJobQueue(ingest_job)
+
+def upload_path(filename):
+    """(safe filename, unique path in TEMP_DIR) for an uploaded file"""
+    os.makedirs(TEMP_DIR, exist_ok=True)
+    filename = secure_filename(filename)
+    # Unique on-disk name: several queued jobs may carry the same filename
+    return filename, os.path.join(TEMP_DIR, f"{uuid.uuid4().hex[:8]}_{filename}")
+
+def queue_upload(saved):
+    job = ingest_queue.submit(saved)
+    print(f"📥 Queued job {job.id} with {len(saved)} file(s)")
+    return {
+        "message": f"Queued {len(saved)} file(s) for indexing.",
+        "job_id": job.id,
+        "status_url": f"/jobs/{job.id}"
+    }
+
+@app.route('/upload', methods=['POST'])
+def upload_files():
+    """Saves the files and queues them; the heavy work happens on the ingest worker"""
+    try:
+        files = request.files.getlist("files")
+        if not files:
+            return jsonify({"error": "No files received"}), 400
+
+        saved = []
+        for f in files:
+            filename, file_path = upload_path(f.filename)
+            f.save(file_path)
+            saved.append((filename, file_path))
+        return jsonify(queue_upload(saved)), 202
 
     except Exception as e:
         print(f"❌ CRITICAL UPLOAD ERROR: {e}")
         return jsonify({"error": str(e)}), 500
-        
-    finally:
-        # --- 3. TURN OFF BUSY FLAG (Always runs) ---
-        with state.lock:
-            state.is_processing = False
-            print("🔓 System Released (Ready for Queries)")
+
+@app.route('/health', methods=['GET'])
+def health():
+    """Liveness: the process serves requests. Also lists what has been loaded so far."""
+    return jsonify({"status": "ok", **warmup.report()})
+
+def readiness_report():
+    report = warmup.report()
+    snap = state.snapshot
+    report["index"] = {"ready": snap.is_ready, "chunks": len(snap.chunk_map), "version": snap.version}
+    report["rerank_models"] = state.reranker.loaded()
+    return report
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness: 200 once the knowledge base and rerankers are loaded, 503 before"""
+    report = readiness_report()
+    return jsonify(report), 200 if report["ready"] else 503
+
+def collect_state_metrics():
+    """Scrape-time view of the caches, sessions and index (they keep their own counters)"""
+    caches = {
+        "query_embeddings": query_embedding_cache.stats(),
+        "query_rewrites": state.rewrite_cache.stats(),
+        "answers": state.answer_cache.stats(),
+        "rerank_scores": state.reranker.scores.stats(),
+    }
+    snap = state.snapshot
+    sessions = state.sessions.stats()
+    rerank = state.reranker.stats()
+    return [
+        ("rag_cache_hits_total", "counter", "Cache hits", [({"cache": n}, c["hits"]) for n, c in caches.items()]),
+        ("rag_cache_misses_total", "counter", "Cache misses", [({"cache": n}, c["misses"]) for n, c in caches.items()]),
+        ("rag_cache_entries", "gauge", "Entries held per cache",
+         [({"cache": n}, c.get("entries", c.get("groups", 0))) for n, c in caches.items()]),
+        ("rag_rerank_early_exits_total", "counter", "Reranks that skipped the rescore stage", [({}, rerank["early_exits"])]),
+        ("rag_query_embed_batches_total", "counter", "Coalesced query embed calls", [({}, query_dispatcher.stats()["batches"])]),
+        ("rag_index_chunks", "gauge", "Chunks in the published index", [({}, len(snap.chunk_map))]),
+        ("rag_index_version", "gauge", "Version of the published index snapshot", [({}, snap.version)]),
+        ("rag_sessions", "gauge", "Chat sessions held", [({}, sessions["sessions"])]),
+        ("rag_session_history_chars", "gauge", "History text held across sessions", [({}, sessions["bytes"])]),
+        ("rag_ready", "gauge", "1 once every required component is loaded", [({}, int(warmup.is_ready()))]),
+    ]
+
+REGISTRY.add_collector(collect_state_metrics)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text format: per-stage latency histograms, counters, cache stats"""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = ingest_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job id"}), 404
+    return jsonify(job.to_dict())
+
+# --- CHAT PIPELINE (shared by this Flask app and the ASGI app in async_app.py) ---
+GREETINGS = ['hi', 'hello', 'hey', 'greetings', 'hola']
+GREETING_REPLY = "Hello! I am ready to answer questions about your uploaded documents."
+
+SYSTEM_PROMPT = (
+    "You are an Intelligent Knowledge Assistant. Your task is to answer the user's question using ONLY the provided Context chunks.\n\n"
+    "--- CRITICAL ANALYSIS RULES ---\n"
+    "1. DETECT THE INTENT:\n"
+    "   - IF asking 'CAN I...' or 'IS IT ALLOWED...': Check the rules. If prohibited, start with 'No' and explain why.\n"
+    "   - IF asking 'WHAT IS THE POLICY...' or 'STANCE': Do not just say 'No'. Summarize the full scope of the rule.\n" 
+    "   - IF asking for DATA: Scan for exact keywords. The number immediately nearby is the answer.\n"
+    "   - IF asking for CONCEPTS: Synthesize a clear definition.\n"
+    "2. HANDLE PARSING ARTIFACTS:\n"
+    "   - Tables may look broken. If you see 'Value ... ... 10', the value is 10.\n"
+    "   - IMPORTANT: Always check sections marked '[ADDITIONAL NOTES / SIDEBARS]'. Vital headers often appear there.\n"
+    "3. DATE & TERM MAPPING:\n"
+    "   - 'FY22' = '2022', 'Q1' = 'First Quarter'.\n"
+    "--- RESPONSE GUIDELINES ---\n"
+    "- BE COMPREHENSIVE FOR RULES: Mention key details like 'zero tolerance' if present.\n"
+    "- BE PRECISE FOR DATA: Quote specific values.\n"
+    "- NO HALLUCINATIONS: If the answer is not in the text, strictly say 'I don't know'."
+)
+GENERATION_OPTIONS = {"stop": ["Context:", "Question:", "User:", "System:", "\n\n\n"], "temperature": 0.1}
+
+def ndjson(event):
+    return json.dumps(event) + "\n"
+
+def chat_session_id(data, headers):
+    # Each browser tab sends its own session id; without one the reply starts a new session
+    session_id = data.get("session_id") or headers.get("X-Session-Id")
+    return session_id if valid_session_id(session_id) else new_session_id()
+
+def not_ready_error(snap):
+    """(message, status) when the snapshot cannot answer questions yet, else None"""
+    if snap.is_ready:
+        return None
+    if warmup.status("knowledge_base") in (PENDING, LOADING):
+        return "The knowledge base is still loading. Please try again shortly.", 503
+    if ingest_queue.has_active_jobs():
+        return "Your first documents are still being indexed. Please try again shortly.", 503
+    return "System not ready. Upload files first.", 400
+
+@dataclass
+class ChatPlan:
+    """Everything /chat decided before generation: a cached answer to replay, or the context to answer from"""
+    session_id: str
+    raw_query: str
+    search_query: str
+    snap: IndexSnapshot
+    candidate_ids: list
+    query_vector: object
+    cached: tuple = None          # (context_data, answer) from the semantic answer cache
+    top_k_chunks: list = field(default_factory=list)
+    started: float = field(default_factory=time.perf_counter)
+    first_token_at: float = None
+    tokens: int = 0
+
+    def context_data(self):
+        # Context preview for the frontend
+        return [{"text": txt[:200]+"...", "score": round(float(score), 4)} for _, txt, score in self.top_k_chunks]
+
+    def messages(self):
+        context_str = "\n\n".join([txt for _, txt, _ in self.top_k_chunks])
+        # Use raw_query for natural tone, but context is now hyper-relevant
+        user_msg = f"Context:\n{context_str}\n\nQuestion: {self.raw_query}\n\nAnswer:"
+        return [{'role': 'system', 'content': SYSTEM_PROMPT}, {'role': 'user', 'content': user_msg}]
+
+    def record_token(self):
+        """Call per streamed chunk with content: time to first token and token counts"""
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+            STAGE_SECONDS.observe(self.first_token_at - self.started, stage="first_token")
+        self.tokens += 1
+
+    def finish(self, answer, context_data=None):
+        # --- STEP D: UPDATE HISTORY ---
+        remember_turn(self.session_id, self.raw_query, answer)
+        if context_data is not None:
+            state.answer_cache.store(self.snap.version, self.candidate_ids, self.query_vector, context_data, answer)
+
+        done = time.perf_counter()
+        STAGE_SECONDS.observe(done - self.started, stage="chat_total")
+        CHAT_REQUESTS.inc(outcome="cache_hit" if self.cached is not None else "answered")
+        if self.first_token_at is not None:
+            GENERATED_TOKENS.inc(self.tokens)
+            STAGE_SECONDS.observe(done - self.first_token_at, stage="generation")
+            if self.tokens > 1 and done > self.first_token_at:
+                TOKENS_PER_SECOND.observe((self.tokens - 1) / (done - self.first_token_at))
+
+def prepare_chat(raw_query, session_id, snap):
+    """Steps A and B of /chat (rewrite, search, answer cache, rerank). Blocking: embeds and reranks."""
+    history = state.sessions.history(session_id)
+
+    # --- STEP A: REWRITE THE QUERY (only when needed) + BROAD SEARCH ---
+    # We use the rewritten query for SEARCHING to fix "Context Pollution".
+    # Broad Search: Get Top 25 (We cast a wider net now)
+    started = time.perf_counter()
+    search_query, initial_results = retrieve_for_chat(raw_query, history, snap, k=25,
+                                                       max_results=RERANK_CANDIDATES)
+    log.info("Searched for: %r", search_query)
+
+    # --- STEP B: RERANKING (The Quality Upgrade) ---
+    # 1. Semantic answer cache: same index version + same candidate chunks + a
+    # near-identical question -> replay the earlier answer, skipping rerank and generation
+    candidate_ids = [idx for idx, _ in initial_results]
+    query_vector = embed_query(search_query)  # already cached by the search above
+    plan = ChatPlan(session_id, raw_query, search_query, snap, candidate_ids, query_vector, started=started)
+    plan.cached = state.answer_cache.lookup(snap.version, candidate_ids, query_vector)
+    if plan.cached is not None:
+        log.info("Answer cache hit for %r (index v%d)", search_query, snap.version)
+        return plan
+    
+    # 2. Format for the reranker
+    passages, fused_scores = [], []
+    for idx, score in initial_results:
+        text_content = snap.chunk_map.get(idx, "")
+        if text_content:
+            passages.append({"id": idx, "text": text_content})
+            fused_scores.append(score)
+
+    # 3. Rerank! (The AI Grader): TinyBERT prunes, MiniLM orders the survivors
+    final_top_k = 5
+    with STAGE_SECONDS.time(stage="rerank"):
+        reranked_results, rerank_info = state.reranker.rerank(search_query, passages, fused_scores, top_k=final_top_k)
+    log.info("Reranked %d chunks: prune %.1f ms -> %d kept, rescore %.1f ms, pairs scored %s%s",
+             len(passages), rerank_info['prune_ms'], rerank_info['pruned_to'], rerank_info['rescore_ms'],
+             rerank_info['scored'], " (early exit)" if rerank_info['early_exit'] else "")
+    
+    # 4. Select Top 5 High-Quality Survivors
+    for result in reranked_results:
+        plan.top_k_chunks.append((result['id'], result['text'], result['score']))
+    
+    # Optional: Sort by ID to maintain document reading order in the context
+    # plan.top_k_chunks.sort(key=lambda x: x[0]) 
+
+    log.info("Context loaded: %d chunks (filtered from %d)", len(plan.top_k_chunks), len(initial_results))
+    if log.isEnabledFor(logging.DEBUG):
+        for idx, txt, score in plan.top_k_chunks:
+            log.debug("Chunk #%s (relevance %.4f): %s...", idx, score, txt.replace('\n', ' ')[:300])
+    return plan
 
 @app.route('/chat', methods=['POST'])
 def chat():
     data = request.json
     raw_query = data.get("message", "").strip()
+    session_id = chat_session_id(data, request.headers)
 
-    # Initialize history if it doesn't exist yet
-    if not hasattr(state, 'chat_history'):
-        state.chat_history = []
+    @after_this_request
+    def send_session_id(response):
+        response.headers["X-Session-Id"] = session_id
+        return response
 
     # Greeting check
-    if raw_query.lower() in ['hi', 'hello', 'hey', 'greetings', 'hola']:
+    if raw_query.lower() in GREETINGS:
+        CHAT_REQUESTS.inc(outcome="greeting")
         def simple_stream():
-            yield json.dumps({"type": "token", "content": "Hello! I am ready to answer questions about your uploaded documents."}) + "\n"
+            yield ndjson({"type": "token", "content": GREETING_REPLY})
         return Response(stream_with_context(simple_stream()), mimetype='application/x-ndjson')
 
-    # --- 1. THE PATIENT WAIT LOOP (Queueing Logic) ---
-    if state.is_processing:
-        print(f"⏳ System is busy. Holding query: '{raw_query[:20]}...'")
-        max_retries = 120  # Wait up to 60 seconds
-        
-        for _ in range(max_retries):
-            time.sleep(0.5)
-            if not state.is_processing:
-                print("✅ Processing complete! Resuming query.")
-                break
-        else:
-            return jsonify({"error": "System is overloaded or taking too long. Please try again."}), 503
-
-    # --- 2. Standard Readiness Check ---
-    if not state.is_ready:
-        return jsonify({"error": "System not ready. Upload files first."}), 400
+    # --- 1. Readiness Check ---
+    # Queries are served from the last published snapshot, even while an ingest job runs.
+    snap = state.snapshot  # pinned for this request
+    error = not_ready_error(snap)
+    if error:
+        CHAT_REQUESTS.inc(outcome="not_ready")
+        return jsonify({"error": error[0]}), error[1]
 
     try:
-        # --- STEP A: REWRITE THE QUERY ---
-        # We use the rewritten query for SEARCHING to fix "Context Pollution"
-        search_query = rewrite_query(raw_query, state.chat_history)
-
-        # --- STEP B: HYBRID SEARCH + RERANKING (The Quality Upgrade) ---
-        print(f"🔎 SEARCHING FOR: {search_query}")
-        
-        # 1. Broad Search: Get Top 25 (We cast a wider net now)
-        initial_results = perform_hybrid_search(search_query, k=25)
-        
-        # 2. Format for FlashRank
-        passages = []
-        for idx, score in initial_results:
-            text_content = state.chunk_map.get(idx, "")
-            if text_content:
-                passages.append({
-                    "id": idx,
-                    "text": text_content,
-                    "meta": {} 
-                })
-
-        # 3. Rerank! (The AI Grader)
-        print(f"⚖️ Reranking {len(passages)} chunks...")
-        rerank_request = RerankRequest(query=search_query, passages=passages)
-        reranked_results = state.ranker.rerank(rerank_request)
-        
-        # 4. Select Top 5 High-Quality Survivors
-        final_top_k = 5
-        top_k_chunks = []
-        
-        for result in reranked_results[:final_top_k]:
-            idx = result['id']
-            txt = result['text']
-            score = result['score']
-            top_k_chunks.append((idx, txt, score))
-        
-        # Optional: Sort by ID to maintain document reading order in the context
-        # top_k_chunks.sort(key=lambda x: x[0]) 
-
-        print(f"✅ Context Loaded: {len(top_k_chunks)} chunks (Filtered from {len(initial_results)})")
-
-        # --- DEBUG: PRINT RERANKED CHUNKS ---
-        print("\n" + "="*50)
-        print(f"🏆 TOP {len(top_k_chunks)} RERANKED CHUNKS")
-        print("="*50)
-        for i, (idx, txt, score) in enumerate(top_k_chunks):
-            print(f"\n🔹 [Chunk #{idx}] (Relevance Score: {score:.4f})")
-            print("-" * 30)
-            print(txt.replace('\n', ' ')[:300] + "...") 
-            print("-" * 30)
-        print("="*50 + "\n")
+        plan = prepare_chat(raw_query, session_id, snap)
+        if plan.cached is not None:
+            cached_context, cached_answer = plan.cached
 
-        context_str = "\n\n".join([txt for _, txt, _ in top_k_chunks])
+            def replay():
+                yield ndjson({"type": "context", "data": cached_context})
+                yield ndjson({"type": "token", "content": cached_answer})
+                plan.finish(cached_answer)
+            return Response(stream_with_context(replay()), mimetype='application/x-ndjson')
 
         # --- STEP C: GENERATION ---
         def generate():
-            # Send context preview to frontend
-            context_data = [{"text": txt[:200]+"...", "score": round(float(score), 4)} for _, txt, score in top_k_chunks]
-            yield json.dumps({"type": "context", "data": context_data}) + "\n"
-
-            sys_msg = (
-                "You are an Intelligent Knowledge Assistant. Your task is to answer the user's question using ONLY the provided Context chunks.\n\n"
-                "--- CRITICAL ANALYSIS RULES ---\n"
-                "1. DETECT THE INTENT:\n"
-                "   - IF asking 'CAN I...' or 'IS IT ALLOWED...': Check the rules. If prohibited, start with 'No' and explain why.\n"
-                "   - IF asking 'WHAT IS THE POLICY...' or 'STANCE': Do not just say 'No'. Summarize the full scope of the rule.\n" 
-                "   - IF asking for DATA: Scan for exact keywords. The number immediately nearby is the answer.\n"
-                "   - IF asking for CONCEPTS: Synthesize a clear definition.\n"
-                "2. HANDLE PARSING ARTIFACTS:\n"
-                "   - Tables may look broken. If you see 'Value ... ... 10', the value is 10.\n"
-                "   - IMPORTANT: Always check sections marked '[ADDITIONAL NOTES / SIDEBARS]'. Vital headers often appear there.\n"
-                "3. DATE & TERM MAPPING:\n"
-                "   - 'FY22' = '2022', 'Q1' = 'First Quarter'.\n"
-                "--- RESPONSE GUIDELINES ---\n"
-                "- BE COMPREHENSIVE FOR RULES: Mention key details like 'zero tolerance' if present.\n"
-                "- BE PRECISE FOR DATA: Quote specific values.\n"
-                "- NO HALLUCINATIONS: If the answer is not in the text, strictly say 'I don't know'."
-            )
-            
-            # Use raw_query for natural tone, but context is now hyper-relevant
-            user_msg = f"Context:\n{context_str}\n\nQuestion: {raw_query}\n\nAnswer:"
-            
-            stream = ollama.chat(
-                model=LANGUAGE_MODEL,
-                messages=[{'role': 'system', 'content': sys_msg}, {'role': 'user', 'content': user_msg}],
-                stream=True,
-                options={"stop": ["Context:", "Question:", "User:", "System:", "\n\n\n"], "temperature": 0.1}
-            )
+            context_data = plan.context_data()
+            yield ndjson({"type": "context", "data": context_data})
+
+            import ollama
+            stream = ollama.chat(model=LANGUAGE_MODEL, messages=plan.messages(), stream=True, options=GENERATION_OPTIONS)
 
             full_response_text = ""
 
             for chunk in stream:
                 content = chunk['message']['content']
                 if content:
+                    plan.record_token()
                     full_response_text += content
-                    yield json.dumps({"type": "token", "content": content}) + "\n"
+                    yield ndjson({"type": "token", "content": content})
 
-            # --- STEP D: UPDATE HISTORY ---
-            state.chat_history.append({"role": "user", "content": raw_query})
-            state.chat_history.append({"role": "assistant", "content": full_response_text})
-            
-            if len(state.chat_history) > 10:
-                state.chat_history = state.chat_history[-10:]
+            plan.finish(full_response_text, context_data)
 
         return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
     except Exception as e:
-        print(f"ERROR: {e}")
-        traceback.print_exc()
+        CHAT_REQUESTS.inc(outcome="error")
+        log.exception("Chat failed: %s", e)
         return jsonify({"error": str(e)}), 500
 
+def reset_state(session_id):
+    with state.write_lock:
+        state.snapshot = IndexSnapshot(version=state.snapshot.version + 1)
+        state.answer_cache.clear()
+        clear_index()
+    # The caller's conversation goes too; other sessions keep theirs
+    state.sessions.clear(session_id or "")
+
 @app.route('/reset', methods=['POST'])
 def reset_knowledge_base():
-    with state.lock:
-        state.vector_index = None
-        state.bm25_index = None
-        state.chunk_map = {}
-        state.all_chunks = []
-        state.is_ready = False
+    reset_state(request.headers.get("X-Session-Id"))
     return jsonify({"message": "AI memory cleared!"})
 
 if __name__ == '__main__':
     def open_browser():
         webbrowser.open_new('http://127.0.0.1:8080/')
         
+    multiprocessing.freeze_support()  # parser process pool inside the frozen .exe
+    warmup.start()
     print("Starting Hybrid RAG Engine...")
     Timer(1.5, open_browser).start()
     app.run(port=8080, debug=True, use_reloader=False)
\ No newline at end of file
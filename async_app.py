@@ -0,0 +1,189 @@
+"""
+Async Serving Mode (ASGI)
+=========================
+The same routes and NDJSON protocol as app_test.py (/, /upload, /jobs/<id>,
+/chat, /reset, /health, /ready, /metrics), served by Starlette on uvicorn.
+/chat streams the answer from ollama.AsyncClient, so a slow generation holds a
+coroutine instead of an OS thread; hundreds of open streams cost hundreds of
+coroutines.
+
+Everything else is shared with the Flask app: the index snapshot, sessions,
+caches, ingest queue and warm-up thread live in app_test. The blocking part of
+/chat (rewrite, embedding, search, rerank: prepare_chat) runs on the threadpool
+for its few hundred milliseconds, then the thread goes back to the pool.
+
+Run:
+    python async_app.py
+    uvicorn async_app:app --port 8080      (one worker: the index lives in this process)
+"""
+
+import os
+import shutil
+import multiprocessing
+import webbrowser
+from threading import Timer
+from contextlib import asynccontextmanager
+
+import jinja2
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+from starlette.staticfiles import StaticFiles
+
+from app_test import (state, ingest_queue, warmup, readiness_report, upload_path, queue_upload, reset_state,
+                      chat_session_id, not_ready_error, prepare_chat, ndjson, GREETINGS, GREETING_REPLY,
+                      GENERATION_OPTIONS, LANGUAGE_MODEL, app_dir, log)
+from metrics import REGISTRY, CONTENT_TYPE, CHAT_REQUESTS
+
+NDJSON = "application/x-ndjson"
+
+templates = jinja2.Environment(loader=jinja2.FileSystemLoader(os.path.join(app_dir, "templates")), autoescape=True)
+# The templates are written for Flask: url_for('static', filename=...)
+templates.globals["url_for"] = lambda endpoint, filename: f"/{endpoint}/{filename}"
+
+llm = None  # ollama.AsyncClient, one per event loop (created in lifespan)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global llm
+    warmup.start()
+    import ollama
+    llm = ollama.AsyncClient()
+    yield
+
+
+async def home(request):
+    return HTMLResponse(templates.get_template("index2.html").render())
+
+
+async def upload_files(request):
+    """Saves the files and queues them; the heavy work happens on the ingest worker"""
+    try:
+        form = await request.form()
+        files = [f for f in form.getlist("files") if getattr(f, "filename", None)]
+        if not files:
+            return JSONResponse({"error": "No files received"}, status_code=400)
+
+        saved = []
+        for f in files:
+            filename, file_path = upload_path(f.filename)
+            with open(file_path, "wb") as out:
+                await run_in_threadpool(shutil.copyfileobj, f.file, out)
+            saved.append((filename, file_path))
+        return JSONResponse(queue_upload(saved), status_code=202)
+
+    except Exception as e:
+        print(f"❌ CRITICAL UPLOAD ERROR: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def job_status(request):
+    job = ingest_queue.get(request.path_params["job_id"])
+    if job is None:
+        return JSONResponse({"error": "Unknown job id"}, status_code=404)
+    return JSONResponse(job.to_dict())
+
+
+async def health(request):
+    return JSONResponse({"status": "ok", **warmup.report()})
+
+
+async def ready(request):
+    report = readiness_report()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+
+async def chat(request):
+    data = await request.json()
+    raw_query = data.get("message", "").strip()
+    session_id = chat_session_id(data, request.headers)
+    headers = {"X-Session-Id": session_id}
+
+    if raw_query.lower() in GREETINGS:
+        CHAT_REQUESTS.inc(outcome="greeting")
+        async def simple_stream():
+            yield ndjson({"type": "token", "content": GREETING_REPLY})
+        return StreamingResponse(simple_stream(), media_type=NDJSON, headers=headers)
+
+    snap = state.snapshot  # pinned for this request
+    error = not_ready_error(snap)
+    if error:
+        CHAT_REQUESTS.inc(outcome="not_ready")
+        return JSONResponse({"error": error[0]}, status_code=error[1], headers=headers)
+
+    try:
+        plan = await run_in_threadpool(prepare_chat, raw_query, session_id, snap)
+    except Exception as e:
+        CHAT_REQUESTS.inc(outcome="error")
+        log.exception("Chat failed: %s", e)
+        return JSONResponse({"error": str(e)}, status_code=500, headers=headers)
+
+    if plan.cached is not None:
+        cached_context, cached_answer = plan.cached
+
+        async def replay():
+            yield ndjson({"type": "context", "data": cached_context})
+            yield ndjson({"type": "token", "content": cached_answer})
+            plan.finish(cached_answer)
+        return StreamingResponse(replay(), media_type=NDJSON, headers=headers)
+
+    async def generate():
+        context_data = plan.context_data()
+        yield ndjson({"type": "context", "data": context_data})
+
+        stream = await llm.chat(model=LANGUAGE_MODEL, messages=plan.messages(), stream=True,
+                                options=GENERATION_OPTIONS)
+        full_response_text = ""
+        async for chunk in stream:
+            content = chunk['message']['content']
+            if content:
+                plan.record_token()
+                full_response_text += content
+                yield ndjson({"type": "token", "content": content})
+
+        plan.finish(full_response_text, context_data)
+
+    return StreamingResponse(generate(), media_type=NDJSON, headers=headers)
+
+
+async def metrics(request):
+    return Response(REGISTRY.render(), headers={"Content-Type": CONTENT_TYPE})
+
+
+async def reset_knowledge_base(request):
+    # Takes the index write lock and deletes files: off the event loop
+    await run_in_threadpool(reset_state, request.headers.get("X-Session-Id"))
+    return JSONResponse({"message": "AI memory cleared!"})
+
+
+app = Starlette(
+    routes=[
+        Route("/", home),
+        Route("/upload", upload_files, methods=["POST"]),
+        Route("/jobs/{job_id}", job_status),
+        Route("/chat", chat, methods=["POST"]),
+        Route("/reset", reset_knowledge_base, methods=["POST"]),
+        Route("/health", health),
+        Route("/ready", ready),
+        Route("/metrics", metrics),
+        Mount("/static", StaticFiles(directory=os.path.join(app_dir, "static")), name="static"),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"],
+                           expose_headers=["X-Session-Id"])],
+    lifespan=lifespan,
+)
+
+if __name__ == '__main__':
+    import uvicorn
+
+    def open_browser():
+        webbrowser.open_new('http://127.0.0.1:8080/')
+
+    multiprocessing.freeze_support()  # parser process pool inside the frozen .exe
+    print("Starting Hybrid RAG Engine (async)...")
+    Timer(1.5, open_browser).start()
+    uvicorn.run(app, host="127.0.0.1", port=8080)
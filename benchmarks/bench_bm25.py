@@ -0,0 +1,64 @@
+"""
+Micro-benchmark: BM25 keyword leg
+=================================
+Compares BM25Okapi.get_scores + full argsort (what perform_hybrid_search used to
+do) against the inverted-index BM25Index.top_k on synthetic Zipf-like corpora,
+and checks that both return the same top-k scores.
+
+Usage:
+    python -m benchmarks.bench_bm25
+"""
+
+import sys
+import time
+import numpy as np
+from rank_bm25 import BM25Okapi
+
+from bm25_engine import BM25Index
+
+TOP_K = 25
+
+
+def synthetic_corpus(n_docs, vocab_size=20000, doc_len=150, seed=0):
+    rng = np.random.default_rng(seed)
+    # Zipf-ish term distribution, like real text: a few very common terms, a long tail
+    weights = 1.0 / np.arange(1, vocab_size + 1)
+    weights /= weights.sum()
+    term_ids = rng.choice(vocab_size, size=(n_docs, doc_len), p=weights)
+    return [[f"t{t}" for t in row] for row in term_ids]
+
+
+def queries(n, vocab_size=20000, seed=1):
+    rng = np.random.default_rng(seed)
+    return [[f"t{t}" for t in rng.integers(0, vocab_size // 10, size=rng.integers(2, 7))] for _ in range(n)]
+
+
+def report(n_docs, n_queries=20):
+    corpus = synthetic_corpus(n_docs)
+    okapi = BM25Okapi(corpus)
+    engine = BM25Index.from_tokenized(corpus)
+
+    identical = True
+    t_okapi = t_engine = 0.0
+    for query in queries(n_queries):
+        start = time.perf_counter()
+        scores = okapi.get_scores(query)
+        expected = scores[np.argsort(scores)[::-1][:TOP_K]]
+        t_okapi += time.perf_counter() - start
+
+        start = time.perf_counter()
+        _, found = engine.top_k(query, TOP_K)
+        t_engine += time.perf_counter() - start
+
+        identical &= np.allclose(found, expected[:len(found)], rtol=1e-9, atol=1e-9)
+
+    print(f"{n_docs:>8} docs | okapi {t_okapi / n_queries * 1000:9.2f} ms/query"
+          f" | inverted {t_engine / n_queries * 1000:8.3f} ms/query | identical: {identical}")
+    return identical
+
+
+if __name__ == "__main__":
+    ok = True
+    for n_docs in (1000, 10000, 50000):
+        ok &= report(n_docs)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,81 @@
+"""
+Benchmark: coalesced query embeddings
+=====================================
+N threads each embed distinct single queries, either one embed call per query
+(direct) or through EmbedDispatcher, and report throughput and per-query
+latency per concurrency level.
+
+By default the embedder is simulated like one Ollama runner: calls are served
+one at a time and cost --call-ms plus --text-ms per text. --ollama sends the
+queries to the configured embedding model instead (run Ollama first).
+
+Usage:
+    python -m benchmarks.bench_embed_dispatch
+    python -m benchmarks.bench_embed_dispatch --ollama --concurrency 1 8 32 --window-ms 2 5
+"""
+
+import time
+import argparse
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from embed_dispatcher import EmbedDispatcher
+from config import QUERY_EMBED_WINDOW_MS, QUERY_EMBED_MAX_BATCH
+
+
+def simulated_embedder(call_ms, text_ms, dim=768):
+    runner = threading.Lock()  # one request at a time, like a single model runner
+
+    def embed(texts):
+        with runner:
+            time.sleep((call_ms + text_ms * len(texts)) / 1000)
+        return [np.zeros(dim, dtype=np.float32) for _ in texts]
+    return embed
+
+
+def run(embed_one, concurrency, queries_per_thread):
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(t):
+        for i in range(queries_per_thread):
+            start = time.perf_counter()
+            embed_one(f"question {t}-{i} about revenue")
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, np.percentile(latencies, 50), np.percentile(latencies, 95)
+
+
+if __name__ == "__main__":
+    cli = argparse.ArgumentParser()
+    cli.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    cli.add_argument("--queries", type=int, default=20, help="queries per thread")
+    cli.add_argument("--window-ms", type=float, nargs="+", default=[QUERY_EMBED_WINDOW_MS or 3])
+    cli.add_argument("--max-batch", type=int, default=QUERY_EMBED_MAX_BATCH)
+    cli.add_argument("--call-ms", type=float, default=15, help="simulated fixed cost per embed call")
+    cli.add_argument("--text-ms", type=float, default=0.5, help="simulated cost per text in a call")
+    cli.add_argument("--ollama", action="store_true", help="embed with the configured Ollama model")
+    args = cli.parse_args()
+
+    if args.ollama:
+        from index_test import _embed_call as embed_fn
+        source = "ollama"
+    else:
+        embed_fn = simulated_embedder(args.call_ms, args.text_ms)
+        source = f"simulated {args.call_ms} ms/call + {args.text_ms} ms/text"
+
+    print(f"\n=== query embeddings, {source}, {args.queries} queries per thread ===")
+    for concurrency in args.concurrency:
+        qps, p50, p95 = run(lambda text: embed_fn([text])[0], concurrency, args.queries)
+        print(f"{concurrency:4d} threads | direct          {qps:8.1f} q/s | p50 {p50:8.2f} ms | p95 {p95:8.2f} ms")
+        for window in args.window_ms:
+            dispatcher = EmbedDispatcher(embed_fn, window, args.max_batch)
+            qps, p50, p95 = run(dispatcher.embed, concurrency, args.queries)
+            print(f"{concurrency:4d} threads | window {window:4.1f} ms  {qps:8.1f} q/s | p50 {p50:8.2f} ms"
+                  f" | p95 {p95:8.2f} ms | avg batch {dispatcher.stats()['avg_batch']}")
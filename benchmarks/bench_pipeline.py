@@ -0,0 +1,408 @@
+"""
+Benchmark: end-to-end pipeline (offline)
+========================================
+Drives the real code paths against a deterministic fake of Ollama
+(benchmarks/fake_ollama.py) and synthetic data, so it runs without Ollama or
+documents and two runs on the same machine are comparable:
+
+    parse    SmartMultiColumnParser.parse_many over a generated two-column PDF
+    build    build_rag_index over N synthetic chunks (embed, vector index, BM25)
+    search   perform_hybrid_search, one query at a time; hit@5 checks the query's
+             source chunk comes back (a sanity check on the fake embeddings)
+    chat     POST /chat through the Flask test client, --concurrency at a time:
+             time to first token and total time per streamed answer
+
+Every corpus size runs in a fresh interpreter, so its peak RSS (ru_maxrss) is
+its own. Latencies are reported as p50/p95/p99 in ms; the whole report is JSON
+(--json). --compare checks a new run against a saved one and exits with status
+1 when a p95 latency, a throughput or the peak RSS got worse by more than
+--tolerance.
+
+The fake charges --embed-call-ms + --embed-text-ms per text for an embed call and
+--ttft-ms / --token-ms for a streamed answer, serving --parallel calls at once.
+Memory grows with N x --dim: 1M chunks at dim 256 need about 4 GB.
+
+Usage:
+    python -m benchmarks.bench_pipeline
+    python -m benchmarks.bench_pipeline --sizes 1000 10000 100000 1000000 --json pipeline.json
+    python -m benchmarks.bench_pipeline --sizes 10000 --stages build search --compare pipeline.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import contextlib
+import threading
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STAGES = ("parse", "build", "search", "chat")
+
+# (path in a result, True when higher is worse) checked by --compare
+WATCHED_PARSE = [
+    (("latency_ms", "p95"), True),
+    (("pages_per_s",), False),
+    (("peak_rss_mb",), True),
+]
+WATCHED_CORPUS = [
+    (("build", "chunks_per_s"), False),
+    (("search", "latency_ms", "p95"), True),
+    (("search", "qps"), False),
+    (("chat", "ttft_ms", "p95"), True),
+    (("chat", "total_ms", "p95"), True),
+    (("chat", "requests_per_s"), False),
+    (("peak_rss_mb",), True),
+]
+
+
+def summarize(latencies_ms):
+    values = np.asarray(latencies_ms, dtype=np.float64)
+    if not len(values):
+        return {}
+    return {
+        "p50": round(float(np.percentile(values, 50)), 3),
+        "p95": round(float(np.percentile(values, 95)), 3),
+        "p99": round(float(np.percentile(values, 99)), 3),
+        "mean": round(float(values.mean()), 3),
+        "max": round(float(values.max()), 3),
+    }
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    usage = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)  # parser processes
+    return round(usage / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+# --- SYNTHETIC DATA ---
+def vocabulary(size=20000, seed=0):
+    rng = np.random.default_rng(seed)
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+    words, seen = [], set()
+    while len(words) < size:
+        word = "".join(rng.choice(letters, rng.integers(4, 11)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+
+def synthetic_chunks(n, words_per_chunk=80, seed=0, block=50000):
+    """n chunks of Zipf-distributed words, tagged with a fake source file like parsed chunks are"""
+    vocab = np.array(vocabulary(seed=seed))
+    weights = 1.0 / np.arange(1, len(vocab) + 1) ** 1.1
+    weights /= weights.sum()
+    rng = np.random.default_rng(seed)
+    chunks = []
+    for start in range(0, n, block):
+        ids = rng.choice(len(vocab), size=(min(block, n - start), words_per_chunk), p=weights)
+        for offset, row in enumerate(vocab[ids].tolist()):
+            chunks.append(f"[synthetic_{(start + offset) // 50:05d}.pdf] " + " ".join(row))
+    return chunks
+
+
+def make_queries(chunks, n_queries, seed=1, n_words=6):
+    """(query, source chunk id): the rarest words of a random chunk"""
+    rank = {word: i for i, word in enumerate(vocabulary())}
+    rng = np.random.default_rng(seed)
+    queries = []
+    for idx in rng.choice(len(chunks), size=n_queries, replace=n_queries > len(chunks)):
+        words = set(chunks[idx].split("] ", 1)[1].split())
+        rare = sorted(words, key=lambda w: -rank[w])[:n_words]
+        queries.append(("what does the document say about " + " ".join(rare), int(idx)))
+    return queries
+
+
+def synthetic_pdf(path, pages, seed=0):
+    import fitz
+    vocab = vocabulary(2000, seed)
+    rng = np.random.default_rng(seed)
+    doc = fitz.open()
+    for p in range(pages):
+        page = doc.new_page()
+        page.insert_text((50, 40), f"Synthetic report, page {p + 1}", fontsize=12)
+        for left in (50, 310):  # two columns
+            text = " ".join(vocab[i] for i in rng.integers(0, len(vocab), 450))
+            page.insert_textbox(fitz.Rect(left, 60, left + 240, 800), text, fontsize=9)
+    doc.save(path)
+    doc.close()
+
+
+# --- STAGES (run inside a child interpreter) ---
+def run_parse(args):
+    from multi_parser_test import SmartMultiColumnParser
+    workdir = tempfile.mkdtemp(prefix="bench_parse_")
+    try:
+        pdf_path = os.path.join(workdir, "synthetic.pdf")
+        synthetic_pdf(pdf_path, args.pages)
+        parser = SmartMultiColumnParser()
+        latencies, n_chunks = [], 0
+        for _ in range(args.parse_runs):
+            start = time.perf_counter()
+            n_chunks = len(parser.parse_many([pdf_path], verbose=False)[pdf_path])
+            latencies.append((time.perf_counter() - start) * 1000)
+        total_s = sum(latencies) / 1000
+        return {
+            "pages": args.pages,
+            "runs": args.parse_runs,
+            "chunks": n_chunks,
+            "latency_ms": summarize(latencies),
+            "pages_per_s": round(args.pages * args.parse_runs / total_s, 1),
+            "chunks_per_s": round(n_chunks * args.parse_runs / total_s, 1),
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_corpus(args, fake):
+    import logging
+    import index_store
+    import embed_cache
+    # Nothing from the real cache folders: no restored knowledge base, no cached embeddings
+    index_store.load_index = lambda *a, **kw: (None, None, {})
+    workdir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    embed_cache._cache = embed_cache.EmbeddingCache(cache_dir=workdir)
+
+    import app_test
+    from index_test import build_rag_index, query_embedding_cache
+    logging.getLogger("rag").setLevel(logging.WARNING)
+    app_test.warmup.start().wait("reranker")
+    if args.no_rerank:
+        from reranker import CascadeReranker
+        app_test.state.reranker = CascadeReranker(fast_model="")
+        app_test.state.reranker.rankers = {app_test.state.reranker.model: None}  # fused order decides
+
+    result = {"chunks": args.size, "reranker": app_test.state.reranker.loaded()}
+    try:
+        start = time.perf_counter()
+        chunks = synthetic_chunks(args.size, args.chunk_words)
+        result["generate_s"] = round(time.perf_counter() - start, 3)
+        result["rss_before_index_mb"] = peak_rss_mb()
+
+        # Search and chat need the index, so it is always built (and timed)
+        start = time.perf_counter()
+        vector_index, bm25_index, chunk_map = build_rag_index(chunks)
+        elapsed = time.perf_counter() - start
+        result["build"] = {
+            "seconds": round(elapsed, 3),
+            "chunks_per_s": round(len(chunk_map) / elapsed, 1),
+            "embed_calls": fake.stats()["embed_calls"],
+        }
+        app_test.state.snapshot = app_test.IndexSnapshot(vector_index, bm25_index, chunk_map,
+                                                         app_test.state.snapshot.version + 1)
+        app_test.state.all_chunks = chunks
+
+        if "search" in args.stages:
+            latencies, hits = [], 0
+            for query, source in make_queries(chunks, args.queries, seed=1):
+                start = time.perf_counter()
+                results = app_test.perform_hybrid_search(query, k=60)
+                latencies.append((time.perf_counter() - start) * 1000)
+                hits += source in [idx for idx, _ in results]
+            result["search"] = {
+                "queries": len(latencies),
+                "latency_ms": summarize(latencies),
+                "qps": round(len(latencies) / (sum(latencies) / 1000), 1),
+                "hit_at_5": round(hits / len(latencies), 3),
+            }
+
+        if "chat" in args.stages:
+            query_embedding_cache.clear()
+            result["chat"] = run_chat(app_test.app, make_queries(chunks, args.chat_requests, seed=2),
+                                      args.concurrency)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+def run_chat(app, queries, concurrency):
+    ttft, totals, tokens, errors = [], [], [0], [0]
+    lock = threading.Lock()
+    pending = iter(queries)
+
+    def worker():
+        client = app.test_client()
+        while True:
+            with lock:
+                item = next(pending, None)
+            if item is None:
+                return
+            start = time.perf_counter()
+            response = client.post("/chat", json={"message": item[0]}, buffered=False)
+            first, count = None, 0
+            for line in response.response:
+                if b'"type": "token"' in (line if isinstance(line, bytes) else line.encode()):
+                    first = first or time.perf_counter()
+                    count += 1
+            response.close()
+            done = time.perf_counter()
+            with lock:
+                if response.status_code != 200 or first is None:
+                    errors[0] += 1
+                    continue
+                ttft.append((first - start) * 1000)
+                totals.append((done - start) * 1000)
+                tokens[0] += count
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+    return {
+        "requests": len(queries),
+        "concurrency": concurrency,
+        "errors": errors[0],
+        "ttft_ms": summarize(ttft),
+        "total_ms": summarize(totals),
+        "requests_per_s": round(len(totals) / wall, 2),
+        "tokens_per_s": round(tokens[0] / wall, 1),
+    }
+
+
+def child(args):
+    from benchmarks.fake_ollama import FakeOllama
+    fake = FakeOllama(args.dim, args.embed_call_ms, args.embed_text_ms, args.ttft_ms, args.token_ms,
+                      args.answer_tokens, args.parallel).install()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):  # per-batch progress prints
+        result = run_parse(args) if args.child == "parse" else run_corpus(args, fake)
+    result["peak_rss_mb"] = peak_rss_mb()
+    result["fake_ollama"] = fake.stats()
+    print("RESULT " + json.dumps(result))
+
+
+# --- DRIVER ---
+def spawn(args, stage, size=None):
+    cmd = [sys.executable, "-m", "benchmarks.bench_pipeline", "--child", stage] + forwarded(args)
+    if size is not None:
+        cmd += ["--size", str(size)]
+    out = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True)
+    line = next((l for l in out.stdout.splitlines() if l.startswith("RESULT ")), None)
+    if out.returncode != 0 or line is None:
+        raise RuntimeError(f"{stage} run failed (exit {out.returncode}):\n{out.stderr[-2000:]}")
+    return json.loads(line[len("RESULT "):])
+
+
+def forwarded(args):
+    flags = ["--stages", *args.stages]
+    for name in ("chunk_words", "queries", "chat_requests", "concurrency", "pages", "parse_runs", "dim",
+                 "embed_call_ms", "embed_text_ms", "ttft_ms", "token_ms", "answer_tokens", "parallel"):
+        flags += ["--" + name.replace("_", "-"), str(getattr(args, name))]
+    return flags + (["--no-rerank"] if args.no_rerank else [])
+
+
+def lookup(result, path):
+    for key in path:
+        if not isinstance(result, dict) or key not in result:
+            return None
+        result = result[key]
+    return result
+
+
+def compare(report, baseline, tolerance):
+    """[(where, metric, baseline, now)] for every watched number that got worse by more than tolerance"""
+    pairs = []
+    if "parse" in report and "parse" in baseline:
+        pairs.append(("parse", report["parse"], baseline["parse"], WATCHED_PARSE))
+    old = {c["chunks"]: c for c in baseline.get("corpora", [])}
+    pairs += [(f"{c['chunks']} chunks", c, old[c["chunks"]], WATCHED_CORPUS)
+              for c in report.get("corpora", []) if c["chunks"] in old]
+
+    regressions = []
+    for where, now, before, watched in pairs:
+        for path, higher_is_worse in watched:
+            a, b = lookup(before, path), lookup(now, path)
+            if not a or b is None:
+                continue
+            worse = b > a * (1 + tolerance) if higher_is_worse else b < a * (1 - tolerance)
+            if worse:
+                regressions.append((where, ".".join(path), a, b))
+    return regressions
+
+
+def print_report(report):
+    if "parse" in report:
+        p = report["parse"]
+        print(f"\nparse  {p['pages']} pages -> {p['chunks']} chunks | p50 {p['latency_ms']['p50']:9.1f} ms"
+              f" | {p['pages_per_s']:8.1f} pages/s | peak RSS {p['peak_rss_mb']} MB")
+    for c in report["corpora"]:
+        print(f"\n=== {c['chunks']} chunks (peak RSS {c['peak_rss_mb']} MB) ===")
+        if "build" in c:
+            print(f"build  {c['build']['seconds']:9.2f} s | {c['build']['chunks_per_s']:10.1f} chunks/s")
+        if "search" in c:
+            s = c["search"]
+            print(f"search p50 {s['latency_ms']['p50']:8.2f} ms | p95 {s['latency_ms']['p95']:8.2f} ms"
+                  f" | p99 {s['latency_ms']['p99']:8.2f} ms | {s['qps']:8.1f} q/s | hit@5 {s['hit_at_5']:.2f}")
+        if "chat" in c:
+            h = c["chat"]
+            print(f"chat   ttft p50 {h['ttft_ms'].get('p50', 0):8.1f} ms | p95 {h['ttft_ms'].get('p95', 0):8.1f} ms"
+                  f" | total p95 {h['total_ms'].get('p95', 0):8.1f} ms | {h['requests_per_s']:6.2f} req/s"
+                  f" | {h['errors']} errors")
+
+
+if __name__ == "__main__":
+    cli = argparse.ArgumentParser()
+    cli.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="corpus sizes in chunks")
+    cli.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    cli.add_argument("--chunk-words", type=int, default=80)
+    cli.add_argument("--queries", type=int, default=200, help="search queries per corpus")
+    cli.add_argument("--chat-requests", type=int, default=40, help="/chat requests per corpus")
+    cli.add_argument("--concurrency", type=int, default=4, help="/chat requests in flight")
+    cli.add_argument("--no-rerank", action="store_true", help="skip the cross-encoders (fused order decides)")
+    cli.add_argument("--pages", type=int, default=40, help="pages of the synthetic PDF")
+    cli.add_argument("--parse-runs", type=int, default=3)
+    cli.add_argument("--dim", type=int, default=256, help="fake embedding size")
+    cli.add_argument("--embed-call-ms", type=float, default=2.0)
+    cli.add_argument("--embed-text-ms", type=float, default=0.02)
+    cli.add_argument("--ttft-ms", type=float, default=50.0)
+    cli.add_argument("--token-ms", type=float, default=5.0)
+    cli.add_argument("--answer-tokens", type=int, default=32)
+    cli.add_argument("--parallel", type=int, default=1, help="calls the fake serves at once (OLLAMA_NUM_PARALLEL)")
+    cli.add_argument("--json", help="write the report here")
+    cli.add_argument("--compare", help="a previous --json report; exit 1 on regressions")
+    cli.add_argument("--tolerance", type=float, default=0.25, help="allowed relative change for --compare")
+    cli.add_argument("--child", choices=["parse", "corpus"], help=argparse.SUPPRESS)
+    cli.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    args = cli.parse_args()
+
+    if args.child:
+        child(args)
+        sys.exit(0)
+
+    report = {
+        "benchmark": "pipeline",
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpus": os.cpu_count()},
+        "config": {k: v for k, v in vars(args).items() if k not in ("json", "compare", "child", "size")},
+        "corpora": [],
+    }
+    if "parse" in args.stages:
+        report["parse"] = spawn(args, "parse")
+    if set(args.stages) - {"parse"}:
+        for size in args.sizes:
+            report["corpora"].append(spawn(args, "corpus", size))
+    print_report(report)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for where, metric, before, now in regressions:
+            print(f"❌ {where}: {metric} {before} -> {now}")
+        if regressions:
+            sys.exit(1)
+        print(f"✓ No regressions beyond {args.tolerance:.0%} against {args.compare}")
@@ -0,0 +1,105 @@
+"""
+Benchmark: cascade reranking
+============================
+Reranks BM25 candidates for the ground_truth.json questions with:
+
+    full       MiniLM-L-12 on every candidate (what /chat did before the cascade)
+    cascade    TinyBERT-L-2 prune -> MiniLM-L-12 on the survivors, early exit on
+    cached     the cascade again on the same questions (score cache warm)
+
+and reports per setting p50 / p95 rerank latency, pairs sent to the models,
+overlap@k with the full rerank, keyword hit and context recall (see
+benchmarks/eval_dim_reduction.py). BM25 scores stand in for the fused scores,
+so no Ollama is needed; only the persisted knowledge base (or --pdfs).
+
+Usage:
+    python -m benchmarks.bench_rerank
+    python -m benchmarks.bench_rerank --candidates 30 --prune-keep 10 --gap 0
+"""
+
+import re
+import json
+import argparse
+import numpy as np
+
+from bm25_engine import BM25Index
+from reranker import CascadeReranker
+from config import (RERANK_MODEL, RERANK_FAST_MODEL, RERANK_MODEL_DIR, RERANK_CANDIDATES, RERANK_PRUNE_KEEP,
+                    RERANK_EARLY_EXIT_GAP)
+from benchmarks.eval_dim_reduction import tokens, load_knowledge_base, parse_pdfs
+
+
+def candidates(bm25, chunks, question, n):
+    ids, scores = bm25.top_k(re.findall(r'\w+', question.lower()), n)
+    return [{"id": int(i), "text": chunks[i]} for i in ids], [float(s) for s in scores]
+
+
+def run(label, reranker, questions, pools, k, reference):
+    latencies, pairs, exits, found = [], [], 0, []
+    for item, (passages, fused) in zip(questions, pools):
+        results, info = reranker.rerank(item["question"], passages, fused, top_k=k)
+        latencies.append(info["prune_ms"] + info["rescore_ms"])
+        pairs.append(sum(info["scored"].values()))
+        exits += info["early_exit"]
+        found.append(results)
+
+    keyword_hits, context_recall, overlap = [], [], []
+    for item, results, ref in zip(questions, found, reference if reference is not None else found):
+        text = " ".join(r["text"] for r in results).lower()
+        keywords = item.get("expected_context_keywords", [])
+        keyword_hits.append(np.mean([kw.lower() in text for kw in keywords]) if keywords else 1.0)
+        truth = tokens(item["ground_truth"])
+        context_recall.append(len(truth & tokens(text)) / max(1, len(truth)))
+        ref_ids = {r["id"] for r in ref}
+        overlap.append(len({r["id"] for r in results} & ref_ids) / max(1, len(ref_ids)))
+
+    row = {
+        "setting": label,
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "pairs_per_query": round(float(np.mean(pairs)), 2),
+        "early_exits": exits,
+        f"overlap@{k}": round(float(np.mean(overlap)), 3),
+        "keyword_hit": round(float(np.mean(keyword_hits)), 3),
+        "context_recall": round(float(np.mean(context_recall)), 3),
+        "models": reranker.loaded(),
+    }
+    print(f"{label:<10} p50 {row['p50_ms']:8.2f} ms | p95 {row['p95_ms']:8.2f} ms | pairs {row['pairs_per_query']:5.1f}"
+          f" | early exits {row['early_exits']:3d} | overlap@{k} {row[f'overlap@{k}']:.3f}"
+          f" | keyword hit {row['keyword_hit']:.3f} | context recall {row['context_recall']:.3f}")
+    return row, found
+
+
+if __name__ == "__main__":
+    cli = argparse.ArgumentParser()
+    cli.add_argument("--ground-truth", default="ground_truth.json")
+    cli.add_argument("--pdfs", nargs="*", help="parse these instead of using the persisted knowledge base")
+    cli.add_argument("--candidates", type=int, default=RERANK_CANDIDATES)
+    cli.add_argument("--prune-keep", type=int, default=RERANK_PRUNE_KEEP)
+    cli.add_argument("--gap", type=float, default=RERANK_EARLY_EXIT_GAP)
+    cli.add_argument("--k", type=int, default=5)
+    cli.add_argument("--json", help="also write the results table here")
+    args = cli.parse_args()
+
+    with open(args.ground_truth, 'r', encoding='utf-8') as f:
+        questions = json.load(f)["test_questions"]
+    chunks = parse_pdfs(args.pdfs) if args.pdfs else load_knowledge_base()
+    bm25 = BM25Index.from_tokenized([re.findall(r'\w+', c.lower()) for c in chunks])
+    pools = [candidates(bm25, chunks, item["question"], args.candidates) for item in questions]
+    print(f"\n=== {len(chunks)} chunks, {len(questions)} questions, {args.candidates} candidates,"
+          f" prune to {args.prune_keep}, gap {args.gap}, k={args.k} ===")
+
+    full = CascadeReranker(RERANK_MODEL, "", early_exit_gap=0, cache_size=0)
+    cascade = CascadeReranker(RERANK_MODEL, RERANK_FAST_MODEL, RERANK_MODEL_DIR, args.prune_keep, args.gap)
+    full.warm_up()
+    cascade.warm_up()  # model load time stays out of the latencies
+
+    rows = []
+    row, reference = run("full", full, questions, pools, args.k, None)
+    rows.append(row)
+    rows.append(run("cascade", cascade, questions, pools, args.k, reference)[0])
+    rows.append(run("cached", cascade, questions, pools, args.k, reference)[0])
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, indent=2)
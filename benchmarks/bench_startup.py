@@ -0,0 +1,96 @@
+"""
+Benchmark: cold start
+=====================
+Imports the web app in fresh interpreters and reports:
+
+    import ms        wall time of `import app_test` (what a restarted pod waits before serving)
+    ready ms         until the warm-up thread (started right after the import, as the
+                     entry points do) has loaded every required component
+    slowest modules  cumulative self+children time from `python -X importtime`
+
+--max-import-ms makes it exit with status 1 when the median import is slower,
+so it can guard against someone adding a heavy top-level import again.
+
+Usage:
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --runs 5 --max-import-ms 400 --json startup.json
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import time, json
+start = time.perf_counter()
+import app_test
+imported = time.perf_counter()
+app_test.warmup.start()
+while not app_test.warmup.is_ready() and any(
+        c["status"] in ("pending", "loading") for c in app_test.warmup.report()["components"].values()):
+    time.sleep(0.01)
+done = time.perf_counter()
+print("PROBE " + json.dumps({"import_ms": (imported - start) * 1000, "ready_ms": (done - start) * 1000,
+                             "components": app_test.warmup.report()["components"]}))
+"""
+
+
+def probe():
+    out = subprocess.run([sys.executable, "-c", PROBE], cwd=ROOT, capture_output=True, text=True, check=True)
+    line = next(l for l in out.stdout.splitlines() if l.startswith("PROBE "))
+    return json.loads(line[len("PROBE "):])
+
+
+def slowest_imports(n):
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app_test"], cwd=ROOT,
+                         capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative) / 1000, name.rstrip()))
+    # app_test and its direct imports (the indentation is the nesting depth)
+    top = [(ms, name.strip()) for ms, name in rows if len(name) - len(name.lstrip()) <= 3]
+    return sorted(top, reverse=True)[:n]
+
+
+if __name__ == "__main__":
+    cli = argparse.ArgumentParser()
+    cli.add_argument("--runs", type=int, default=3)
+    cli.add_argument("--top", type=int, default=10)
+    cli.add_argument("--max-import-ms", type=float, default=0, help="fail when the median import is slower")
+    cli.add_argument("--json", help="also write the results here")
+    args = cli.parse_args()
+
+    runs = [probe() for _ in range(args.runs)]
+    import_ms = [r["import_ms"] for r in runs]
+    ready_ms = [r["ready_ms"] for r in runs]
+    print(f"\n=== app_test cold start, {args.runs} runs ===")
+    print(f"import  p50 {np.percentile(import_ms, 50):8.1f} ms | max {max(import_ms):8.1f} ms")
+    print(f"ready   p50 {np.percentile(ready_ms, 50):8.1f} ms | max {max(ready_ms):8.1f} ms")
+    for name, c in runs[-1]["components"].items():
+        print(f"  {name:<16} {c['status']:<8} {c['seconds'] or 0:7.3f} s{'' if c['required'] else '  (optional)'}")
+
+    top = slowest_imports(args.top)
+    print("\nSlowest imports (app_test and what it imports directly):")
+    for ms, name in top:
+        print(f"  {ms:8.1f} ms  {name}")
+
+    result = {
+        "import_ms_p50": round(float(np.percentile(import_ms, 50)), 1),
+        "ready_ms_p50": round(float(np.percentile(ready_ms, 50)), 1),
+        "components": runs[-1]["components"],
+        "slowest_imports": [{"module": name, "ms": round(ms, 1)} for ms, name in top],
+    }
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+    if args.max_import_ms and result["import_ms_p50"] > args.max_import_ms:
+        print(f"❌ Import took {result['import_ms_p50']} ms, budget is {args.max_import_ms} ms")
+        sys.exit(1)
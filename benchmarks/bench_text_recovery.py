@@ -0,0 +1,91 @@
+"""
+Micro-benchmark: lost-text recovery
+===================================
+Compares the per-block substring scan (O(blocks x page)) against the shingle
+index (O(page log page + blocks)) used by SmartMultiColumnParser, on synthetic
+pages of growing density and, optionally, on real PDFs. Every run also checks
+that both strategies recover exactly the same blocks.
+
+Usage:
+    python -m benchmarks.bench_text_recovery
+    python -m benchmarks.bench_text_recovery "input_files/q4fy22-presentation.pdf"
+"""
+
+import sys
+import time
+import random
+import string
+import fitz
+
+from multi_parser_test import SmartMultiColumnParser, SubstringIndex, _extract_page_range, _merge_markdown
+
+
+def _words(rng, n):
+    return [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 9))) for _ in range(n)]
+
+
+def synthetic_page(n_blocks, words_per_block=12, missing_ratio=0.1, seed=0):
+    """A page whose markdown contains ~90% of its raw blocks (like a dense slide)"""
+    rng = random.Random(seed)
+    blocks = [' '.join(_words(rng, words_per_block)) for _ in range(n_blocks)]
+    kept = [b for b in blocks if rng.random() > missing_ratio]
+    return '\n\n'.join(kept), blocks
+
+
+def time_scan(parser, smart_text, blocks):
+    start = time.perf_counter()
+    norm = parser._normalize(smart_text)
+    found = [b.strip() for b in blocks if len(b.strip()) >= 3 and parser._normalize(b.strip()) not in norm]
+    return time.perf_counter() - start, found
+
+
+def time_index(parser, smart_text, blocks):
+    start = time.perf_counter()
+    candidates = [b.strip() for b in blocks if len(b.strip()) >= 3]
+    present = SubstringIndex(parser._normalize(smart_text)).contains_all([parser._normalize(b) for b in candidates])
+    found = [b for b, p in zip(candidates, present) if not p]
+    return time.perf_counter() - start, found
+
+
+def time_adaptive(parser, smart_text, blocks):
+    start = time.perf_counter()
+    found = parser._recover_lost_text(smart_text, blocks)
+    return time.perf_counter() - start, found
+
+
+def report(label, pages):
+    parser = SmartMultiColumnParser(workers=1)
+    totals = {"scan": 0.0, "index": 0.0, "adaptive": 0.0}
+    identical = True
+    for smart_text, blocks in pages:
+        t_scan, a = time_scan(parser, smart_text, blocks)
+        t_index, b = time_index(parser, smart_text, blocks)
+        t_adaptive, c = time_adaptive(parser, smart_text, blocks)
+        identical &= (a == b == c)
+        totals["scan"] += t_scan
+        totals["index"] += t_index
+        totals["adaptive"] += t_adaptive
+    print(f"{label:<40} scan {totals['scan'] * 1000:9.2f} ms | index {totals['index'] * 1000:9.2f} ms"
+          f" | adaptive {totals['adaptive'] * 1000:9.2f} ms | identical: {identical}")
+    return identical
+
+
+def pdf_pages(pdf_path):
+    with fitz.open(pdf_path) as doc:
+        pages = list(range(doc.page_count))
+    md_part, raw_blocks = _extract_page_range(pdf_path, pages)
+    md_texts = _merge_markdown([md_part])
+    return [(md_texts[i], raw_blocks[i]) for i in pages]
+
+
+if __name__ == "__main__":
+    ok = True
+    print("=== Synthetic pages ===")
+    for n_blocks in (20, 100, 500, 2000, 5000, 20000):
+        ok &= report(f"{n_blocks} blocks/page", [synthetic_page(n_blocks, seed=s) for s in range(3)])
+
+    for pdf_path in sys.argv[1:]:
+        print(f"\n=== {pdf_path} ===")
+        ok &= report("all pages", pdf_pages(pdf_path))
+
+    sys.exit(0 if ok else 1)
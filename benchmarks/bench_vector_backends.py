@@ -0,0 +1,93 @@
+"""
+Benchmark: vector index backends
+================================
+Builds every backend from vector_store.py on the same corpus and reports build
+time, single-query latency (what /chat does) and recall@k against the exact flat
+index. Search knobs (hnsw_ef_search, ivf_nprobe, ...) come from settings.json,
+so this is also the way to tune them.
+
+The corpus is synthetic and clustered like sentence embeddings, or real vectors
+from an .npy / the embedding cache's vectors.f32 (--vectors).
+
+Usage:
+    python -m benchmarks.bench_vector_backends
+    python -m benchmarks.bench_vector_backends --sizes 10000 200000 --k 25
+    python -m benchmarks.bench_vector_backends --vectors cache/embeddings/nomic-embed-text/vectors.f32 --dim 768
+"""
+
+import time
+import argparse
+import numpy as np
+
+from vector_store import BACKENDS, UsearchIndex, create_vector_index
+
+
+def synthetic_vectors(n, dim=768, n_clusters=200, seed=0):
+    """Gaussian blobs around random centres: closer to real embeddings than uniform noise"""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, n_clusters, size=n)
+    return centres[labels] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+
+
+def load_vectors(path, dim):
+    if path.endswith(".npy"):
+        return np.load(path).astype(np.float32)
+    return np.fromfile(path, dtype=np.float32).reshape(-1, dim)
+
+
+def make_queries(corpus, n_queries, seed=1):
+    """Perturbed corpus rows, so every query has true near neighbours"""
+    rng = np.random.default_rng(seed)
+    picks = corpus[rng.integers(0, len(corpus), size=n_queries)]
+    return picks + 0.3 * rng.standard_normal(picks.shape).astype(np.float32)
+
+
+def run_backend(backend, corpus, queries, k):
+    start = time.perf_counter()
+    index = create_vector_index(corpus.shape[1], backend)
+    index.add(corpus)
+    build = time.perf_counter() - start
+
+    latencies, results = [], []
+    for q in queries:
+        start = time.perf_counter()
+        _, ids = index.search(q.reshape(1, -1), k)
+        latencies.append(time.perf_counter() - start)
+        results.append(ids[0])
+    return build, np.array(latencies) * 1000, np.array(results)
+
+
+def recall_at_k(found, exact):
+    hits = [len(set(f[f >= 0]) & set(e[e >= 0])) / max(1, (e >= 0).sum()) for f, e in zip(found, exact)]
+    return float(np.mean(hits))
+
+
+def report(corpus, queries, k, backends):
+    print(f"\n=== {len(corpus)} vectors x {corpus.shape[1]} dims, {len(queries)} queries, k={k} ===")
+    exact = None
+    for backend in backends:
+        build, latency, found = run_backend(backend, corpus, queries, k)
+        if exact is None:
+            exact = found  # "flat" always runs first
+        print(f"{backend:<8} build {build:8.2f} s | p50 {np.percentile(latency, 50):7.3f} ms"
+              f" | p95 {np.percentile(latency, 95):7.3f} ms | recall@{k} {recall_at_k(found, exact):.3f}")
+
+
+if __name__ == "__main__":
+    cli = argparse.ArgumentParser()
+    cli.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000])
+    cli.add_argument("--dim", type=int, default=768)
+    cli.add_argument("--queries", type=int, default=200)
+    cli.add_argument("--k", type=int, default=25)
+    cli.add_argument("--vectors", help=".npy or raw float32 file with real embeddings")
+    args = cli.parse_args()
+
+    backends = [b for b in BACKENDS if b != "usearch" or UsearchIndex is not None]
+    if args.vectors:
+        corpus = load_vectors(args.vectors, args.dim)
+        report(corpus, make_queries(corpus, args.queries), args.k, backends)
+    else:
+        for n in args.sizes:
+            corpus = synthetic_vectors(n, args.dim)
+            report(corpus, make_queries(corpus, args.queries), args.k, backends)
@@ -0,0 +1,68 @@
+"""
+Benchmark: compressed vector storage
+====================================
+For one backend, builds the index with every vector_storage mode (float32, fp16,
+sq8, pq), with and without exact re-scoring for the lossy ones, and reports RAM
+per chunk, single-query latency and recall@k against exact float32 search.
+
+RAM per chunk counts the codes plus the graph / inverted lists. The float32 rows
+used for re-scoring are memory-mapped from disk and are reported separately.
+
+Usage:
+    python -m benchmarks.bench_vector_storage
+    python -m benchmarks.bench_vector_storage --backend hnsw --sizes 20000 100000
+"""
+
+import time
+import argparse
+import numpy as np
+
+from vector_store import BACKENDS, STORAGES, LOSSY_STORAGES, create_vector_index
+from config import RESCORE_FACTOR, VECTOR_TRAIN_MIN
+from benchmarks.bench_vector_backends import synthetic_vectors, load_vectors, make_queries, recall_at_k, run_backend
+
+
+def run_storage(backend, storage, rescore_factor, corpus, queries, k):
+    index = create_vector_index(corpus.shape[1], backend, storage, rescore_factor)
+    index.add(corpus)
+    latencies, results = [], []
+    for q in queries:
+        start = time.perf_counter()
+        _, ids = index.search(q.reshape(1, -1), k)
+        latencies.append(time.perf_counter() - start)
+        results.append(ids[0])
+    exact_bytes = 4 * corpus.shape[1] if index.exact is not None else 0
+    return index.bytes_per_vector(), exact_bytes, np.array(latencies) * 1000, np.array(results)
+
+
+def report(backend, corpus, queries, k, rescore_factor):
+    print(f"\n=== {backend}: {len(corpus)} vectors x {corpus.shape[1]} dims, {len(queries)} queries, k={k} ===")
+    _, _, exact = run_backend("flat", corpus, queries, k)
+    for storage in STORAGES:
+        if backend == "usearch" and storage == "pq":
+            continue
+        for factor in ((0, rescore_factor) if storage in LOSSY_STORAGES and rescore_factor else (0,)):
+            ram, disk, latency, found = run_storage(backend, storage, factor, corpus, queries, k)
+            label = f"{storage} + rescore x{factor}" if factor else storage
+            print(f"{label:<20} RAM {ram:8.1f} B/chunk | exact on disk {disk:5d} B/chunk"
+                  f" | p50 {np.percentile(latency, 50):7.3f} ms | recall@{k} {recall_at_k(found, exact):.3f}")
+
+
+if __name__ == "__main__":
+    cli = argparse.ArgumentParser()
+    cli.add_argument("--backend", choices=BACKENDS, default="flat")
+    cli.add_argument("--sizes", type=int, nargs="+", default=[max(20000, VECTOR_TRAIN_MIN)])
+    cli.add_argument("--dim", type=int, default=768)
+    cli.add_argument("--queries", type=int, default=200)
+    cli.add_argument("--k", type=int, default=25)
+    cli.add_argument("--rescore-factor", type=int, default=RESCORE_FACTOR or 4)
+    cli.add_argument("--vectors", help=".npy or raw float32 file with real embeddings")
+    args = cli.parse_args()
+
+    if args.vectors:
+        corpus = load_vectors(args.vectors, args.dim)
+        report(args.backend, corpus, make_queries(corpus, args.queries), args.k, args.rescore_factor)
+    else:
+        for n in args.sizes:
+            corpus = synthetic_vectors(n, args.dim)
+            report(args.backend, corpus, make_queries(corpus, args.queries), args.k, args.rescore_factor)
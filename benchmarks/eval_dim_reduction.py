@@ -0,0 +1,126 @@
+"""
+Evaluation: embedding dimensionality reduction
+==============================================
+Retrieves the ground_truth.json questions from the same corpus at full width and
+with Matryoshka truncation / PCA at each target width, and reports per setting:
+
+    bytes/chunk       RAM held by the vector index per chunk
+    p50 / p95         single-query vector search latency
+    recall@k          overlap with the full-width top-k (how much the projection moves results)
+    keyword hit       share of expected_context_keywords found in the top-k chunks
+    context recall    share of ground-truth answer tokens found in the top-k chunks
+
+The corpus is the persisted knowledge base (INDEX_CACHE/chunks.jsonl) or, with
+--pdfs, freshly parsed documents. Vectors come from the embedding cache and
+Ollama, so run it with Ollama up; a second run is served from the cache.
+
+Usage:
+    python -m benchmarks.eval_dim_reduction
+    python -m benchmarks.eval_dim_reduction --pdfs input_files/*.pdf --dims 256 128 64
+"""
+
+import os
+import re
+import json
+import time
+import argparse
+import numpy as np
+
+from config import INDEX_CACHE, VECTOR_BACKEND, VECTOR_STORAGE
+from index_test import embed_chunks, _embed_call
+from vector_store import create_vector_index
+
+STOP_WORDS = {'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'is', 'are', 'was', 'were'}
+
+
+def tokens(text):
+    return {t for t in re.findall(r'\b\w+\b', text.lower()) if t not in STOP_WORDS}
+
+
+def load_knowledge_base(cache_dir=INDEX_CACHE):
+    with open(os.path.join(cache_dir, "chunks.jsonl"), 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def parse_pdfs(pdf_paths):
+    from multi_parser_test import SmartMultiColumnParser
+    parser = SmartMultiColumnParser(chunk_size=1000, chunk_overlap=400)
+    chunks = []
+    for path, doc_chunks in parser.parse_many(pdf_paths).items():
+        name = os.path.basename(path).replace(".pdf", "").replace("_", " ")
+        chunks.extend(f"[{name}] [Page {c.page_num} | {c.chunk_type}]\n{c.content}" for c in doc_chunks)
+    return chunks
+
+
+def evaluate(label, corpus_vectors, chunks, questions, query_vectors, k, reference, **layout):
+    index = create_vector_index(corpus_vectors.shape[1], **layout)
+    index.add(corpus_vectors)
+    if hasattr(index, "fit"):
+        index.fit()  # small corpora: fit the PCA now rather than after VECTOR_TRAIN_MIN chunks
+
+    latencies, found = [], []
+    for q in query_vectors:
+        start = time.perf_counter()
+        _, ids = index.search(q.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found.append(ids[0][ids[0] >= 0])
+
+    keyword_hits, context_recall, overlap = [], [], []
+    for item, ids, ref in zip(questions, found, reference if reference is not None else found):
+        text = " ".join(chunks[i] for i in ids).lower()
+        keywords = item.get("expected_context_keywords", [])
+        keyword_hits.append(np.mean([kw.lower() in text for kw in keywords]) if keywords else 1.0)
+        truth = tokens(item["ground_truth"])
+        context_recall.append(len(truth & tokens(text)) / max(1, len(truth)))
+        overlap.append(len(set(ids) & set(ref)) / max(1, len(ref)))
+
+    row = {
+        "setting": label,
+        "bytes_per_chunk": round(index.bytes_per_vector(), 1),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        f"recall@{k}": round(float(np.mean(overlap)), 3),
+        "keyword_hit": round(float(np.mean(keyword_hits)), 3),
+        "context_recall": round(float(np.mean(context_recall)), 3),
+    }
+    print(f"{label:<16} {row['bytes_per_chunk']:9.1f} B/chunk | p50 {row['p50_ms']:7.3f} ms | p95 {row['p95_ms']:7.3f} ms"
+          f" | recall@{k} {row[f'recall@{k}']:.3f} | keyword hit {row['keyword_hit']:.3f} | context recall {row['context_recall']:.3f}")
+    return row, found
+
+
+if __name__ == "__main__":
+    cli = argparse.ArgumentParser()
+    cli.add_argument("--ground-truth", default="ground_truth.json")
+    cli.add_argument("--pdfs", nargs="*", help="parse these instead of using the persisted knowledge base")
+    cli.add_argument("--dims", type=int, nargs="+", default=[256, 128])
+    cli.add_argument("--methods", nargs="+", default=["matryoshka", "pca"])
+    cli.add_argument("--backend", default=VECTOR_BACKEND)
+    cli.add_argument("--storage", default=VECTOR_STORAGE)
+    cli.add_argument("--k", type=int, default=5)
+    cli.add_argument("--json", help="also write the results table here")
+    args = cli.parse_args()
+
+    with open(args.ground_truth, 'r', encoding='utf-8') as f:
+        questions = json.load(f)["test_questions"]
+
+    chunks = parse_pdfs(args.pdfs) if args.pdfs else load_knowledge_base()
+    vectors, chunks = embed_chunks(chunks)
+    corpus_vectors = np.asarray(vectors, dtype=np.float32)
+    query_vectors = np.asarray(_embed_call([item["question"] for item in questions]), dtype=np.float32)
+    print(f"\n=== {len(chunks)} chunks x {corpus_vectors.shape[1]} dims, {len(questions)} questions,"
+          f" {args.backend}/{args.storage}, k={args.k} ===")
+
+    layout = {"backend": args.backend, "storage": args.storage}
+    rows = []
+    row, reference = evaluate("full", corpus_vectors, chunks, questions, query_vectors, args.k, None,
+                              reduction="none", **layout)
+    rows.append(row)
+    for method in args.methods:
+        for dim in args.dims:
+            row, _ = evaluate(f"{method}-{dim}", corpus_vectors, chunks, questions, query_vectors, args.k, reference,
+                              reduction=method, reduced_dim=dim, **layout)
+            rows.append(row)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, indent=2)
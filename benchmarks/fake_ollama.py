@@ -0,0 +1,153 @@
+"""
+Fake Ollama
+===========
+A deterministic, in-process stand-in for the parts of the Ollama API the app
+uses (embed, chat, Client, AsyncClient), so benchmarks run offline and give
+the same numbers twice.
+
+    embed   feature-hashed bag of words: every token adds +-1 to one of `dim`
+            slots, then the vector is normalized. Texts sharing words end up
+            close, so vector search returns meaningful neighbours.
+    chat    a canned answer built from the question, `answer_tokens` stream
+            chunks long; non-streaming calls (query rewrite) echo the question.
+
+Latency is simulated with sleeps, per model runner like Ollama does it: at
+most `parallel` calls run at once, an embed call costs embed_call_ms +
+embed_text_ms per text, a streamed answer waits ttft_ms for its first chunk
+and token_ms for every further one.
+
+    fake = FakeOllama(dim=256, embed_call_ms=15, embed_text_ms=0.5).install()
+"""
+
+import re
+import time
+import zlib
+import asyncio
+import threading
+import numpy as np
+
+
+class FakeOllama:
+    def __init__(self, dim=768, embed_call_ms=0.0, embed_text_ms=0.0, ttft_ms=0.0, token_ms=0.0,
+                 answer_tokens=64, parallel=1):
+        self.dim = dim
+        self.embed_call_ms = embed_call_ms
+        self.embed_text_ms = embed_text_ms
+        self.ttft_ms = ttft_ms
+        self.token_ms = token_ms
+        self.answer_tokens = answer_tokens
+        self.parallel = max(1, parallel)
+        self.embed_runner = threading.BoundedSemaphore(self.parallel)
+        self.chat_runner = threading.BoundedSemaphore(self.parallel)
+        self.slots = {}  # token -> (slot, sign)
+        self.lock = threading.Lock()
+        self.counts = {"embed_calls": 0, "embedded_texts": 0, "chat_calls": 0, "streamed_tokens": 0}
+
+    def _count(self, key, n=1):
+        with self.lock:
+            self.counts[key] += n
+
+    # --- EMBED ---
+    def _slot(self, token):
+        slot = self.slots.get(token)
+        if slot is None:
+            h = zlib.crc32(token.encode())
+            slot = self.slots[token] = (h % self.dim, 1.0 if h & 0x80000000 else -1.0)
+        return slot
+
+    def vector(self, text):
+        tokens = re.findall(r'[a-z0-9]+', text.lower())
+        if not tokens:
+            vec = np.random.default_rng(zlib.crc32(text.encode())).standard_normal(self.dim)
+        else:
+            slots, signs = zip(*(self._slot(t) for t in tokens))
+            vec = np.bincount(slots, weights=signs, minlength=self.dim)
+        norm = np.linalg.norm(vec)
+        return (vec / norm if norm else vec).astype(np.float32)
+
+    def embed(self, model=None, input=None, **kwargs):
+        texts = [input] if isinstance(input, str) else list(input or [])
+        with self.embed_runner:
+            time.sleep((self.embed_call_ms + self.embed_text_ms * len(texts)) / 1000)
+        self._count("embed_calls")
+        self._count("embedded_texts", len(texts))
+        return {"model": model, "embeddings": [self.vector(t).tolist() for t in texts]}
+
+    # --- CHAT ---
+    def _answer(self, messages):
+        question = messages[-1]["content"] if messages else ""
+        words = re.findall(r'\w+', question.split("Question:")[-1]) or ["answer"]
+        return [f"{words[i % len(words)]} " for i in range(self.answer_tokens)]
+
+    def _stream(self, tokens):
+        with self.chat_runner:
+            for i, token in enumerate(tokens):
+                time.sleep((self.ttft_ms if i == 0 else self.token_ms) / 1000)
+                self._count("streamed_tokens")
+                yield {"message": {"role": "assistant", "content": token}, "done": False}
+        yield {"message": {"role": "assistant", "content": ""}, "done": True}
+
+    def chat(self, model=None, messages=None, stream=False, **kwargs):
+        self._count("chat_calls")
+        if stream:
+            return self._stream(self._answer(messages))
+        question = messages[-1]["content"] if messages else ""
+        with self.chat_runner:
+            time.sleep(self.ttft_ms / 1000)
+        return {"model": model, "message": {"role": "assistant", "content": question[-200:]}, "done": True}
+
+    async def _astream(self, tokens, runner):
+        async with runner:
+            for i, token in enumerate(tokens):
+                await asyncio.sleep((self.ttft_ms if i == 0 else self.token_ms) / 1000)
+                self._count("streamed_tokens")
+                yield {"message": {"role": "assistant", "content": token}, "done": False}
+        yield {"message": {"role": "assistant", "content": ""}, "done": True}
+
+    # --- CLIENTS ---
+    def client_class(self):
+        fake = self
+
+        class Client:
+            def __init__(self, *args, **kwargs):
+                pass
+
+            def embed(self, model=None, input=None, **kwargs):
+                return fake.embed(model, input, **kwargs)
+
+            def chat(self, model=None, messages=None, stream=False, **kwargs):
+                return fake.chat(model, messages, stream, **kwargs)
+        return Client
+
+    def async_client_class(self):
+        fake = self
+
+        class AsyncClient:
+            def __init__(self, *args, **kwargs):
+                self.runner = asyncio.Semaphore(fake.parallel)  # clients live on one event loop
+
+            async def embed(self, model=None, input=None, **kwargs):
+                return await asyncio.to_thread(fake.embed, model, input, **kwargs)
+
+            async def chat(self, model=None, messages=None, stream=False, **kwargs):
+                if stream:
+                    fake._count("chat_calls")
+                    return fake._astream(fake._answer(messages), self.runner)
+                return await asyncio.to_thread(fake.chat, model, messages, False, **kwargs)
+        return AsyncClient
+
+    def install(self):
+        """Patches the ollama module (module functions and both clients) and drops the app's embed client"""
+        import ollama
+        ollama.embed = self.embed
+        ollama.chat = self.chat
+        ollama.Client = self.client_class()
+        ollama.AsyncClient = self.async_client_class()
+        import index_test
+        with index_test._embed_client_lock:
+            index_test._embed_client = None  # rebuilt from the fake Client on next use
+        return self
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts)
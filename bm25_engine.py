@@ -0,0 +1,181 @@
+"""
+Inverted-Index BM25
+===================
+Keyword search whose cost follows the posting lists of the query terms instead
+of the corpus size. Scores are the same as rank_bm25.BM25Okapi (same idf with
+the epsilon floor, same k1 / b defaults), so rankings do not change.
+
+Layout (CSR, one row per term id):
+    vocab    -> term -> term id
+    indptr   -> postings of term t live in [indptr[t], indptr[t + 1])
+    doc_ids  -> int32 document ids, ascending within a term
+    tfs      -> float32 term frequency, aligned with doc_ids
+    doc_len  -> int32 token count per document
+
+An index is never modified after it is built: add_documents() returns a new one,
+so a published snapshot can keep serving queries while the next one is prepared.
+"""
+
+import os
+import json
+import numpy as np
+
+PARAMS_FILE = "params.json"
+VOCAB_FILE = "vocab.json"
+ARRAY_FILES = ("indptr", "doc_ids", "tfs", "doc_len")
+
+
+class BM25Index:
+    def __init__(self, k1=1.5, b=0.75, epsilon=0.25):
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.vocab = {}
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.doc_ids = np.zeros(0, dtype=np.int32)
+        self.tfs = np.zeros(0, dtype=np.float32)
+        self.doc_len = np.zeros(0, dtype=np.int32)
+        self._finalize()
+
+    @classmethod
+    def from_tokenized(cls, tokenized_docs, **params):
+        return cls(**params).add_documents(tokenized_docs)
+
+    @property
+    def corpus_size(self):
+        return len(self.doc_len)
+
+    def _finalize(self):
+        """Derives idf and the per-document length normalisation from the raw arrays"""
+        n_docs = self.corpus_size
+        self.avgdl = float(self.doc_len.sum()) / n_docs if n_docs else 0.0
+
+        df = np.diff(self.indptr).astype(np.float64)
+        idf = np.log(n_docs - df + 0.5) - np.log(df + 0.5)
+        # Same floor as BM25Okapi: terms in more than half the docs get epsilon * average idf
+        average_idf = idf.mean() if len(idf) else 0.0
+        idf[idf < 0] = self.epsilon * average_idf
+        self.idf = idf
+
+        if self.avgdl:
+            self.norm = self.k1 * (1 - self.b + self.b * self.doc_len / self.avgdl)
+        else:
+            self.norm = np.zeros(n_docs, dtype=np.float64)
+
+    # --- BUILD ---
+    def add_documents(self, tokenized_docs):
+        """Returns a NEW index with the documents appended (ids continue after the existing ones)"""
+        vocab = dict(self.vocab)
+        terms, docs, freqs, lengths = [], [], [], []
+        for doc_id, document in enumerate(tokenized_docs, start=self.corpus_size):
+            counts = {}
+            for word in document:
+                counts[word] = counts.get(word, 0) + 1
+            for word, tf in counts.items():
+                term_id = vocab.get(word)
+                if term_id is None:
+                    term_id = vocab[word] = len(vocab)
+                terms.append(term_id)
+                docs.append(doc_id)
+                freqs.append(tf)
+            lengths.append(len(document))
+
+        # Merge without re-sorting the corpus: old postings are already grouped by term,
+        # so each keeps its order and only shifts right by the new postings of the terms
+        # before it; the (few) new postings are sorted by term and go after the old ones
+        # of their term, so doc ids stay ascending inside every posting list.
+        n_terms = len(vocab)
+        old_counts = np.zeros(n_terms, dtype=np.int64)
+        old_counts[:len(self.vocab)] = np.diff(self.indptr)
+        new_terms = np.asarray(terms, dtype=np.int64)
+        new_counts = np.bincount(new_terms, minlength=n_terms)
+
+        clone = BM25Index(self.k1, self.b, self.epsilon)
+        clone.vocab = vocab
+        clone.indptr = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(old_counts + new_counts, out=clone.indptr[1:])
+
+        old_terms = np.repeat(np.arange(len(self.vocab)), old_counts[:len(self.vocab)])
+        old_dest = np.arange(len(self.doc_ids)) + (clone.indptr[old_terms] - self.indptr[old_terms])
+        order = np.argsort(new_terms, kind='stable')
+        sorted_terms = new_terms[order]
+        new_starts = np.cumsum(new_counts) - new_counts  # first slot of each term among the new postings
+        new_dest = (clone.indptr[sorted_terms] + old_counts[sorted_terms]
+                    + np.arange(len(sorted_terms)) - new_starts[sorted_terms])
+
+        clone.doc_ids = np.empty(len(self.doc_ids) + len(new_terms), dtype=np.int32)
+        clone.tfs = np.empty(len(clone.doc_ids), dtype=np.float32)
+        clone.doc_ids[old_dest] = self.doc_ids
+        clone.tfs[old_dest] = self.tfs
+        clone.doc_ids[new_dest] = np.asarray(docs, dtype=np.int32)[order]
+        clone.tfs[new_dest] = np.asarray(freqs, dtype=np.float32)[order]
+        clone.doc_len = np.concatenate([self.doc_len, np.asarray(lengths, dtype=np.int32)])
+        clone._finalize()
+        return clone
+
+    # --- QUERY ---
+    def _matches(self, query_tokens):
+        """Returns (doc_ids, scores) for every document containing at least one query term"""
+        # Repeated query terms count once per occurrence, as in BM25Okapi
+        weights = {}
+        for word in query_tokens:
+            term_id = self.vocab.get(word)
+            if term_id is not None:
+                weights[term_id] = weights.get(term_id, 0) + 1
+        if not weights:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float64)
+
+        id_parts, score_parts = [], []
+        for term_id, count in weights.items():
+            lo, hi = self.indptr[term_id], self.indptr[term_id + 1]
+            ids = self.doc_ids[lo:hi]
+            tf = self.tfs[lo:hi]
+            id_parts.append(ids)
+            score_parts.append(count * self.idf[term_id] * (tf * (self.k1 + 1)) / (tf + self.norm[ids]))
+
+        if len(id_parts) == 1:
+            return np.asarray(id_parts[0]), score_parts[0]
+        docs, inverse = np.unique(np.concatenate(id_parts), return_inverse=True)
+        return docs, np.bincount(inverse, weights=np.concatenate(score_parts))
+
+    def top_k(self, query_tokens, k):
+        """Returns (doc_ids, scores) of the k best matching documents, best first"""
+        docs, scores = self._matches(query_tokens)
+        if len(docs) > k:
+            keep = np.argpartition(-scores, k - 1)[:k]
+            docs, scores = docs[keep], scores[keep]
+        order = np.lexsort((docs, -scores))  # ties: lower doc id first
+        return docs[order], scores[order]
+
+    def get_scores(self, query_tokens):
+        """Dense scores for every document (BM25Okapi compatible, O(corpus))"""
+        scores = np.zeros(self.corpus_size)
+        docs, matched = self._matches(query_tokens)
+        scores[docs] = matched
+        return scores
+
+    # --- DISK ---
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, PARAMS_FILE), 'w', encoding='utf-8') as f:
+            json.dump({"k1": self.k1, "b": self.b, "epsilon": self.epsilon}, f)
+        # Term ids are dense, so the vocab is stored as a list ordered by id
+        terms = [None] * len(self.vocab)
+        for word, term_id in self.vocab.items():
+            terms[term_id] = word
+        with open(os.path.join(directory, VOCAB_FILE), 'w', encoding='utf-8') as f:
+            json.dump(terms, f)
+        for name in ARRAY_FILES:
+            np.save(os.path.join(directory, name + ".npy"), getattr(self, name))
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Posting arrays are memory-mapped by default; add_documents() copies them anyway"""
+        with open(os.path.join(directory, PARAMS_FILE), 'r', encoding='utf-8') as f:
+            index = cls(**json.load(f))
+        with open(os.path.join(directory, VOCAB_FILE), 'r', encoding='utf-8') as f:
+            index.vocab = {word: term_id for term_id, word in enumerate(json.load(f))}
+        for name in ARRAY_FILES:
+            setattr(index, name, np.load(os.path.join(directory, name + ".npy"), mmap_mode='r' if mmap else None))
+        index._finalize()
+        return index
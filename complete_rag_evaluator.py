@@ -5,11 +5,21 @@ Complete Working RAG Evaluation Script
 This script evaluates your phi3.5 RAG application end-to-end.
 Connects to your actual FAISS index and Ollama phi3.5 model.
 
+Questions are evaluated a few at a time (WORKERS) and every scored question is
+appended to a JSONL checkpoint right away. An interrupted run (crash, Ctrl-C)
+picks up where it stopped: question ids already in the checkpoint are skipped.
+The checkpoint starts with a fingerprint of the chunks and settings; when they
+change, the old checkpoint is set aside and the run starts over.
+
 Usage:
     python complete_rag_evaluation.py
 """
 
+import os
 import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pandas as pd
 import numpy as np
 from pathlib import Path
@@ -19,6 +29,13 @@ from datetime import datetime
 import warnings
 warnings.filterwarnings('ignore')
 
+EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+LANGUAGE_MODEL = 'phi3.5:3.8b-mini-instruct-q4_K_M'
+GENERATION_OPTIONS = {
+    'temperature': 0.1,  # Low temperature for factual responses
+    'num_predict': 256   # Reasonable length
+}
+
 
 class RAGEvaluator:
     """
@@ -51,6 +68,9 @@ class RAGEvaluator:
         # Initialize components
         self.embedding_model = None
         self.faiss_index = None
+        self.chunk_matrix = None  # (n_chunks, dim) unit rows, when retrieving without FAISS
+        self.encode_lock = threading.Lock()  # question embeddings, from several worker threads
+        self.print_lock = threading.Lock()
         self.ollama_available = False
         
         # Try to initialize
@@ -77,7 +97,7 @@ class RAGEvaluator:
         try:
             from sentence_transformers import SentenceTransformer
             print("🔧 Loading embedding model...")
-            self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+            self.embedding_model = SentenceTransformer(EMBEDDING_MODEL)
             print("   ✅ Embedding model loaded")
         except ImportError:
             print("   ⚠️  sentence-transformers not installed")
@@ -95,6 +115,10 @@ class RAGEvaluator:
             print("      Install: pip install faiss-cpu")
         except Exception as e:
             print(f"   ⚠️  Could not load FAISS index: {e}")
+
+        # Without FAISS, every question is scored against the whole corpus: embed it once
+        if self.embedding_model is not None and self.faiss_index is None and self.chunks:
+            self.chunk_matrix = self.load_chunk_matrix()
         
         # Check Ollama
         try:
@@ -107,6 +131,52 @@ class RAGEvaluator:
             print(f"⚠️  Ollama not available: {e}")
             print("   Make sure Ollama is running: ollama serve")
     
+    def chunks_digest(self) -> str:
+        """Hash of the embedding model and every chunk text"""
+        digest = hashlib.sha256(EMBEDDING_MODEL.encode('utf-8'))
+        for chunk in self.chunks:
+            digest.update(chunk['content'].encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def chunk_matrix_path(self) -> Path:
+        """Embedding cache next to the chunks file, named after a hash of the model and chunk texts"""
+        chunks_path = Path(self.chunks_file)
+        return chunks_path.with_name(f"{chunks_path.stem}.embeddings-{self.chunks_digest()[:16]}.npy")
+
+    def load_chunk_matrix(self) -> np.ndarray:
+        """
+        Normalized chunk embeddings, so a dot product is the cosine similarity.
+        Read from the cache file when the chunks are unchanged, otherwise embedded
+        and written there (older caches of the same chunks file are removed).
+        """
+        path = self.chunk_matrix_path()
+        if path.exists():
+            try:
+                matrix = np.load(path)
+                if matrix.shape[0] == len(self.chunks):
+                    print(f"   ✅ Chunk embeddings loaded from {path.name}")
+                    return matrix
+            except Exception as e:
+                print(f"   ⚠️  Could not read {path.name}: {e}")
+
+        print(f"🔧 Embedding {len(self.chunks)} chunks (once)...")
+        matrix = np.asarray(self.embedding_model.encode([c['content'] for c in self.chunks]), dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.maximum(norms, 1e-12)
+
+        try:
+            for stale in path.parent.glob(f"{Path(self.chunks_file).stem}.embeddings-*.npy"):
+                stale.unlink()
+            tmp_path = path.with_name(path.name + ".tmp")
+            with open(tmp_path, 'wb') as f:
+                np.save(f, matrix)
+            os.replace(tmp_path, path)  # never leaves a half-written cache behind
+            print(f"   💾 Chunk embeddings cached in {path.name}")
+        except OSError as e:
+            print(f"   ⚠️  Could not cache chunk embeddings: {e}")
+        return matrix
+
     def retrieve_chunks_simple(self, question: str, top_k: int = 5) -> List[str]:
         """
         Simple retrieval using cosine similarity
@@ -117,30 +187,31 @@ class RAGEvaluator:
             return self.retrieve_chunks_keyword(question, top_k)
         
         # Embed question
-        question_embedding = self.embedding_model.encode([question])
+        with self.encode_lock:
+            question_embedding = np.asarray(self.embedding_model.encode([question]), dtype=np.float32)
         
-        # Embed all chunks if not using FAISS
+        # Score against the cached chunk matrix if not using FAISS
         if self.faiss_index is None:
-            chunk_texts = [c['content'] for c in self.chunks]
-            chunk_embeddings = self.embedding_model.encode(chunk_texts)
+            if self.chunk_matrix is None or not len(self.chunk_matrix):
+                return []
+            query = question_embedding[0] / max(np.linalg.norm(question_embedding[0]), 1e-12)
+            similarities = self.chunk_matrix @ query
             
-            # Compute similarities
-            from sklearn.metrics.pairwise import cosine_similarity
-            similarities = cosine_similarity(question_embedding, chunk_embeddings)[0]
-            
-            # Get top-k
-            top_indices = np.argsort(similarities)[-top_k:][::-1]
+            # Get top-k: partial selection, then sort only those k
+            k = min(top_k, len(similarities))
+            top_indices = np.argpartition(-similarities, k - 1)[:k]
+            top_indices = top_indices[np.argsort(-similarities[top_indices])]
             
         else:
             # Use FAISS
             distances, indices = self.faiss_index.search(
-                question_embedding.astype('float32'), 
+                question_embedding, 
                 top_k
             )
             top_indices = indices[0]
         
         # Return chunk contents
-        retrieved = [self.chunks[idx]['content'] for idx in top_indices if idx < len(self.chunks)]
+        retrieved = [self.chunks[idx]['content'] for idx in top_indices if 0 <= idx < len(self.chunks)]
         return retrieved
     
     def retrieve_chunks_keyword(self, question: str, top_k: int = 5) -> List[str]:
@@ -164,7 +235,8 @@ class RAGEvaluator:
         """Generate answer using Ollama phi3.5"""
         
         if not self.ollama_available:
-            return "Ollama not available - placeholder answer"
+            # An error, not a placeholder answer: nothing unscored may reach the checkpoint
+            raise RuntimeError("Ollama not available")
         
         # Create prompt
         context_text = "\n\n".join([f"Context {i+1}:\n{ctx}" for i, ctx in enumerate(contexts)])
@@ -181,25 +253,23 @@ Answer:"""
             import ollama
             
             response = ollama.chat(
-                model='phi3.5:3.8b-mini-instruct-q4_K_M',
+                model=LANGUAGE_MODEL,
                 messages=[
                     {
                         'role': 'user',
                         'content': prompt
                     }
                 ],
-                options={
-                    'temperature': 0.1,  # Low temperature for factual responses
-                    'num_predict': 256   # Reasonable length
-                }
+                options=GENERATION_OPTIONS
             )
             
             answer = response['message']['content']
             return answer.strip()
             
         except Exception as e:
+            # Raised, not scored: the question stays out of the checkpoint and is retried on resume
             print(f"⚠️  Error generating answer: {e}")
-            return "Error generating answer"
+            raise
     
     def query_rag(self, question: str, top_k: int = 5) -> Tuple[str, List[str]]:
         """
@@ -303,8 +373,111 @@ Answer:"""
     # Main Evaluation
     # ========================================================================
     
-    def run_evaluation(self, max_questions: int = None) -> pd.DataFrame:
-        """Run complete evaluation"""
+    def checkpoint_path(self) -> Path:
+        """Default checkpoint: next to the questions file"""
+        questions_path = Path(self.test_questions_file)
+        return questions_path.with_name(f"{questions_path.stem}.results.jsonl")
+    
+    def run_fingerprint(self, top_k: int) -> Dict:
+        """Everything a scored result depends on besides the question itself"""
+        if self.faiss_index is not None:
+            # The file's identity, not its path: an index rebuilt in place must not reuse old answers
+            stat = Path(self.faiss_index_path).stat()
+            retrieval = f"faiss:{stat.st_size}:{stat.st_mtime_ns}:{self.faiss_index.ntotal}"
+        else:
+            retrieval = "embeddings" if self.embedding_model is not None else "keyword"
+        config = {
+            'chunks': self.chunks_digest(),
+            'retrieval': retrieval,
+            'top_k': top_k,
+            'language_model': LANGUAGE_MODEL,
+            'options': GENERATION_OPTIONS,
+        }
+        config['fingerprint'] = hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        return config
+    
+    def load_checkpoint(self, checkpoint_file: Path) -> Tuple[str, Dict]:
+        """
+        (fingerprint, scored results by question id). The first line holds the
+        fingerprint of the run that wrote it; a line cut short by a crash is ignored.
+        """
+        fingerprint, done = None, {}
+        if not checkpoint_file.exists():
+            return fingerprint, done
+        with open(checkpoint_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    if 'fingerprint' in record and 'id' not in record:
+                        fingerprint = fingerprint or record['fingerprint']
+                    else:
+                        done[record['id']] = record
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    continue
+        return fingerprint, done
+    
+    @staticmethod
+    def ends_with_newline(path: Path) -> bool:
+        with open(path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+    
+    def evaluate_question(self, item: Dict, top_k: int = 5) -> Dict:
+        """Retrieve, generate and score one test question (runs on a worker thread)"""
+        question = item['question']
+        ground_truth = item['ground_truth']
+        
+        # Query RAG
+        answer, contexts = self.query_rag(question, top_k=top_k)
+        
+        # Evaluate
+        metrics = self.evaluate_single_query(question, ground_truth, answer, contexts)
+        
+        return {
+            'id': item['id'],
+            'category': item['category'],
+            'difficulty': item['difficulty'],
+            'question': question,
+            'ground_truth': ground_truth,
+            'generated_answer': answer,
+            **metrics
+        }
+    
+    def print_result(self, position: str, result: Dict):
+        answer = result['generated_answer']
+        with self.print_lock:
+            print(f"\n{'─'*70}")
+            print(f"Question {position} (id {result['id']})")
+            print(f"{'─'*70}")
+            print(f"Q: {result['question']}")
+            print(f"A: {answer[:100]}..." if len(answer) > 100 else f"A: {answer}")
+            print(f"Retrieved: {result['num_contexts']} contexts")
+            print(f"\nMetrics:")
+            print(f"  Recall:       {result['context_recall']:.3f}")
+            print(f"  Precision:    {result['context_precision']:.3f}")
+            print(f"  Faithfulness: {result['answer_faithfulness']:.3f}")
+            print(f"  Relevancy:    {result['answer_relevancy']:.3f}")
+    
+    def run_evaluation(
+        self,
+        max_questions: int = None,
+        workers: int = 4,
+        checkpoint_file: str = None,
+        resume: bool = True,
+        top_k: int = 5
+    ) -> pd.DataFrame:
+        """
+        Run complete evaluation
+        
+        Args:
+            max_questions: Evaluate only the first N questions
+            workers: Questions evaluated at once (generation requests in flight to Ollama)
+            checkpoint_file: JSONL file results are appended to (default: next to the questions file)
+            resume: Skip question ids already in the checkpoint; False starts it over
+            top_k: Contexts retrieved per question
+        """
+        if not self.ollama_available:
+            raise RuntimeError("Ollama is not available: start it (ollama serve) before evaluating")
         
         print("\n" + "="*70)
         print("RAG EVALUATION")
@@ -318,56 +491,65 @@ Answer:"""
         if max_questions:
             test_questions = test_questions[:max_questions]
         
-        print(f"\n📊 Evaluating {len(test_questions)} questions...")
-        
-        results = []
-        
-        for i, item in enumerate(test_questions, 1):
-            print(f"\n{'─'*70}")
-            print(f"Question {i}/{len(test_questions)}")
-            print(f"{'─'*70}")
-            
-            question = item['question']
-            ground_truth = item['ground_truth']
-            
-            print(f"Q: {question}")
-            
-            # Query RAG
+        # Resume from the checkpoint, if it was written with the same chunks and settings
+        checkpoint_file = Path(checkpoint_file) if checkpoint_file else self.checkpoint_path()
+        config = self.run_fingerprint(top_k)
+        if not resume and checkpoint_file.exists():
+            checkpoint_file.unlink()
+        fingerprint, done = self.load_checkpoint(checkpoint_file)
+        if checkpoint_file.exists() and fingerprint != config['fingerprint']:
+            stale = checkpoint_file.with_name(f"{checkpoint_file.stem}.{fingerprint or 'old'}{checkpoint_file.suffix}")
+            os.replace(checkpoint_file, stale)
+            print(f"⚠️  {checkpoint_file.name} was written with other chunks or settings; moved to {stale.name}, starting over")
+            done = {}
+        if not checkpoint_file.exists():
+            with open(checkpoint_file, 'w', encoding='utf-8') as f:
+                f.write(json.dumps(config) + "\n")
+        pending = [item for item in test_questions if item['id'] not in done]
+        
+        print(f"\n📊 Evaluating {len(pending)} questions with {workers} workers "
+              f"({len(test_questions) - len(pending)} already scored in {checkpoint_file.name})...")
+        
+        write_lock = threading.Lock()
+        finished = len(test_questions) - len(pending)
+        
+        with open(checkpoint_file, 'a', encoding='utf-8') as checkpoint:
+            if checkpoint.tell() and not self.ends_with_newline(checkpoint_file):
+                checkpoint.write("\n")  # a crash cut the last line short: start a fresh one
+            pool = ThreadPoolExecutor(max_workers=max(1, workers))
+            futures = {pool.submit(self.evaluate_question, item, top_k): item for item in pending}
             try:
-                answer, contexts = self.query_rag(question, top_k=5)
-                print(f"A: {answer[:100]}..." if len(answer) > 100 else f"A: {answer}")
-                print(f"Retrieved: {len(contexts)} contexts")
-            except Exception as e:
-                print(f"❌ Error: {e}")
-                continue
-            
-            # Evaluate
-            metrics = self.evaluate_single_query(question, ground_truth, answer, contexts)
-            
-            # Print metrics
-            print(f"\nMetrics:")
-            print(f"  Recall:       {metrics['context_recall']:.3f}")
-            print(f"  Precision:    {metrics['context_precision']:.3f}")
-            print(f"  Faithfulness: {metrics['answer_faithfulness']:.3f}")
-            print(f"  Relevancy:    {metrics['answer_relevancy']:.3f}")
-            
-            # Store result
-            result = {
-                'id': item['id'],
-                'category': item['category'],
-                'difficulty': item['difficulty'],
-                'question': question,
-                'ground_truth': ground_truth,
-                'generated_answer': answer,
-                **metrics
-            }
-            results.append(result)
-        
-        # Create DataFrame
+                for future in as_completed(futures):
+                    item = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        # Not written to the checkpoint, so the next run retries it
+                        with self.print_lock:
+                            print(f"❌ Error on question {item['id']}: {e}")
+                        continue
+                    
+                    with write_lock:
+                        checkpoint.write(json.dumps(result) + "\n")
+                        checkpoint.flush()
+                    done[result['id']] = result
+                    finished += 1
+                    self.print_result(f"{finished}/{len(test_questions)}", result)
+            except KeyboardInterrupt:
+                pool.shutdown(wait=False, cancel_futures=True)
+                print(f"\n⏸️  Interrupted. Scored questions are saved in {checkpoint_file}; run again to resume.")
+                raise
+            pool.shutdown()
+        
+        # Create DataFrame (question file order, earlier runs included)
+        results = [done[item['id']] for item in test_questions if item['id'] in done]
         df = pd.DataFrame(results)
         
         # Display summary
-        self.display_summary(df)
+        if df.empty:
+            print("\n⚠️  No questions were scored.")
+        else:
+            self.display_summary(df)
         
         return df
     
@@ -474,6 +656,8 @@ if __name__ == "__main__":
     CHUNKS_FILE = "knowledge_base_chunks.jsonl"  # ← CHANGE THIS to your chunks file
     FAISS_INDEX = None  # Optional: "your_index.faiss"
     TEST_QUESTIONS = "ground_truth.json"
+    WORKERS = 4         # questions in flight (set OLLAMA_NUM_PARALLEL on the server to match)
+    RESUME = True       # False: ignore the checkpoint of an earlier run and start over
     
     # Check if files exist
     if not Path(CHUNKS_FILE).exists():
@@ -494,6 +678,10 @@ if __name__ == "__main__":
         test_questions_file=TEST_QUESTIONS
     )
     
+    if not evaluator.ollama_available:
+        print("\n❌ Ollama is needed to generate answers. Start it with: ollama serve\n")
+        exit(1)
+    
     # Run evaluation
     print("\n🚀 Starting evaluation...")
     
@@ -501,7 +689,7 @@ if __name__ == "__main__":
     # results_df = evaluator.run_evaluation(max_questions=5)
     
     # Full evaluation
-    results_df = evaluator.run_evaluation()
+    results_df = evaluator.run_evaluation(workers=WORKERS, resume=RESUME)
     
     # Save results
     evaluator.save_results(results_df)
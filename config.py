@@ -24,11 +24,12 @@ SETTINGS_PATH = os.path.join(APP_DIR, 'settings.json')
 # --- 4. Dynamic Config Loader ---
 final_embed_model = DEFAULT_EMBED_MODEL
 final_lang_model = DEFAULT_LANG_MODEL
+settings = {}
 
 if os.path.exists(SETTINGS_PATH):
     try:
         with open(SETTINGS_PATH, 'r') as f:
-            settings = json.load(f)
+            settings = json.load(f) or {}
             # Only overwrite if the key exists in json
             final_embed_model = settings.get('embedding_model', final_embed_model)
             final_lang_model = settings.get('language_model', final_lang_model)
@@ -40,3 +41,61 @@ if os.path.exists(SETTINGS_PATH):
 EMBEDDING_MODEL = final_embed_model
 LANGUAGE_MODEL = final_lang_model
 
+# --- 6. Performance Tuning (all optional keys in settings.json) ---
+EMBED_CACHE_MAX_MB = int(settings.get('embed_cache_max_mb', 512))
+BATCH_SIZE = int(settings.get('batch_size', BATCH_SIZE))          # starting embed batch size
+EMBED_MIN_BATCH = int(settings.get('embed_min_batch', 1))
+EMBED_MAX_BATCH = int(settings.get('embed_max_batch', 256))
+EMBED_WORKERS = int(settings.get('embed_workers', 4))              # in-flight embed requests
+EMBED_TIMEOUT = float(settings.get('embed_timeout', 120))          # seconds per embed request
+EMBED_RETRIES = int(settings.get('embed_retries', 2))              # retries for a single chunk that times out
+EMBED_POOL_CONNECTIONS = int(settings.get('embed_pool_connections', 16))  # kept-alive HTTP connections to Ollama for embeds
+EMBED_KEEPALIVE = float(settings.get('embed_keepalive', 60))                # seconds an idle connection stays open
+QUERY_EMBED_WINDOW_MS = float(settings.get('query_embed_window_ms', 3))     # concurrent query embeds within this window share one call, 0 = off
+QUERY_EMBED_MAX_BATCH = int(settings.get('query_embed_max_batch', 64))
+QUERY_EMBED_WORKERS = int(settings.get('query_embed_workers', 4))        # batched query embeds in flight at once
+PARSE_WORKERS = int(settings.get('parse_workers', os.cpu_count() or 1))   # PDF parser processes
+PARSE_PAGES_PER_TASK = int(settings.get('parse_pages_per_task', 8))       # page range per parser task
+STREAM_QUEUE_SIZE = int(settings.get('stream_queue_size', 512))           # parsed chunks waiting for embedding
+STREAM_EMBED_BATCH = int(settings.get('stream_embed_batch', 256))         # chunks handed to the embedder at once
+
+# --- 7. Vector Index (see vector_store.py) ---
+VECTOR_BACKEND = str(settings.get('vector_backend', 'flat')).lower()     # flat | hnsw | ivf | usearch
+HNSW_M = int(settings.get('hnsw_m', 32))                                  # graph degree (hnsw / usearch)
+HNSW_EF_CONSTRUCTION = int(settings.get('hnsw_ef_construction', 200))
+HNSW_EF_SEARCH = int(settings.get('hnsw_ef_search', 128))                 # keep >= the k asked by searches
+IVF_NLIST = int(settings.get('ivf_nlist', 0))                             # 0 = 4 * sqrt(N) when trained
+IVF_NPROBE = int(settings.get('ivf_nprobe', 16))
+VECTOR_STORAGE = str(settings.get('vector_storage', 'float32')).lower()  # float32 | fp16 | sq8 | pq
+PQ_M = int(settings.get('pq_m', 0))                                       # PQ bytes per vector, 0 = dim / 8
+RESCORE_FACTOR = int(settings.get('rescore_factor', 4))                   # lossy storage: re-rank k * factor hits on exact vectors, 0 = off
+VECTOR_TRAIN_MIN = int(settings.get('vector_train_min', settings.get('ivf_train_min', 10000)))  # IVF / SQ8 / PQ stay flat until this many vectors
+EMBED_REDUCTION = str(settings.get('embed_reduction', 'none')).lower()   # none | matryoshka | pca
+EMBED_REDUCED_DIM = int(settings.get('embed_reduced_dim', 256))           # target width, e.g. 256 or 128
+
+# --- 8. Query-Time Caches (see lru_cache.py; size 0 disables, ttl 0 = no expiry) ---
+QUERY_EMBED_CACHE_SIZE = int(settings.get('query_embed_cache_size', 2048))
+QUERY_EMBED_CACHE_TTL = float(settings.get('query_embed_cache_ttl', 0))          # seconds
+REWRITE_CACHE_SIZE = int(settings.get('rewrite_cache_size', 1024))
+REWRITE_CACHE_TTL = float(settings.get('rewrite_cache_ttl', 3600))              # seconds
+ANSWER_CACHE_SIZE = int(settings.get('answer_cache_size', 512))                 # (index version, chunk set) groups
+ANSWER_CACHE_THRESHOLD = float(settings.get('answer_cache_threshold', 0.95))    # min cosine between query embeddings
+ANSWER_CACHE_TTL = float(settings.get('answer_cache_ttl', 86400))               # seconds
+
+# --- 9. Reranking (see reranker.py) ---
+RERANK_MODEL = str(settings.get('rerank_model', 'ms-marco-MiniLM-L-12-v2'))          # final order
+RERANK_FAST_MODEL = str(settings.get('rerank_fast_model', 'ms-marco-TinyBERT-L-2-v2'))  # prune stage, "" = off
+RERANK_MODEL_DIR = os.path.join(APP_DIR, "opt")                                      # local models, before flashrank's cache
+RERANK_CANDIDATES = int(settings.get('rerank_candidates', 20))     # fused candidates handed to the reranker
+RERANK_PRUNE_KEEP = int(settings.get('rerank_prune_keep', 8))      # survivors of the prune stage
+RERANK_EARLY_EXIT_GAP = float(settings.get('rerank_early_exit_gap', 0.5))  # fused #1 lead over #2 that skips the rescore, 0 = off
+RERANK_CACHE_SIZE = int(settings.get('rerank_cache_size', 20000))  # (model, query, chunk) scores
+
+# --- 10. Chat Sessions (see session_store.py) ---
+SESSION_MAX_TURNS = int(settings.get('session_max_turns', 5))           # question/answer pairs kept per session
+SESSION_MAX_SESSIONS = int(settings.get('session_max_sessions', 1000))  # least recently used sessions go first
+SESSION_IDLE_TTL = float(settings.get('session_idle_ttl', 3600))        # seconds, 0 = never idle out
+SESSION_MEMORY_MB = float(settings.get('session_memory_mb', 64))        # history text across all sessions
+
+# --- 11. Observability (metrics at /metrics, see metrics.py) ---
+LOG_LEVEL = str(settings.get('log_level', 'INFO')).upper()   # DEBUG also logs the reranked chunk texts
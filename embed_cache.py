@@ -0,0 +1,186 @@
+"""
+Content-Addressed Embedding Cache
+=================================
+Remembers every vector Ollama has produced, keyed by (embedding model, sha1 of the
+chunk text), so re-uploads, /reset + re-upload and shared boilerplate never hit
+the embedding server twice.
+
+Layout of CACHE_DIR/embeddings/<model>/:
+    meta.json    -> model name + vector dimension
+    vectors.f32  -> append-only float32 matrix, one row per cached text
+    keys.txt     -> append-only, line i is the hash of row i
+
+When vectors.f32 grows past max_bytes the least recently used rows are dropped
+and both files are rewritten.
+"""
+
+import os
+import re
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from config import CACHE_DIR, EMBEDDING_MODEL, EMBED_CACHE_MAX_MB
+
+META_FILE = "meta.json"
+VECTORS_FILE = "vectors.f32"
+KEYS_FILE = "keys.txt"
+
+
+def text_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, model=EMBEDDING_MODEL, cache_dir=CACHE_DIR, max_bytes=EMBED_CACHE_MAX_MB * 1024 * 1024):
+        safe_model = re.sub(r'[^A-Za-z0-9_.-]+', '_', model)
+        self.model = model
+        self.dir = os.path.join(cache_dir, "embeddings", safe_model)
+        self.max_bytes = max_bytes
+        self.dim = None
+        self.rows = OrderedDict()  # hash -> row, oldest use first
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self._matrix = None        # memmap over vectors.f32, reopened when the file grows
+        self._load()
+
+    # --- DISK ---
+    def _path(self, name):
+        return os.path.join(self.dir, name)
+
+    def _load(self):
+        if not os.path.exists(self._path(META_FILE)):
+            return
+        try:
+            with open(self._path(META_FILE), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get("model") != self.model:
+                return
+            self.dim = meta["dim"]
+
+            with open(self._path(KEYS_FILE), 'r', encoding='utf-8') as f:
+                keys = [line.strip() for line in f]
+
+            # A crash between the two appends can leave one file a row ahead: trust the shorter one
+            n_rows = os.path.getsize(self._path(VECTORS_FILE)) // (4 * self.dim)
+            for row, key in enumerate(keys[:n_rows]):
+                self.rows[key] = row
+            if len(keys) != n_rows:
+                self._rewrite(list(self.rows.items()))
+        except Exception as e:
+            print(f"⚠️ [EmbedCache] Could not load cache, starting empty: {e}")
+            self.dim = None
+            self.rows = OrderedDict()
+
+    def _matrix_view(self):
+        n_rows = len(self.rows)
+        if self._matrix is None or self._matrix.shape[0] < n_rows:
+            self._matrix = np.memmap(self._path(VECTORS_FILE), dtype=np.float32, mode='r', shape=(n_rows, self.dim))
+        return self._matrix
+
+    def _rewrite(self, items):
+        """Rewrites both files with only the given (hash, old_row) items, in that order"""
+        vectors = self._matrix_view()[[row for _, row in items]] if items else np.zeros((0, self.dim), np.float32)
+        tmp_vectors, tmp_keys = self._path(VECTORS_FILE + ".tmp"), self._path(KEYS_FILE + ".tmp")
+        np.ascontiguousarray(vectors, dtype=np.float32).tofile(tmp_vectors)
+        with open(tmp_keys, 'w', encoding='utf-8') as f:
+            f.writelines(key + "\n" for key, _ in items)
+
+        self._matrix = None
+        os.replace(tmp_vectors, self._path(VECTORS_FILE))
+        os.replace(tmp_keys, self._path(KEYS_FILE))
+        self.rows = OrderedDict((key, new_row) for new_row, (key, _) in enumerate(items))
+
+    def _evict(self):
+        """Drops least recently used rows until the matrix is back under 80% of max_bytes"""
+        row_bytes = 4 * self.dim
+        keep = int(self.max_bytes * 0.8) // row_bytes
+        items = list(self.rows.items())
+        dropped = len(items) - keep
+        self._rewrite(items[-keep:] if keep > 0 else [])
+        print(f"🧹 [EmbedCache] Evicted {dropped} least recently used vectors")
+
+    # --- API ---
+    def get_many(self, texts):
+        """Returns a list aligned with texts: a float32 vector on hit, None on miss"""
+        keys = [text_hash(t) for t in texts]
+        results = [None] * len(texts)
+        with self.lock:
+            if self.dim is None or not self.rows:
+                self.misses += len(texts)
+                return results
+            matrix = self._matrix_view()
+            for i, key in enumerate(keys):
+                row = self.rows.get(key)
+                if row is None:
+                    self.misses += 1
+                    continue
+                self.rows.move_to_end(key)
+                results[i] = np.array(matrix[row])
+                self.hits += 1
+        return results
+
+    def put_many(self, texts, vectors):
+        if not texts:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self.lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                os.makedirs(self.dir, exist_ok=True)
+                with open(self._path(META_FILE), 'w', encoding='utf-8') as f:
+                    json.dump({"model": self.model, "dim": self.dim}, f)
+                open(self._path(VECTORS_FILE), 'wb').close()
+                open(self._path(KEYS_FILE), 'w').close()
+            if vectors.shape[1] != self.dim:
+                print(f"⚠️ [EmbedCache] Dimension changed ({self.dim} -> {vectors.shape[1]}), not caching")
+                return
+
+            new_keys, new_rows = [], []
+            for text, vec in zip(texts, vectors):
+                key = text_hash(text)
+                if key in self.rows or key in new_keys:
+                    continue
+                new_keys.append(key)
+                new_rows.append(vec)
+            if not new_keys:
+                return
+
+            # Vectors first, then keys: a crash leaves at most an orphan row, never a key without data
+            with open(self._path(VECTORS_FILE), 'ab') as f:
+                np.ascontiguousarray(new_rows, dtype=np.float32).tofile(f)
+            with open(self._path(KEYS_FILE), 'a', encoding='utf-8') as f:
+                f.writelines(key + "\n" for key in new_keys)
+            start = len(self.rows)
+            for offset, key in enumerate(new_keys):
+                self.rows[key] = start + offset
+
+            if len(self.rows) * 4 * self.dim > self.max_bytes:
+                self._evict()
+
+    def clear(self):
+        with self.lock:
+            self._matrix = None
+            self.rows = OrderedDict()
+            self.dim = None
+            for name in (META_FILE, VECTORS_FILE, KEYS_FILE):
+                if os.path.exists(self._path(name)):
+                    os.remove(self._path(name))
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_embedding_cache():
+    """Process-wide cache for the configured embedding model"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache()
+        return _cache
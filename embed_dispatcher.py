@@ -0,0 +1,107 @@
+"""
+Embedding Dispatcher
+====================
+Coalesces the single-query embeddings of concurrent /chat requests into one
+batched embed call. The first query to arrive opens a window of `window_ms`;
+everything that arrives before it closes (up to `max_batch` texts) goes to
+Ollama in the same request, and each caller gets its own row back.
+
+    caller threads --embed(text)--> queue --> dispatcher thread --> workers --> embed_fn([...])
+          ^                                                            |
+          +------------------- Future per text <-----------------------+
+
+Closed batches run on up to `workers` threads, so a slow or hung call only holds
+up the callers in its own batch; while every worker is busy, new queries keep
+queueing and go out together as soon as one is free. Identical texts in one
+window share a slot. A failed batch fails every caller in it (they retry like
+any other embed error would). window_ms <= 0 turns the dispatcher off and
+embed() calls embed_fn directly.
+"""
+
+import time
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class EmbedDispatcher:
+    def __init__(self, embed_fn, window_ms=3, max_batch=64, workers=4):
+        self.embed_fn = embed_fn
+        self.window = window_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self.workers = max(1, workers)
+        self.free_workers = threading.Semaphore(self.workers)
+        self.pending = queue.Queue()
+        self.pool = None
+        self.thread = None
+        self.start_lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.batches = 0
+        self.texts = 0
+
+    def _ensure_started(self):
+        if self.thread is None:
+            with self.start_lock:
+                if self.thread is None:
+                    self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="embed-batch")
+                    self.thread = threading.Thread(target=self._run, name="embed-dispatcher", daemon=True)
+                    self.thread.start()
+
+    def embed(self, text):
+        """Returns the embedding of one text (a list of floats); blocks until its batch is back"""
+        if self.window <= 0:
+            return self.embed_fn([text])[0]
+        self._ensure_started()
+        future = Future()
+        self.pending.put((text, future))
+        return future.result()
+
+    def _collect(self):
+        batch = [self.pending.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            # Open the next window only once a worker can take it
+            self.free_workers.acquire()
+            self.pool.submit(self._dispatch, self._collect())
+
+    def _dispatch(self, batch):
+        slots = {}  # text -> futures waiting for it
+        for text, future in batch:
+            slots.setdefault(text, []).append(future)
+        texts = list(slots)
+        try:
+            vectors = self.embed_fn(texts)
+            if len(vectors) != len(texts):
+                raise RuntimeError(f"embed returned {len(vectors)} vectors for {len(texts)} texts")
+        except Exception as e:
+            for futures in slots.values():
+                for future in futures:
+                    future.set_exception(e)
+            return
+        finally:
+            self.free_workers.release()
+        for text, vector in zip(texts, vectors):
+            for future in slots[text]:
+                future.set_result(vector)
+        with self.stats_lock:
+            self.batches += 1
+            self.texts += len(texts)
+
+    def stats(self):
+        with self.stats_lock:
+            return {
+                "batches": self.batches,
+                "texts": self.texts,
+                "avg_batch": round(self.texts / self.batches, 2) if self.batches else 0.0,
+            }
@@ -0,0 +1,167 @@
+"""
+On-Disk Knowledge Base Store
+============================
+Persists the hybrid index (FAISS vectors + BM25 statistics + chunk store) to
+INDEX_CACHE so a restart does not have to re-embed the whole corpus.
+
+Layout of INDEX_CACHE:
+    manifest.json   -> format version, embedding model, vector backend, counts
+    vectors.faiss   -> FAISS index (memory-mapped on load where supported)
+      or vectors.usearch for the usearch backend
+    vectors.*.exact.f32 -> float32 rows for re-scoring (lossy sq8 / pq storage only)
+    vectors.*.projection.npz -> Matryoshka / PCA projection (embed_reduction only)
+    bm25/           -> inverted BM25 index (.npy postings, memory-mapped on load)
+    chunks.jsonl    -> one chunk text per line, line number == chunk id
+"""
+
+import os
+import json
+import time
+import shutil
+import faiss
+from bm25_engine import BM25Index
+from config import INDEX_CACHE, EMBEDDING_MODEL
+from vector_store import load_vector_index, convert_vector_index, layout, configured_layout
+
+# Bump this whenever the on-disk layout changes. Old caches are ignored, not migrated.
+INDEX_FORMAT_VERSION = 3
+
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.faiss"
+USEARCH_FILE = "vectors.usearch"
+BM25_DIR = "bm25"
+CHUNKS_FILE = "chunks.jsonl"
+
+
+def _read_flags():
+    """Memory-map the vector codes where the OS lets us replace mapped files (not on Windows)"""
+    if os.name == 'nt':
+        return 0
+    return getattr(faiss, 'IO_FLAG_MMAP_IFC', 0)
+
+
+def save_index(vector_index, bm25_index, chunk_map, cache_dir=INDEX_CACHE, embedding_model=EMBEDDING_MODEL):
+    """
+    Writes the index to a temp folder first and swaps it in at the end,
+    so a crash mid-save never leaves a half-written cache behind.
+    """
+    if vector_index is None or bm25_index is None:
+        return False
+
+    tmp_dir = cache_dir + ".tmp"
+    old_dir = cache_dir + ".old"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    # 1. Vectors
+    vector_file = USEARCH_FILE if vector_index.backend == "usearch" else VECTORS_FILE
+    vector_index.save(os.path.join(tmp_dir, vector_file))
+
+    # 2. Keyword statistics
+    bm25_index.save(os.path.join(tmp_dir, BM25_DIR))
+
+    # 3. Chunk store (ids are 0..N-1, so the line number is the id)
+    with open(os.path.join(tmp_dir, CHUNKS_FILE), 'w', encoding='utf-8') as f:
+        for i in range(len(chunk_map)):
+            f.write(json.dumps(chunk_map[i]) + "\n")
+
+    # 4. Manifest goes last: a folder without one is never loaded
+    manifest = {
+        "format_version": INDEX_FORMAT_VERSION,
+        "embedding_model": embedding_model,
+        "num_chunks": len(chunk_map),
+        "dimension": vector_index.d,
+        **layout(vector_index),
+        "bytes_per_vector": round(os.path.getsize(os.path.join(tmp_dir, vector_file)) / max(1, vector_index.ntotal), 1),
+        "saved_at": time.time(),
+    }
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    # 5. Swap folders (a crash between the two renames is repaired by the next load_index)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(cache_dir):
+        os.rename(cache_dir, old_dir)
+    os.rename(tmp_dir, cache_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+    print(f"💾 [Store] Saved {len(chunk_map)} chunks to {cache_dir}")
+    return True
+
+
+def _recover_interrupted_save(cache_dir):
+    """
+    save_index swaps folders with two renames, so a crash between them leaves no
+    cache_dir. Puts back the newest complete copy: the finished temp folder (its
+    manifest is written last), else the previous index.
+    """
+    if os.path.exists(cache_dir):
+        return
+    for candidate in (cache_dir + ".tmp", cache_dir + ".old"):
+        if os.path.exists(os.path.join(candidate, MANIFEST_FILE)):
+            print(f"🩹 [Store] Restoring {candidate} left behind by an interrupted save")
+            os.rename(candidate, cache_dir)
+            return
+
+
+def load_index(cache_dir=INDEX_CACHE, embedding_model=EMBEDDING_MODEL):
+    """
+    Returns (vector_index, bm25_index, chunk_map), or (None, None, {}) when there is
+    no usable cache (missing, older format, or built with another embedding model).
+    """
+    _recover_interrupted_save(cache_dir)
+    manifest_path = os.path.join(cache_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None, None, {}
+
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+
+        if manifest.get("format_version") != INDEX_FORMAT_VERSION:
+            print(f"⚠️ [Store] Ignoring cache with format v{manifest.get('format_version')} (expected v{INDEX_FORMAT_VERSION})")
+            return None, None, {}
+        if manifest.get("embedding_model") != embedding_model:
+            print(f"⚠️ [Store] Ignoring cache built with '{manifest.get('embedding_model')}' (current: '{embedding_model}')")
+            return None, None, {}
+
+        backend = manifest.get("vector_backend", "flat")
+        vector_file = USEARCH_FILE if backend == "usearch" else VECTORS_FILE
+        vector_index = load_vector_index(os.path.join(cache_dir, vector_file), backend,
+                                         manifest.get("vector_storage", "float32"), _read_flags())
+
+        # Same rule as _read_flags: Windows cannot rename or delete a folder with mapped files
+        bm25_index = BM25Index.load(os.path.join(cache_dir, BM25_DIR), mmap=os.name != 'nt')
+
+        chunk_map = {}
+        with open(os.path.join(cache_dir, CHUNKS_FILE), 'r', encoding='utf-8') as f:
+            for i, line in enumerate(f):
+                chunk_map[i] = json.loads(line)
+
+        if vector_index.ntotal != len(chunk_map):
+            print(f"⚠️ [Store] Cache is inconsistent ({vector_index.ntotal} vectors vs {len(chunk_map)} chunks). Ignoring.")
+            return None, None, {}
+
+        saved, wanted = layout(vector_index), configured_layout(vector_index.d)
+        if saved != wanted:
+            # Settings changed since the save: rebuild from the stored vectors, no re-embedding
+            print(f"🔁 [Store] Converting vector index {saved} -> {wanted}...")
+            try:
+                vector_index = convert_vector_index(vector_index, wanted["vector_backend"], wanted["vector_storage"],
+                                                    wanted["embed_reduction"], wanted["reduced_dim"])
+            except ValueError as e:
+                print(f"⚠️ [Store] Keeping the saved layout ({e}). /reset and re-upload to apply the new settings.")
+
+    except Exception as e:
+        print(f"⚠️ [Store] Could not load index cache: {e}")
+        return None, None, {}
+
+    print(f"📂 [Store] Loaded {len(chunk_map)} chunks from {cache_dir}")
+    return vector_index, bm25_index, chunk_map
+
+
+def clear_index(cache_dir=INDEX_CACHE):
+    """Deletes the persisted knowledge base (used by /reset)"""
+    # Leftovers first: load_index would otherwise restore them once cache_dir is gone
+    for path in (cache_dir + ".tmp", cache_dir + ".old", cache_dir):
+        shutil.rmtree(path, ignore_errors=True)
@@ -1,12 +1,20 @@
-import faiss
 import numpy as np
-import ollama
-from rank_bm25 import BM25Okapi
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import re
-from config import EMBEDDING_MODEL
+from config import EMBEDDING_MODEL, BATCH_SIZE, EMBED_MIN_BATCH, EMBED_MAX_BATCH, EMBED_WORKERS, EMBED_TIMEOUT, EMBED_RETRIES
+from config import QUERY_EMBED_CACHE_SIZE, QUERY_EMBED_CACHE_TTL, QUERY_EMBED_WINDOW_MS, QUERY_EMBED_MAX_BATCH, QUERY_EMBED_WORKERS
+from config import EMBED_POOL_CONNECTIONS, EMBED_KEEPALIVE
+from embed_cache import get_embedding_cache
+from bm25_engine import BM25Index
+from vector_store import create_vector_index
+from lru_cache import LRUCache
+from embed_dispatcher import EmbedDispatcher
 
-def to_float16(embed_np):
-    """Helper to convert embeddings to float32 (FAISS requirement)"""
+def to_float32(embed_np):
+    """Helper to convert embeddings to float32 (what the vector index takes as input;
+    compact storage such as fp16 / sq8 is chosen with vector_storage in settings.json)"""
     return embed_np.astype(np.float32)
 
 def simple_tokenize(text):
@@ -22,7 +30,220 @@ def simple_tokenize(text):
     tokens = re.findall(r'\b[a-z0-9]+\b', text.lower())
     return tokens
 
-def build_rag_index(chunks):
+# Own client so embed requests get a timeout (the module-level ollama client has none)
+# and reuse a pool of kept-alive connections (httpx drops idle ones after 5 s by default).
+# Created on first use: importing ollama (and httpx) is a noticeable part of startup.
+_embed_client = None
+_embed_client_lock = threading.Lock()
+
+def get_embed_client():
+    global _embed_client
+    with _embed_client_lock:
+        if _embed_client is None:
+            import ollama
+            import httpx
+            limits = httpx.Limits(max_connections=EMBED_POOL_CONNECTIONS,
+                                  max_keepalive_connections=EMBED_POOL_CONNECTIONS, keepalive_expiry=EMBED_KEEPALIVE)
+            _embed_client = ollama.Client(timeout=EMBED_TIMEOUT, limits=limits)
+        return _embed_client
+
+def _embed_call(batch_text):
+    response = get_embed_client().embed(model=EMBEDDING_MODEL, input=batch_text)
+    return response.get('embeddings', [])
+
+# Repeated questions skip the embedding round-trip
+query_embedding_cache = LRUCache(QUERY_EMBED_CACHE_SIZE, QUERY_EMBED_CACHE_TTL, name="query_embeddings")
+# Concurrent questions share one embed call (see embed_dispatcher.py)
+query_dispatcher = EmbedDispatcher(lambda texts: _embed_call(texts), QUERY_EMBED_WINDOW_MS, QUERY_EMBED_MAX_BATCH,
+                                   QUERY_EMBED_WORKERS)
+
+def embed_query(query):
+    """Returns the (1, dim) float32 embedding of a search query, cached per (model, query)"""
+    def compute():
+        vector = np.asarray(query_dispatcher.embed(query), dtype=np.float32).reshape(1, -1)
+        vector.flags.writeable = False  # shared by every later hit
+        return vector
+    return query_embedding_cache.get_or_compute((EMBEDDING_MODEL, query), compute)
+
+def _is_timeout(error):
+    import httpx  # already loaded by the ollama client that raised
+    return isinstance(error, (TimeoutError, httpx.TimeoutException))
+
+class AdaptiveBatchSize:
+    """
+    Embed batch size learned across calls and jobs: streaming ingestion embeds one
+    slice at a time, and each slice should start where the last one left off
+    instead of paying a full EMBED_TIMEOUT again to rediscover a slow server.
+
+    A timeout halves the size of the batch that timed out (several in-flight
+    failures of one size halve once, not once each) and caps growth below it;
+    the cap is relaxed again after PROBE_AFTER successful batches in a row.
+    """
+    PROBE_AFTER = 64
+
+    def __init__(self, start, low, high):
+        self.low = low
+        self.high = high
+        self.value = min(max(start, low), high)
+        self.ceiling = high
+        self.successes = 0
+        self.lock = threading.Lock()
+
+    def get(self):
+        with self.lock:
+            return self.value
+
+    def succeeded(self):
+        with self.lock:
+            self.successes += 1
+            if self.successes >= self.PROBE_AFTER:
+                self.ceiling = min(self.high, self.ceiling + max(1, self.ceiling // 4))
+                self.successes = 0
+            self.value = min(self.ceiling, self.value + max(1, self.value // 4))
+
+    def timed_out(self, size):
+        with self.lock:
+            self.ceiling = max(self.low, min(self.ceiling, size - 1))
+            self.value = max(self.low, min(self.value, size // 2))
+            self.successes = 0
+            return self.value
+
+embed_batch_size = AdaptiveBatchSize(BATCH_SIZE, EMBED_MIN_BATCH, EMBED_MAX_BATCH)
+
+def _embed_batches(texts, progress_callback=None):
+    """
+    Calls Ollama with up to EMBED_WORKERS requests in flight. Returns a list aligned
+    with texts holding the vector, or None where the text could not be embedded.
+
+    - Batch size grows on every success and halves on a timeout (embed_batch_size:
+      it starts at BATCH_SIZE and carries over to the next call).
+    - A batch that times out is re-cut smaller, and one that comes back with the wrong
+      count is bisected (a bad chunk is isolated in log2(batch) requests), both only
+      while it is larger than EMBED_MIN_BATCH.
+    - Other errors (model not found, bad request) say nothing about the size: the
+      span is retried as it is, and like a span that cannot shrink any further it is
+      given up after EMBED_RETRIES retries. An unreachable server fails it at once.
+    - progress_callback(n_embedded) is called after every successful batch.
+    """
+    vectors = [None] * len(texts)
+    n_embedded = 0
+    next_start = 0
+    retry_spans = deque()   # (start, end, attempts): bisected / retried work goes first
+    in_flight = {}
+
+    def split(start, end, attempts):
+        """Re-queues a span, cut into pieces of at most the current batch size"""
+        batch_size = embed_batch_size.get()
+        pieces = [(s, min(s + batch_size, end), attempts) for s in range(start, end, batch_size)]
+        retry_spans.extendleft(reversed(pieces))
+
+    def retry(start, end, attempts, reason):
+        """Re-queues a span as it is, until it has used up its EMBED_RETRIES"""
+        if attempts < EMBED_RETRIES:
+            retry_spans.append((start, end, attempts + 1))
+        else:
+            print(f"❌ Giving up on chunks {start}-{end} after {attempts + 1} {reason}")
+
+    with ThreadPoolExecutor(max_workers=EMBED_WORKERS) as pool:
+        while next_start < len(texts) or retry_spans or in_flight:
+            # 1. Keep the pool full
+            while len(in_flight) < EMBED_WORKERS and (retry_spans or next_start < len(texts)):
+                if retry_spans:
+                    span = retry_spans.popleft()
+                else:
+                    span = (next_start, min(next_start + embed_batch_size.get(), len(texts)), 0)
+                    next_start = span[1]
+                in_flight[pool.submit(_embed_call, texts[span[0]:span[1]])] = span
+
+            # 2. Handle whatever finished first
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                start, end, attempts = in_flight.pop(future)
+                size = end - start
+                try:
+                    batch_vectors = future.result()
+                except Exception as e:
+                    if _is_timeout(e):
+                        batch_size = embed_batch_size.timed_out(size)
+                        print(f"⏱️ Timeout on batch {start}-{end}. Batch size -> {batch_size}")
+                        if size > EMBED_MIN_BATCH:
+                            split(start, end, attempts)
+                        else:
+                            retry(start, end, attempts, "timeouts")
+                    elif isinstance(e, ConnectionError):
+                        # Server unreachable: retrying every span would only wait longer
+                        print(f"❌ Error embedding batch {start}-{end}: {e}")
+                    else:
+                        print(f"⚠️ Error on batch {start}-{end}: {e}")
+                        retry(start, end, attempts, "errors")
+                    continue
+
+                # CRITICAL CHECK: Ensure we got exactly one vector per text chunk
+                if len(batch_vectors) != size:
+                    if size > EMBED_MIN_BATCH:
+                        print(f"⚠️ Mismatch in Batch {start}: Sent {size}, got {len(batch_vectors)}. Bisecting...")
+                        mid = start + size // 2
+                        retry_spans.extendleft([(mid, end, attempts), (start, mid, attempts)])
+                    else:
+                        print(f"⚠️ Mismatch in Batch {start}: Sent {size}, got {len(batch_vectors)}.")
+                        retry(start, end, attempts, "mismatches")
+                    continue
+
+                vectors[start:end] = batch_vectors
+                embed_batch_size.succeeded()
+                print(f"   -> Successfully indexed batch {start} to {end}")
+                n_embedded += size
+                if progress_callback:
+                    progress_callback(n_embedded)
+
+    return vectors
+
+def _embed_aligned(chunks, progress_callback=None):
+    """
+    Returns a list aligned with chunks holding the vector, or None where the chunk
+    could not be embedded. Vectors come from the embedding cache when possible;
+    only misses go to Ollama. progress_callback(done, total) as batches complete.
+    """
+    cache = get_embedding_cache()
+    vectors = cache.get_many(chunks)
+
+    # --- 1. EMBED ONLY THE CACHE MISSES ---
+    miss_ids = [i for i, vec in enumerate(vectors) if vec is None]
+    hit_count = len(chunks) - len(miss_ids)
+    print(f"🗃️ [EmbedCache] {hit_count}/{len(chunks)} hits ({hit_count / max(len(chunks), 1):.1%}), embedding {len(miss_ids)} chunks")
+    if progress_callback:
+        progress_callback(hit_count, len(chunks))
+
+    if miss_ids:
+        miss_texts = [chunks[i] for i in miss_ids]
+        on_batch = (lambda n: progress_callback(hit_count + n, len(chunks))) if progress_callback else None
+        fresh = _embed_batches(miss_texts, on_batch)
+        done = [(text, vec) for text, vec in zip(miss_texts, fresh) if vec is not None]
+        if done:
+            cache.put_many([t for t, _ in done], [v for _, v in done])
+        for i, vec in zip(miss_ids, fresh):
+            vectors[i] = vec
+    return vectors
+
+def embed_chunks(chunks, progress_callback=None):
+    """
+    Embeds chunks and returns (valid_embeddings, valid_chunks).
+    Chunks that fail to embed are dropped from BOTH lists, so they stay aligned.
+    progress_callback(done, total), if given, is called as batches complete.
+    """
+    vectors = _embed_aligned(chunks, progress_callback)
+
+    # --- KEEP TEXT & VECTORS SYNCED ---
+    valid_embeddings = []
+    valid_chunks = []  # We only keep text if it embeds successfully
+    for chunk, vec in zip(chunks, vectors):
+        if vec is not None:
+            valid_embeddings.append(vec)
+            valid_chunks.append(chunk)
+
+    return valid_embeddings, valid_chunks
+
+def build_rag_index(chunks, progress_callback=None):
     if not chunks:
         print("⚠️ [Indexer] No chunks to index.")
         return None, None, {}
@@ -30,60 +251,24 @@ def build_rag_index(chunks):
     print(f"📊 [Indexer] Processing {len(chunks)} chunks...")
     
     # --- 1. SAFE EMBEDDING LOOP (Keeps Text & Vectors Synced) ---
-    valid_embeddings = []
-    valid_chunks = []  # We only keep text if it embeds successfully
-    
-    BATCH_SIZE = 10  # Reduced batch size to prevent timeouts
-    
-    for i in range(0, len(chunks), BATCH_SIZE):
-        batch_text = chunks[i : i + BATCH_SIZE]
-        try:
-            # Generate Embeddings
-            response = ollama.embed(model=EMBEDDING_MODEL, input=batch_text)
-            batch_vectors = response.get('embeddings', [])
-            
-            # CRITICAL CHECK: Ensure we got exactly one vector per text chunk
-            if len(batch_vectors) != len(batch_text):
-                print(f"⚠️ Mismatch in Batch {i}: Sent {len(batch_text)}, got {len(batch_vectors)}. Retrying one by one...")
-                
-                # FALLBACK: Try one by one to save valid chunks
-                for single_chunk in batch_text:
-                    try:
-                        res = ollama.embed(model=EMBEDDING_MODEL, input=single_chunk)
-                        vec = res.get('embeddings', [])
-                        if vec:
-                            valid_embeddings.extend(vec)
-                            valid_chunks.append(single_chunk)
-                    except:
-                        pass # Skip only the bad chunk
-                continue
-
-            # If successful, add BOTH to the valid lists
-            valid_embeddings.extend(batch_vectors)
-            valid_chunks.extend(batch_text)
-            print(f"   -> Successfully indexed batch {i} to {i+len(batch_text)}")
-            
-        except Exception as e:
-            print(f"❌ Error embedding batch {i}: {e}")
-            # If a batch fails, we skip BOTH text and vector. Alignment preserved.
-            continue
+    valid_embeddings, valid_chunks = embed_chunks(chunks, progress_callback)
 
     if not valid_embeddings:
         print("❌ CRITICAL: No embeddings were generated. Check your Ollama model.")
         return None, None, {}
 
-    # --- 2. BUILD FAISS INDEX ---
+    # --- 2. BUILD VECTOR INDEX (backend from settings.json) ---
     dimension = len(valid_embeddings[0])
     np_embeddings = np.array(valid_embeddings).astype('float32')
     
-    vector_index = faiss.IndexFlatL2(dimension)
+    vector_index = create_vector_index(dimension)
     vector_index.add(np_embeddings)
     
     # --- 3. BUILD KEYWORD INDEX (BM25) ---
     # Use valid_chunks ONLY (to match FAISS IDs)
     print(f"🔤 [Indexer] Building BM25 Index for {len(valid_chunks)} valid docs...")
     tokenized_corpus = [simple_tokenize(doc) for doc in valid_chunks]
-    bm25_index = BM25Okapi(tokenized_corpus)
+    bm25_index = BM25Index.from_tokenized(tokenized_corpus)
 
     # --- 4. BUILD MAPPING ---
     # Map ID -> Text (1:1 relationship is now guaranteed)
@@ -92,4 +277,69 @@ def build_rag_index(chunks):
     print(f"✅ [Indexer] Index built successfully with {len(valid_chunks)} documents.")
     
     # Return the 3 objects app.py expects
-    return vector_index, bm25_index, chunk_map
\ No newline at end of file
+    return vector_index, bm25_index, chunk_map
+
+class IndexBuilder:
+    """
+    Accumulates embedded chunks into a private copy of an index, batch by batch.
+    Used by streaming ingestion: add() as chunks arrive, finish() once at the end.
+    The source index is never mutated, so searches on it stay safe meanwhile.
+
+    Trade-off: every upload pays O(corpus) once, not O(upload). The vector index
+    is copied up front (a full faiss serialize/deserialize or usearch copy; the
+    ExactVectors rescoring store shares its buffer until the first append, which
+    copies it if it is memory-mapped), the chunk map is copied, and finish()
+    merges the BM25 postings in one linear pass. Accepted so queries keep reading
+    immutable snapshots without locks; a segmented index (search base + tail,
+    merge later) would make it O(upload).
+    """
+    def __init__(self, vector_index=None, bm25_index=None, chunk_map=None):
+        self.base_bm25 = bm25_index
+        self.vector_index = vector_index.copy() if vector_index is not None else None
+        self.chunk_map = dict(chunk_map or {})
+        self.new_tokenized = []
+        self.added = 0
+
+    def add(self, chunks, progress_callback=None):
+        """
+        Embeds chunks and appends them (new ids continue after the existing ones).
+        Returns the positions in chunks that were added; the others failed to embed.
+        """
+        vectors = _embed_aligned(chunks, progress_callback)
+        kept = [i for i, vec in enumerate(vectors) if vec is not None]
+        if not kept:
+            return []
+        valid_embeddings = [vectors[i] for i in kept]
+        valid_chunks = [chunks[i] for i in kept]
+
+        # float32 right away: a list of Python floats costs ~8x the memory
+        np_embeddings = np.asarray(valid_embeddings, dtype=np.float32)
+        if self.vector_index is None:
+            self.vector_index = create_vector_index(np_embeddings.shape[1])
+        elif np_embeddings.shape[1] != self.vector_index.d:
+            raise ValueError(f"Embedding dimension {np_embeddings.shape[1]} does not match index dimension {self.vector_index.d}")
+
+        start_id = self.vector_index.ntotal
+        self.vector_index.add(np_embeddings)
+        for offset, txt in enumerate(valid_chunks):
+            self.chunk_map[start_id + offset] = txt
+        self.new_tokenized.extend(simple_tokenize(doc) for doc in valid_chunks)
+        self.added += len(valid_chunks)
+        return kept
+
+    def finish(self):
+        """Returns (vector_index, bm25_index, chunk_map); BM25 statistics are updated once here"""
+        if self.vector_index is None:
+            return None, None, {}
+
+        if self.base_bm25 is None:
+            print(f"🔤 [Indexer] Building BM25 Index for {len(self.chunk_map)} valid docs...")
+            bm25_index = BM25Index.from_tokenized(self.new_tokenized)
+        elif not isinstance(self.base_bm25, BM25Index):
+            # Older rank_bm25 index: rebuild keyword stats once (no re-embedding)
+            bm25_index = BM25Index.from_tokenized([simple_tokenize(self.chunk_map[i]) for i in range(len(self.chunk_map))])
+        else:
+            # Returns a new index; the published one is left untouched
+            bm25_index = self.base_bm25.add_documents(self.new_tokenized)
+
+        return self.vector_index, bm25_index, self.chunk_map
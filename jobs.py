@@ -0,0 +1,113 @@
+"""
+Background Ingestion Jobs
+=========================
+/upload only saves the files and queues a job; a single worker thread does the
+parsing + embedding. Progress is polled through /jobs/<id>, and chats keep being
+answered from the last published index snapshot while a job runs.
+"""
+
+import time
+import uuid
+import queue
+import threading
+import traceback
+from collections import OrderedDict
+
+
+class IngestJob:
+    def __init__(self, files):
+        self.id = uuid.uuid4().hex[:12]
+        self.status = "queued"        # queued -> running -> done | failed
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.files = [{"name": name, "path": path, "status": "queued", "chunks": 0} for name, path in files]
+        self.embedded = 0
+        self.to_embed = 0
+        self.result = {}
+        self.error = None
+        self.lock = threading.Lock()
+
+    # --- Progress hooks (called from the worker thread) ---
+    def file_status(self, index, status, chunks=None):
+        with self.lock:
+            self.files[index]["status"] = status
+            if chunks is not None:
+                self.files[index]["chunks"] = chunks
+
+    def embed_progress(self, done, total):
+        with self.lock:
+            self.embedded, self.to_embed = done, total
+
+    def to_dict(self):
+        with self.lock:
+            now = self.finished_at or time.time()
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "files": [{k: v for k, v in f.items() if k != "path"} for f in self.files],
+                "embedding": {"done": self.embedded, "total": self.to_embed},
+                "elapsed": round(now - (self.started_at or now), 2),
+                "result": self.result,
+                "error": self.error,
+            }
+
+
+class IngestJobQueue:
+    def __init__(self, handler, max_jobs_kept=100):
+        """
+        handler(job) does the actual work and returns a dict stored as job.result.
+        Jobs run one at a time, in submission order, because index writers are serialized anyway.
+        """
+        self.handler = handler
+        self.max_jobs_kept = max_jobs_kept
+        self.jobs = OrderedDict()
+        self.pending = queue.Queue()
+        self.lock = threading.Lock()
+        self.worker = None
+
+    def submit(self, files):
+        job = IngestJob(files)
+        with self.lock:
+            self.jobs[job.id] = job
+            # Forget the oldest finished jobs
+            while len(self.jobs) > self.max_jobs_kept:
+                oldest_id, oldest = next(iter(self.jobs.items()))
+                if oldest.status not in ("done", "failed"):
+                    break
+                del self.jobs[oldest_id]
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._run, name="ingest-worker", daemon=True)
+                self.worker.start()
+        self.pending.put(job)
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def has_active_jobs(self):
+        with self.lock:
+            return any(job.status in ("queued", "running") for job in self.jobs.values())
+
+    def _run(self):
+        while True:
+            job = self.pending.get()
+            with job.lock:
+                job.status = "running"
+                job.started_at = time.time()
+            try:
+                result = self.handler(job) or {}
+                with job.lock:
+                    job.result = result
+                    job.status = "done"
+            except Exception as e:
+                print(f"❌ Ingest job {job.id} failed: {e}")
+                traceback.print_exc()
+                with job.lock:
+                    job.error = str(e)
+                    job.status = "failed"
+            finally:
+                with job.lock:
+                    job.finished_at = time.time()
+                self.pending.task_done()
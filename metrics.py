@@ -0,0 +1,160 @@
+"""
+Pipeline Metrics
+================
+Counters, gauges and histograms rendered in the Prometheus text exposition
+format (version 0.0.4) for the /metrics endpoint, without the prometheus_client
+dependency. Label values are passed as keyword arguments:
+
+    STAGE_SECONDS.observe(0.012, stage="bm25")
+    with STAGE_SECONDS.time(stage="rerank"):
+        ...
+
+Values that already live elsewhere (cache hit counters, index size) are read at
+scrape time by collectors registered with REGISTRY.add_collector().
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds: from a cached lookup (~1 ms) to a long generation (~1 min)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labelnames=(), registry=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}  # label values tuple -> value
+        self.lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self):
+        with self.lock:
+            values = sorted(self.values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, key)} {_number(v)}" for key, v in values]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        super().__init__(name, help, labelnames, registry)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        with self.lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self.values.items())
+        lines = self.header()
+        for key, (counts, total) in values:
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', _number(bound))])} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {counts[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+
+    def add_collector(self, collect):
+        """collect() -> [(name, kind, help, [({label: value}, number), ...]), ...], called on every scrape"""
+        self.collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collect in self.collectors:
+            for name, kind, help, samples in collect():
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+                for labels, value in samples:
+                    lines.append(f"{name}{_labels(labels.keys(), labels.values())} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# --- Pipeline metrics (shared by app_test.py and async_app.py) ---
+STAGE_SECONDS = Histogram(
+    "rag_stage_seconds", "Latency of one pipeline stage (rewrite, query_embed, vector_search, bm25, "
+    "rrf_fusion, rerank, first_token, generation, chat_total)", ["stage"])
+CHAT_REQUESTS = Counter("rag_chat_requests_total", "Chat requests by outcome", ["outcome"])
+GENERATED_TOKENS = Counter("rag_generated_tokens_total", "Streamed answer tokens (stream chunks)")
+TOKENS_PER_SECOND = Histogram("rag_generation_tokens_per_second", "Generation speed after the first token",
+                              buckets=(1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 150, 200))
+INGEST_CHUNKS = Counter("rag_ingest_chunks_total", "Chunks through ingestion by stage (parsed, embedded)", ["stage"])
+INGEST_SECONDS = Counter("rag_ingest_seconds_total", "Seconds spent per ingestion stage (parse, embed)", ["stage"])
+INGEST_THROUGHPUT = Gauge("rag_ingest_chunks_per_second", "Throughput of the last ingest job per stage", ["stage"])
+INGEST_JOB_SECONDS = Histogram("rag_ingest_job_seconds", "Wall time of one ingest job",
+                               buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600))
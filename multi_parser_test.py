@@ -4,14 +4,22 @@ Hybrid PDF Parser (Smart Tables + Lost Text Recovery)
 FIXED VERSION:
 1. Lowers text filter threshold (catches 'Unity', 'Integrity').
 2. Forces visual sorting (sort=True) to keep headers above text.
+3. Splits work across files and page ranges on a process pool (parse_many).
+4. Streaming mode (iter_chunks) yields chunks while later pages are still parsing.
 """
 
-import pymupdf4llm
-import fitz  # PyMuPDF
+# pymupdf4llm / fitz (PyMuPDF) are imported inside the functions that parse: they
+# take about half a second to import, and the web app should not pay that at startup
 import re
 import os
-from typing import List, Dict
+import numpy as np
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import deque
+from typing import List, Dict, Tuple, Iterator
 from dataclasses import dataclass
+from config import PARSE_WORKERS, PARSE_PAGES_PER_TASK
 
 @dataclass
 class ParsedChunk:
@@ -21,71 +29,343 @@ class ParsedChunk:
     content: str
     metadata: Dict
 
+# Above this many (blocks x page chars) the shingle index beats repeated substring scans.
+# Below it, str.__contains__ (C speed) wins (see benchmarks/bench_text_recovery.py).
+RECOVERY_INDEX_THRESHOLD = 10_000_000
+
+class SubstringIndex:
+    """
+    Rolling-hash shingle index over a page's normalized text.
+
+    Every window of SHINGLE chars is hashed once (vectorized) and sorted. A needle is
+    looked up by probing 3 of its own windows (start / middle / end): if any is absent
+    the needle is missing, otherwise only the occurrences of the rarest probe are
+    verified with str.startswith, so hash collisions never cause a false positive.
+    Cost is O(page log page + total needle length) instead of O(needles x page).
+    """
+    SHINGLE = 8
+    MIN_WIDTH = 3
+    BASE = np.uint64(1099511628211)
+
+    def __init__(self, text: str):
+        self.text = text
+        self.codes = self._codes(text)
+        self.tables = {}  # window width -> (sorted hashes, window start positions)
+
+    @staticmethod
+    def _codes(text: str):
+        return np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+
+    def _window_hashes(self, codes, width: int):
+        n = len(codes) - width + 1
+        hashes = np.zeros(max(n, 0), dtype=np.uint64)
+        for j in range(width):
+            hashes = hashes * self.BASE + codes[j:j + n]  # uint64 wrap-around is intended
+        return hashes
+
+    def _table(self, width: int):
+        table = self.tables.get(width)
+        if table is None:
+            hashes = self._window_hashes(self.codes, width)
+            order = np.argsort(hashes, kind='stable')
+            table = self.tables[width] = (hashes[order], order)
+        return table
+
+    def contains_all(self, needles: List[str]) -> List[bool]:
+        """For each needle: is it a substring of the indexed text?"""
+        result = [False] * len(needles)
+        by_width = {}
+        for i, needle in enumerate(needles):
+            if len(needle) < self.MIN_WIDTH or len(needle) > len(self.text):
+                result[i] = needle in self.text
+            else:
+                # Needles shorter than a shingle get a table of their own (exact) length
+                by_width.setdefault(min(len(needle), self.SHINGLE), []).append(i)
+
+        text = self.text
+        for width, ids in by_width.items():
+            hashes, positions = self._table(width)
+            group = [needles[i] for i in ids]
+            lengths = np.fromiter((len(g) for g in group), dtype=np.int64, count=len(group))
+            starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+            all_hashes = self._window_hashes(self._codes(''.join(group)), width)
+
+            # Probe 3 windows per needle (start, middle, end)
+            last = lengths - width
+            offset = np.stack([np.zeros_like(last), last // 2, last], axis=1).ravel()
+            owner = np.repeat(np.arange(len(group)), 3)
+            probes = all_hashes[starts[owner] + offset]
+            lo = np.searchsorted(hashes, probes, 'left')
+            hi = np.searchsorted(hashes, probes, 'right')
+            counts = hi - lo
+
+            # Rarest probe per needle
+            order = np.lexsort((counts, owner))
+            rarest = order[np.searchsorted(owner[order], np.arange(len(group)))]
+
+            for k, w in enumerate(rarest.tolist()):
+                if counts[w] == 0:
+                    continue
+                needle, shift = group[k], int(offset[w])
+                for pos in positions[lo[w]:hi[w]].tolist():
+                    start = pos - shift
+                    if start >= 0 and text.startswith(needle, start):
+                        result[ids[k]] = True
+                        break
+        return result
+
+def _header_info(pdf_path: str):
+    """
+    Legacy mode: the document's header levels (IdentifyHeaders scans every page's font
+    sizes), computed once per file and handed to each range. Without it to_markdown()
+    rescans the whole document for every range: O(pages^2 / pages_per_task).
+    None in layout mode, where the levels are set when the ranges are merged.
+    """
+    import pymupdf4llm
+    if getattr(pymupdf4llm, "_use_layout", False):
+        return None
+    from pymupdf4llm.helpers.pymupdf_rag import IdentifyHeaders
+    return IdentifyHeaders(pdf_path)
+
+def _extract_page_range(pdf_path: str, page_numbers: List[int], hdr_info=None):
+    """
+    Worker task (runs in a child process): smart markdown + raw block texts for a
+    slice of pages. Returns (markdown_part, {page_index: [block_text, ...]}).
+    hdr_info: the file's _header_info(); computed here (for the whole file) if missing.
+    """
+    import fitz  # PyMuPDF
+    import pymupdf4llm
+    from pymupdf4llm.helpers import document_layout
+    raw_blocks = {}
+    with fitz.open(pdf_path) as doc:
+        for i in page_numbers:
+            # FIX #1: Added sort=True to force Reading Order (Header -> Body)
+            raw_blocks[i] = [b[4] for b in doc[i].get_text("blocks", sort=True)]
+
+    if getattr(pymupdf4llm, "_use_layout", False):
+        # Layout mode: header levels depend on font sizes seen across ALL pages, so ship
+        # the parsed layout back and render markdown after the ranges are merged.
+        # Same arguments pymupdf4llm.to_markdown() uses internally.
+        parsed = document_layout.parse_document(pdf_path, pages=page_numbers, force_text=True, use_ocr=True)
+        return parsed, raw_blocks
+
+    # Legacy mode: header levels of the whole document, shared by every range
+    if hdr_info is None:
+        hdr_info = _header_info(pdf_path)
+    return pymupdf4llm.to_markdown(pdf_path, pages=page_numbers, page_chunks=True, hdr_info=hdr_info), raw_blocks
+
+def _merge_markdown(parts) -> List[str]:
+    """Joins per-range results (already in page order) into one markdown text per page"""
+    from pymupdf4llm.helpers import document_layout
+    if parts and isinstance(parts[0], document_layout.ParsedDocument):
+        merged = parts[0]
+        merged.pages = [page for part in parts for page in part.pages]
+        merged.page_count = len(merged.pages)
+        header_fontsizes = {
+            box.max_fontsize
+            for page in merged.pages for box in page.boxes
+            if box.boxclass in ("title", "section-header")
+        }
+        document_layout.update_header_tags(merged.pages, header_fontsizes)
+        md_pages = merged.to_markdown(page_chunks=True)
+    else:
+        md_pages = [md for part in parts for md in part]
+    return [md_data['text'] for md_data in md_pages]
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+def _get_pool(workers: int):
+    """One long-lived process pool: spawning workers (and importing pymupdf4llm) is not free"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers)
+            _pool_workers = workers
+        return _pool
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = None
+
 class SmartMultiColumnParser:
-    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 400):
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 400,
+                 workers: int = PARSE_WORKERS, pages_per_task: int = PARSE_PAGES_PER_TASK):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
         self.chunk_counter = 0
+        self.workers = max(1, workers)
+        self.pages_per_task = max(1, pages_per_task)
 
     def _normalize(self, text):
         """Removes whitespace/formatting for comparison"""
         return re.sub(r'\s+', '', text).lower()
 
+    def _page_ranges(self, pdf_path: str) -> List[List[int]]:
+        import fitz
+        with fitz.open(pdf_path) as doc:
+            page_count = doc.page_count
+        return [list(range(start, min(start + self.pages_per_task, page_count)))
+                for start in range(0, page_count, self.pages_per_task)]
+
     def parse_and_chunk(self, pdf_path: str, verbose: bool = True) -> List[ParsedChunk]:
-        if verbose: print(f"Parsing (Hybrid Mode): {pdf_path}")
-        
-        # 1. Open Doc for Raw Extraction
-        doc = fitz.open(pdf_path)
-        
-        # 2. Get Smart Markdown (Page by Page)
-        md_pages = pymupdf4llm.to_markdown(pdf_path, page_chunks=True)
-        # print("--------------> md_pages", md_pages)
-        
+        return self.parse_many([pdf_path], verbose=verbose)[pdf_path]
+
+    def parse_many(self, pdf_paths: List[str], verbose: bool = True) -> Dict[str, List[ParsedChunk]]:
+        """
+        Parses several PDFs at once. Every file is cut into page ranges and all ranges
+        from all files share one process pool; results are merged back in page order,
+        so chunk ids are identical to a serial parse.
+        """
+        tasks = []  # (pdf_path, page_numbers, hdr_info)
+        for pdf_path in pdf_paths:
+            if verbose: print(f"Parsing (Hybrid Mode): {pdf_path}")
+            hdr_info = _header_info(pdf_path)
+            tasks.extend((pdf_path, pages, hdr_info) for pages in self._page_ranges(pdf_path))
+
+        results = None
+        if self.workers > 1 and len(tasks) > 1:
+            try:
+                pool = _get_pool(self.workers)
+                futures = [pool.submit(_extract_page_range, *task) for task in tasks]
+                results = [f.result() for f in futures]
+            except BrokenProcessPool as e:
+                print(f"⚠️ Parser pool died ({e}). Falling back to serial parsing.")
+                _reset_pool()
+                results = None
+        if results is None:
+            results = [_extract_page_range(*task) for task in tasks]
+
+        # Group per file, keeping page order
+        per_file = {path: ([], {}) for path in pdf_paths}
+        for (path, _, _), (md_part, raw_blocks) in zip(tasks, results):
+            per_file[path][0].append(md_part)
+            per_file[path][1].update(raw_blocks)
+
+        return {
+            path: self._chunk_pages(_merge_markdown(md_parts), raw_blocks, verbose)
+            for path, (md_parts, raw_blocks) in per_file.items()
+        }
+
+    def _recover_lost_text(self, smart_text: str, raw_blocks: List[str]) -> List[str]:
+        """Raw blocks whose (normalized) text does not appear anywhere in the smart markdown"""
+        smart_text_norm = self._normalize(smart_text)
+
+        candidates = []
+        for raw_text in raw_blocks:
+            block_text = raw_text.strip()
+            
+            # FIX #2: Lowered threshold from 10 to 3
+            # This ensures we catch headers like "UNITY" (5 chars) or "Note" (4 chars)
+            if len(block_text) < 3: continue
+            candidates.append(block_text)
+
+        # Check if this block exists in the smart text
+        needles = [self._normalize(block_text) for block_text in candidates]
+        if len(needles) * len(smart_text_norm) > RECOVERY_INDEX_THRESHOLD:
+            # Dense pages: index the page once instead of scanning it once per block
+            found = SubstringIndex(smart_text_norm).contains_all(needles)
+        else:
+            found = [needle in smart_text_norm for needle in needles]
+
+        return [block_text for block_text, present in zip(candidates, found) if not present]
+
+    def _chunk_page(self, smart_text: str, raw_blocks: List[str], page_num: int, verbose: bool) -> List[ParsedChunk]:
+        # --- THE MAGIC: RECOVER LOST TEXT ---
+        missing_text = self._recover_lost_text(smart_text, raw_blocks)
+
+        # Combine: Smart Text + Separator + Recovered Text
+        final_page_content = smart_text
+        if missing_text:
+            recovered_str = "\n".join(missing_text)
+            final_page_content += f"\n\n--- [ADDITIONAL NOTES / SIDEBARS] ---\n{recovered_str}"
+            if verbose:
+                print(f"   + Page {page_num}: Recovered {len(missing_text)} missing text blocks.")
+
+        # --- CHUNKING ---
+        return self._create_sliding_window_chunks(final_page_content, page_num)
+
+    def _chunk_pages(self, md_texts: List[str], raw_blocks: Dict[int, List[str]], verbose: bool) -> List[ParsedChunk]:
         all_chunks = []
         self.chunk_counter = 0
 
-        for i, md_data in enumerate(md_pages):
-            page_num = i + 1
-            smart_text = md_data['text']
-            # print("--------->",smart_text)
-            
-            # --- THE MAGIC: RECOVER LOST TEXT ---
-            raw_page = doc[i]
-            # print("--------->",raw_page)
-            
-            # FIX #1: Added sort=True to force Reading Order (Header -> Body)
-            raw_blocks = raw_page.get_text("blocks", sort=True)
-            # print("--------------> ", raw_blocks)
-            
-            missing_text = []
-            smart_text_norm = self._normalize(smart_text)
-            
-            for b in raw_blocks:
-                block_text = b[4].strip()
-                
-                # FIX #2: Lowered threshold from 10 to 3
-                # This ensures we catch headers like "UNITY" (5 chars) or "Note" (4 chars)
-                if len(block_text) < 3: continue
-                
-                # Check if this block exists in the smart text
-                if self._normalize(block_text) not in smart_text_norm:
-                    missing_text.append(block_text)
-
-            # Combine: Smart Text + Separator + Recovered Text
-            final_page_content = smart_text
-            if missing_text:
-                recovered_str = "\n".join(missing_text)
-                final_page_content += f"\n\n--- [ADDITIONAL NOTES / SIDEBARS] ---\n{recovered_str}"
-                if verbose:
-                    print(f"   + Page {page_num}: Recovered {len(missing_text)} missing text blocks.")
-
-            # --- CHUNKING ---
-            page_chunks = self._create_sliding_window_chunks(final_page_content, page_num)
-            all_chunks.extend(page_chunks)
+        for i, smart_text in enumerate(md_texts):
+            all_chunks.extend(self._chunk_page(smart_text, raw_blocks.get(i, []), i + 1, verbose))
 
         if verbose: print(f"Extracted {len(all_chunks)} chunks (Tables preserved + Text recovered).")
         return all_chunks
 
+    def iter_chunks(self, pdf_paths: List[str], verbose: bool = True) -> Iterator[Tuple[str, ParsedChunk]]:
+        """
+        Streaming parse: yields (pdf_path, chunk) in page order while later page ranges
+        are still being parsed. At most workers + 1 ranges are in flight. The chunks are
+        the same as parse_and_chunk() gives (same header levels, text and ids):
+
+        - legacy pymupdf4llm: every range is rendered with the document's header levels,
+          so its chunks are yielded as soon as the range is done (memory stays flat).
+        - layout mode: header levels come from font sizes seen across ALL pages, so a
+          file's ranges are merged like parse_many() does before its chunks are yielded.
+          Files still stream one after another, and the next file's ranges keep parsing.
+        """
+        tasks = ((path, pages, hdr_info, i == len(ranges) - 1)
+                 for path in pdf_paths
+                 for ranges, hdr_info in [(self._page_ranges(path), _header_info(path))]
+                 for i, pages in enumerate(ranges))
+        pool = _get_pool(self.workers) if self.workers > 1 else None
+        in_flight = deque()  # (path, pages, hdr_info, last range of the file, future or None)
+
+        def fill():
+            while len(in_flight) < self.workers + 1:
+                task = next(tasks, None)
+                if task is None:
+                    return
+                path, pages, hdr_info, last = task
+                future = pool.submit(_extract_page_range, path, pages, hdr_info) if pool else None
+                in_flight.append((path, pages, hdr_info, last, future))
+
+        current_path = None
+        n_chunks = 0
+        md_parts, raw_blocks = [], {}  # the current file's ranges not chunked yet
+        fill()
+        while in_flight:
+            path, pages, hdr_info, last, future = in_flight.popleft()
+            try:
+                md_part, range_blocks = future.result() if future else _extract_page_range(path, pages, hdr_info)
+            except BrokenProcessPool as e:
+                print(f"⚠️ Parser pool died ({e}). Parsing this range in-process.")
+                _reset_pool()
+                pool = None
+                md_part, range_blocks = _extract_page_range(path, pages, hdr_info)
+            fill()  # keep the pool busy while this range is chunked
+
+            if path != current_path:
+                if verbose: print(f"Parsing (Streaming Mode): {path}")
+                current_path, n_chunks = path, 0
+                md_parts, raw_blocks = [], {}
+                self.chunk_counter = 0
+
+            md_parts.append(md_part)
+            raw_blocks.update(range_blocks)
+            if not last and not isinstance(md_part, list):
+                continue  # layout mode: wait for the rest of the file
+
+            first_page = min(raw_blocks)
+            for offset, smart_text in enumerate(_merge_markdown(md_parts)):
+                page_idx = first_page + offset
+                for chunk in self._chunk_page(smart_text, raw_blocks.get(page_idx, []), page_idx + 1, verbose):
+                    n_chunks += 1
+                    yield path, chunk
+            md_parts, raw_blocks = [], {}
+
+            if last and verbose:
+                print(f"Extracted {n_chunks} chunks (Tables preserved + Text recovered).")
+
     def _create_sliding_window_chunks(self, text: str, page_num: int) -> List[ParsedChunk]:
         """Standard sliding window chunker"""
         chunks = []
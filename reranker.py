@@ -0,0 +1,160 @@
+"""
+Cascade Reranker
+================
+Two cross-encoder stages over the fused (RRF) candidates of a query:
+
+    1. prune    TinyBERT-L-2 scores every candidate, the best `prune_keep` survive
+    2. rescore  MiniLM-L-12 scores only the survivors and decides the final order
+
+plus two shortcuts:
+
+    early exit   when the fused #1 already leads the runner-up by `early_exit_gap`
+                 (relative), the candidate order is trusted and MiniLM is skipped
+    score cache  (model, query, chunk text) -> score, so a repeated or rewritten-
+                 to-the-same question never runs a model twice on the same pair
+
+Models load lazily on first use (or via warm_up()), behind a lock. A stage whose
+model cannot be loaded (e.g. the ONNX file is missing from RERANK_MODEL_DIR and
+there is no network to download it) is switched off with a warning: no prune
+stage means MiniLM scores every candidate, no MiniLM means the prune scores (or
+the fused order) decide. Every call returns per-stage timings; stats() sums them.
+"""
+
+import os
+import time
+import hashlib
+import threading
+from lru_cache import LRUCache
+
+
+class CascadeReranker:
+    def __init__(self, model="ms-marco-MiniLM-L-12-v2", fast_model="ms-marco-TinyBERT-L-2-v2",
+                 model_dir=None, prune_keep=8, early_exit_gap=0.5, cache_size=20000):
+        self.model = model
+        self.fast_model = fast_model      # "" = no prune stage
+        self.model_dir = model_dir        # looked at before flashrank's own cache / download
+        self.prune_keep = prune_keep
+        self.early_exit_gap = early_exit_gap  # <= 0 disables the early exit
+        self.scores = LRUCache(cache_size, name="rerank_scores")
+        self.rankers = {}                 # model name -> Ranker, or None if it failed to load
+        self.load_lock = threading.Lock()
+        self.lock = threading.Lock()
+        self.totals = {"queries": 0, "early_exits": 0, "pairs_scored": 0, "prune_ms": 0.0, "rescore_ms": 0.0}
+
+    # --- Model loading ---
+    def _ranker(self, name):
+        if not name:
+            return None
+        if name in self.rankers:
+            return self.rankers[name]
+        with self.load_lock:
+            if name not in self.rankers:
+                self.rankers[name] = self._load(name)
+        return self.rankers[name]
+
+    def _load(self, name):
+        from flashrank import Ranker  # onnxruntime + tokenizers: only paid when a model is needed
+        start = time.perf_counter()
+        # Only models already unpacked in model_dir: a missing folder would make flashrank download into it
+        local = self.model_dir and os.path.isdir(os.path.join(self.model_dir, name))
+        attempts = [{"cache_dir": self.model_dir}] if local else []
+        attempts.append({})  # flashrank's default cache dir, downloads the model if missing
+        for kwargs in attempts:
+            try:
+                ranker = Ranker(model_name=name, **kwargs)
+                print(f"✓ Loaded reranker {name} in {time.perf_counter() - start:.2f}s")
+                return ranker
+            except Exception as e:
+                print(f"⚠️ Reranker {name} not available from {kwargs.get('cache_dir') or 'default cache'}: {e}")
+        print(f"⚠️ Reranker {name} disabled for this run")
+        return None
+
+    def warm_up(self):
+        """Loads both models now instead of on the first query"""
+        self._ranker(self.fast_model)
+        self._ranker(self.model)
+
+    def loaded(self):
+        """{model name: True / False (failed)} for every model loaded so far"""
+        return {name: ranker is not None for name, ranker in list(self.rankers.items())}
+
+    # --- Scoring ---
+    def _score(self, name, query, passages):
+        """{id: score} for the passages; only pairs missing from the cache reach the model (in one batch)"""
+        from flashrank import RerankRequest
+        query_key = hashlib.sha1(query.encode("utf-8")).hexdigest()
+        keys = {p["id"]: (name, query_key, hashlib.sha1(p["text"].encode("utf-8")).hexdigest()) for p in passages}
+        scores, missing = {}, []
+        for p in passages:
+            score = self.scores.get(keys[p["id"]])
+            if score is None:
+                missing.append(p)
+            else:
+                scores[p["id"]] = score
+        if missing:
+            # Ranker.rerank annotates and sorts the list it gets, so hand it copies
+            batch = [{"id": p["id"], "text": p["text"], "meta": {}} for p in missing]
+            for result in self._ranker(name).rerank(RerankRequest(query=query, passages=batch)):
+                score = float(result["score"])
+                scores[result["id"]] = score
+                self.scores.put(keys[result["id"]], score)
+        return scores, len(missing)
+
+    def _decisive(self, fused):
+        if self.early_exit_gap <= 0 or len(fused) < 2:
+            return False
+        top, runner_up = fused[0], fused[1]
+        return top > 0 and (top - runner_up) / top >= self.early_exit_gap
+
+    def rerank(self, query, passages, fused_scores, top_k=5):
+        """
+        passages: [{"id", "text"}] in fused order, fused_scores: their RRF scores.
+        Returns ([{"id", "text", "score"}] best first, at most top_k, info dict with
+        the stage timings, pairs sent to each model and whether it exited early).
+        """
+        info = {"candidates": len(passages), "early_exit": False, "prune_ms": 0.0, "rescore_ms": 0.0,
+                "pruned_to": len(passages), "scored": {}}
+        scores = {p["id"]: float(s) for p, s in zip(passages, fused_scores)}
+        survivors = list(passages)
+
+        # 1. Prune: only worth it when there is more than prune_keep to choose from
+        fast = self._ranker(self.fast_model) if len(survivors) > max(self.prune_keep, top_k) else None
+        if fast is not None:
+            start = time.perf_counter()
+            fast_scores, info["scored"][self.fast_model] = self._score(self.fast_model, query, survivors)
+            survivors.sort(key=lambda p: fast_scores[p["id"]], reverse=True)
+            survivors = survivors[:max(self.prune_keep, top_k)]
+            scores = fast_scores
+            info["prune_ms"] = (time.perf_counter() - start) * 1000
+            info["pruned_to"] = len(survivors)
+
+        # 2. Rescore the survivors, unless retrieval already has a clear winner
+        if self._decisive(list(fused_scores)):
+            info["early_exit"] = True
+            # The fused #1 keeps its place; the rest follow the prune order
+            survivors = [passages[0]] + [p for p in survivors if p is not passages[0]]
+        elif self._ranker(self.model) is not None:
+            start = time.perf_counter()
+            scores, info["scored"][self.model] = self._score(self.model, query, survivors)
+            survivors.sort(key=lambda p: scores[p["id"]], reverse=True)
+            info["rescore_ms"] = (time.perf_counter() - start) * 1000
+
+        results = [{"id": p["id"], "text": p["text"], "score": scores[p["id"]]} for p in survivors[:top_k]]
+
+        with self.lock:
+            self.totals["queries"] += 1
+            self.totals["early_exits"] += info["early_exit"]
+            self.totals["pairs_scored"] += sum(info["scored"].values())
+            self.totals["prune_ms"] += info["prune_ms"]
+            self.totals["rescore_ms"] += info["rescore_ms"]
+        return results, info
+
+    def stats(self):
+        with self.lock:
+            totals = dict(self.totals)
+        queries = totals["queries"] or 1
+        totals["avg_prune_ms"] = round(totals.pop("prune_ms") / queries, 3)
+        totals["avg_rescore_ms"] = round(totals.pop("rescore_ms") / queries, 3)
+        totals["score_cache"] = self.scores.stats()
+        totals["models"] = self.loaded()
+        return totals
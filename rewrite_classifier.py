@@ -0,0 +1,69 @@
+"""
+Rewrite Classifier
+==================
+Decides, without calling a model, whether a follow-up question needs the
+rewrite_query LLM call before retrieval:
+
+    SKIP     -> the question stands on its own ("What was Q4 revenue in FY22?")
+    REWRITE  -> it leans on the conversation ("and for FY21?", "what does it cover?")
+    UNCLEAR  -> search the raw question while the rewrite runs (see app_test.retrieve_for_chat)
+
+Signals: references to something earlier (pronouns, "the same", "above"),
+elliptical openers ("and ...", "what about ..."), very short fragments, and
+how many of the question's content words the history already explains.
+"""
+
+import re
+
+SKIP, REWRITE, UNCLEAR = "skip", "rewrite", "unclear"
+
+# Words that point back into the conversation
+REFERENCES = {
+    "it", "its", "they", "them", "their", "theirs", "he", "him", "his", "she", "her", "hers",
+    "this", "that", "these", "those", "there", "then", "same", "above", "previous", "former",
+    "latter", "aforementioned", "earlier", "else", "one", "ones",
+}
+# Openers that continue the previous question instead of asking a new one
+ELLIPTICAL_OPENERS = (
+    "and ", "or ", "but ", "also ", "so ", "then ", "what about", "how about", "what else",
+    "why not", "why so", "and what", "same for", "ok and", "okay and",
+)
+STOP_WORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "been", "do", "does", "did", "of", "in",
+    "on", "at", "to", "for", "from", "by", "with", "and", "or", "but", "what", "which", "who",
+    "whom", "how", "why", "when", "where", "can", "could", "would", "should", "will", "i", "me",
+    "my", "we", "our", "you", "your", "about", "tell", "please", "give", "show", "explain",
+}
+
+
+def _words(text):
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+def classify(question, history):
+    """Returns SKIP, REWRITE or UNCLEAR for the question given the chat history"""
+    if not history:
+        return SKIP
+
+    words = _words(question)
+    content = [w for w in words if w not in STOP_WORDS and w not in REFERENCES]
+    references = [w for w in words if w in REFERENCES]
+    opener = question.lower().lstrip()
+
+    # 1. Clear follow-ups
+    if opener.startswith(ELLIPTICAL_OPENERS):
+        return REWRITE
+    if references and len(content) <= 2:
+        return REWRITE
+    if len(content) <= 1:
+        return REWRITE  # "why?", "and revenue?", "more details"
+
+    if not references:
+        return SKIP  # own keywords, nothing pointing back
+
+    # 2. Something points back: is the question mostly about what was just discussed?
+    recent = set()
+    for msg in history[-4:]:
+        recent.update(_words(msg["content"]))
+    overlap = sum(w in recent for w in content) / len(content)
+    return REWRITE if overlap >= 0.5 else UNCLEAR
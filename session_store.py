@@ -0,0 +1,110 @@
+"""
+Session Store
+=============
+Conversation history per chat session instead of one list shared by every
+user. Bounded three ways:
+
+    max_turns      question/answer pairs kept per session (older ones drop off)
+    max_sessions   sessions kept at all; the least recently used goes first
+    max_bytes      characters of history across all sessions (the memory ceiling),
+                   again evicting the least recently used sessions, then the
+                   oldest turns of the session being written if it alone is over
+
+plus idle_ttl: sessions unused for that many seconds are dropped on the next
+write. A session's history is an immutable tuple that is replaced on every
+turn, so readers (rewrite, classifier, the speculative search thread) take it
+without a lock and never see a half-appended turn.
+"""
+
+import time
+import uuid
+import threading
+from collections import OrderedDict
+
+MAX_SESSION_ID = 64
+
+
+def new_session_id():
+    return uuid.uuid4().hex
+
+
+def valid_session_id(session_id):
+    return isinstance(session_id, str) and 0 < len(session_id) <= MAX_SESSION_ID and session_id.isprintable()
+
+
+class SessionStore:
+    def __init__(self, max_turns=5, max_sessions=1000, idle_ttl=3600, max_bytes=64 * 1024 * 1024):
+        self.max_turns = max_turns
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl      # seconds, <= 0 = never idle out
+        self.max_bytes = max_bytes
+        self.sessions = OrderedDict()  # id -> (last_used, history tuple, size), least recently used first
+        self.total_bytes = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _size(history):
+        return sum(len(msg["content"]) for msg in history)
+
+    def history(self, session_id):
+        """The session's messages ([{"role", "content"}, ...] oldest first), empty for an unknown id"""
+        with self.lock:
+            entry = self.sessions.get(session_id)
+            if entry is None:
+                return ()
+            self.sessions[session_id] = (time.monotonic(), entry[1], entry[2])
+            self.sessions.move_to_end(session_id)
+            return entry[1]
+
+    def append_turn(self, session_id, question, answer):
+        turn = ({"role": "user", "content": question}, {"role": "assistant", "content": answer})
+        with self.lock:
+            _, history, size = self.sessions.pop(session_id, (0, (), 0))
+            history = (history + turn)[-2 * self.max_turns:] if self.max_turns > 0 else ()
+            new_size = self._size(history)
+            self.sessions[session_id] = (time.monotonic(), history, new_size)
+            self.total_bytes += new_size - size
+            self._evict(keep=session_id)
+
+    def _evict(self, keep):
+        now = time.monotonic()
+        while self.sessions:
+            oldest, (last_used, _, size) = next(iter(self.sessions.items()))
+            over = (len(self.sessions) > self.max_sessions or self.total_bytes > self.max_bytes
+                    or (self.idle_ttl > 0 and now - last_used > self.idle_ttl))
+            if not over or oldest == keep:
+                break
+            del self.sessions[oldest]
+            self.total_bytes -= size
+            self.evictions += 1
+        if self.total_bytes > self.max_bytes and keep in self.sessions:
+            self._trim(keep)
+
+    def _trim(self, session_id):
+        """Drops the session's oldest turns until the store fits in max_bytes again"""
+        last_used, history, size = self.sessions[session_id]
+        budget = self.max_bytes - (self.total_bytes - size)
+        new_size = size
+        while history and new_size > budget:
+            new_size -= self._size(history[:2])
+            history = history[2:]
+        self.sessions[session_id] = (last_used, history, new_size)
+        self.total_bytes += new_size - size
+
+    def clear(self, session_id=None):
+        """Forgets one session, or all of them"""
+        with self.lock:
+            if session_id is None:
+                self.sessions.clear()
+                self.total_bytes = 0
+            elif session_id in self.sessions:
+                self.total_bytes -= self.sessions.pop(session_id)[2]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "sessions": len(self.sessions),
+                "bytes": self.total_bytes,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,43 @@
+"""
+Streaming and batch parsing must index the same chunks: /upload uses
+iter_chunks(), the evaluator and benchmarks use parse_and_chunk().
+"""
+
+import os
+import pytest
+
+from multi_parser_test import SmartMultiColumnParser
+
+INPUT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "input_files")
+SAMPLE_PDFS = sorted(f for f in os.listdir(INPUT_DIR) if f.lower().endswith(".pdf")) if os.path.isdir(INPUT_DIR) else []
+
+
+def as_tuples(chunks):
+    return [(c.id, c.page_num, c.chunk_type, c.content) for c in chunks]
+
+
+@pytest.mark.skipif(not SAMPLE_PDFS, reason="no sample PDFs in input_files/")
+@pytest.mark.parametrize("pdf_name", SAMPLE_PDFS)
+def test_iter_chunks_matches_parse_and_chunk(pdf_name):
+    pdf_path = os.path.join(INPUT_DIR, pdf_name)
+    # Small ranges so every document is split across several tasks
+    parser = SmartMultiColumnParser(chunk_size=1000, chunk_overlap=400, pages_per_task=2)
+
+    batch = parser.parse_and_chunk(pdf_path, verbose=False)
+    streamed = [chunk for _, chunk in parser.iter_chunks([pdf_path], verbose=False)]
+
+    assert as_tuples(streamed) == as_tuples(batch)
+
+
+@pytest.mark.skipif(len(SAMPLE_PDFS) < 2, reason="needs two sample PDFs")
+def test_iter_chunks_keeps_files_apart():
+    paths = [os.path.join(INPUT_DIR, name) for name in SAMPLE_PDFS[:2]]
+    parser = SmartMultiColumnParser(pages_per_task=2)
+
+    batch = parser.parse_many(paths, verbose=False)
+    streamed = {path: [] for path in paths}
+    for path, chunk in parser.iter_chunks(paths, verbose=False):
+        streamed[path].append(chunk)
+
+    for path in paths:
+        assert as_tuples(streamed[path]) == as_tuples(batch[path])
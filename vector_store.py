@@ -0,0 +1,501 @@
+"""
+Vector Index Backends
+=====================
+One small interface over the nearest-neighbour libraries, selected with
+"vector_backend" in settings.json:
+
+    flat     -> exact scan, best below ~100k chunks
+    hnsw     -> faiss HNSW graph, ~log(N) per query, no training
+    ivf      -> faiss inverted lists, trained once VECTOR_TRAIN_MIN vectors exist
+    usearch  -> usearch HNSW (optional dependency)
+
+and "vector_storage" for the per-vector codes (768-dim nomic-embed-text):
+
+    float32  -> 3072 bytes, exact
+    fp16     -> 1536 bytes, practically exact
+    sq8      ->  768 bytes, int8 scalar quantization
+    pq       ->   96 bytes, product quantization (PQ_M sub-quantizers, faiss only;
+                usearch gets sq8 instead)
+
+Codes that need training (IVF, SQ8, PQ) are kept in an exact flat buffer until
+VECTOR_TRAIN_MIN vectors arrived, then the real index is trained on them once.
+For the lossy codes (sq8, pq) the float32 vectors are also written next to the
+index and memory-mapped, and the top k * RESCORE_FACTOR candidates are re-ranked
+on them, which brings recall back for a few row reads per query.
+
+"embed_reduction" (matryoshka | pca) with "embed_reduced_dim" projects vectors
+down before any of the above (e.g. 768 -> 256); queries get the same projection.
+
+Every backend stores L2-normalised vectors and ranks by inner product, i.e. cosine
+similarity. search() returns (similarities, ids) shaped (n_queries, k), with -1
+where fewer than k results exist, like faiss.
+"""
+
+import os
+import numpy as np
+import faiss
+from config import (VECTOR_BACKEND, VECTOR_STORAGE, HNSW_M, HNSW_EF_CONSTRUCTION, HNSW_EF_SEARCH,
+                    IVF_NLIST, IVF_NPROBE, PQ_M, RESCORE_FACTOR, VECTOR_TRAIN_MIN,
+                    EMBED_REDUCTION, EMBED_REDUCED_DIM)
+
+try:
+    from usearch.index import Index as UsearchIndex, Matches
+except ImportError:
+    UsearchIndex = None
+
+BACKENDS = ("flat", "hnsw", "ivf", "usearch")
+STORAGES = ("float32", "fp16", "sq8", "pq")
+LOSSY_STORAGES = ("sq8", "pq")
+REDUCTIONS = ("none", "matryoshka", "pca")
+USEARCH_DTYPES = {"float32": "f32", "fp16": "f16", "sq8": "i8"}
+EXACT_SUFFIX = ".exact.f32"
+PROJECTION_SUFFIX = ".projection.npz"
+
+
+def normalize(vectors):
+    """float32 rows scaled to unit length (zero rows are left as they are)"""
+    vectors = np.array(vectors, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class ExactVectors:
+    """
+    Append-only float32 copy of the vectors, used to re-score compressed results.
+    copy() shares the buffer: a copy only appends past the rows the original can
+    see, so the original (a published snapshot) is never affected.
+    """
+    def __init__(self, d, data=None, n=0):
+        self.d = d
+        self.data = data if data is not None else np.zeros((0, d), dtype=np.float32)
+        self.n = n
+
+    def copy(self):
+        return ExactVectors(self.d, self.data, self.n)
+
+    def add(self, vectors):
+        needed = self.n + len(vectors)
+        # Memory-mapped rows are read-only: the first append moves them to a growable buffer
+        if needed > len(self.data) or not self.data.flags.writeable:
+            grown = np.empty((max(needed, 2 * len(self.data), 1024), self.d), dtype=np.float32)
+            grown[:self.n] = self.data[:self.n]
+            self.data = grown
+        self.data[self.n:needed] = vectors
+        self.n = needed
+
+    def rows(self, ids):
+        return self.data[ids]
+
+    def save(self, path):
+        np.ascontiguousarray(self.data[:self.n]).tofile(path)
+        if os.name != 'nt' and self.n:
+            # Serve from the saved file from now on: the rows leave RAM, the page cache keeps the hot ones
+            self.data = np.memmap(path, dtype=np.float32, mode='r', shape=(self.n, self.d))
+
+    @classmethod
+    def load(cls, path, d, mmap=True):
+        n = os.path.getsize(path) // (4 * d)
+        if not n:
+            return cls(d)
+        if mmap:
+            return cls(d, np.memmap(path, dtype=np.float32, mode='r', shape=(n, d)), n)
+        return cls(d, np.fromfile(path, dtype=np.float32).reshape(n, d), n)
+
+
+def _rescore(exact, queries, sims, ids, k):
+    """Re-ranks each row of candidate ids by exact inner product and keeps the best k"""
+    out_sims = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    out_ids = np.full((len(queries), k), -1, dtype=np.int64)
+    for row, query in enumerate(queries):
+        candidates = ids[row][ids[row] >= 0]
+        if not len(candidates):
+            continue
+        exact_sims = exact.rows(np.sort(candidates)) @ query   # sorted ids = sequential reads on a memmap
+        order = np.argsort(-exact_sims)[:k]
+        out_sims[row, :len(order)] = exact_sims[order]
+        out_ids[row, :len(order)] = np.sort(candidates)[order]
+    return out_sims, out_ids
+
+
+class FaissVectorIndex:
+    """flat / hnsw / ivf on top of faiss, with float32 / fp16 / sq8 / pq codes"""
+    def __init__(self, d, backend="flat", storage="float32", rescore_factor=RESCORE_FACTOR, index=None, exact=None):
+        self.d = d
+        self.backend = backend
+        self.storage = storage
+        self.rescore_factor = rescore_factor if storage in LOSSY_STORAGES else 0
+        if exact is None and self.rescore_factor:
+            exact = ExactVectors(d)
+        self.exact = exact
+        self.index = index if index is not None else self._new_index()
+        self._apply_search_params()
+
+    def _pq_m(self):
+        """Sub-quantizer count must divide the dimension"""
+        m = min(PQ_M or self.d // 8, self.d)
+        while self.d % m:
+            m -= 1
+        return m
+
+    def _factory_string(self, n):
+        codec = {"float32": "Flat", "fp16": "SQfp16", "sq8": "SQ8", "pq": f"PQ{self._pq_m()}"}[self.storage]
+        if self.backend == "hnsw":
+            return f"HNSW{HNSW_M},{codec}"
+        if self.backend == "ivf":
+            nlist = IVF_NLIST or int(4 * np.sqrt(n))
+            nlist = max(1, min(nlist, n // 39))  # faiss wants ~39 training points per list
+            return f"IVF{nlist},{codec}"
+        return codec
+
+    def _build(self, n):
+        index = faiss.index_factory(self.d, self._factory_string(n), faiss.METRIC_INNER_PRODUCT)
+        if isinstance(index, faiss.IndexHNSW):
+            index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        return index
+
+    def _new_index(self):
+        index = self._build(VECTOR_TRAIN_MIN)
+        if index.is_trained:
+            return index
+        # A quantizer trained on the first few hundred vectors is useless: buffer exactly until then
+        return faiss.IndexFlatIP(self.d)
+
+    @property
+    def is_buffering(self):
+        return isinstance(self.index, faiss.IndexFlat) and self._factory_string(self.index.ntotal) != "Flat"
+
+    def _apply_search_params(self):
+        """Search-time knobs come from the current settings, not from whenever the index was saved"""
+        if isinstance(self.index, faiss.IndexHNSW):
+            self.index.hnsw.efSearch = HNSW_EF_SEARCH
+        ivf = faiss.try_extract_index_ivf(self.index)
+        if ivf is not None:
+            ivf.nprobe = min(IVF_NPROBE, ivf.nlist)
+
+    def _train(self):
+        """Moves everything from the flat buffer into a freshly trained index"""
+        n = self.index.ntotal
+        target = self._build(n)
+        print(f"🧭 [VectorIndex] Training '{self._factory_string(n)}' on {n} vectors...")
+        vectors = self.index.reconstruct_n(0, n)
+        target.train(vectors)
+        target.add(vectors)
+        self.index = target
+        self._apply_search_params()
+
+    @property
+    def ntotal(self):
+        return self.index.ntotal
+
+    def add(self, vectors):
+        vectors = normalize(vectors)
+        self.index.add(vectors)
+        if self.exact is not None:
+            self.exact.add(vectors)
+        if self.is_buffering and self.index.ntotal >= VECTOR_TRAIN_MIN:
+            self._train()
+
+    def search(self, queries, k):
+        queries = normalize(queries)
+        if self.exact is None or self.is_buffering:
+            return self.index.search(queries, k)
+        sims, ids = self.index.search(queries, k * self.rescore_factor)
+        return _rescore(self.exact, queries, sims, ids, k)
+
+    def reconstruct_all(self):
+        if self.exact is not None:
+            return np.array(self.exact.data[:self.exact.n])
+        if faiss.try_extract_index_ivf(self.index) is not None:
+            self.index.make_direct_map()
+        return self.index.reconstruct_n(0, self.index.ntotal)
+
+    def bytes_per_vector(self):
+        """RAM held by the index codes (+ graph / lists), per vector; exact rows live on disk"""
+        return len(faiss.serialize_index(self.index)) / max(1, self.index.ntotal)
+
+    def copy(self):
+        """Independent copy that owns its memory (a memory-mapped index cannot be appended to)"""
+        return FaissVectorIndex(self.d, self.backend, self.storage, self.rescore_factor,
+                                faiss.deserialize_index(faiss.serialize_index(self.index)),
+                                self.exact.copy() if self.exact is not None else None)
+
+    def save(self, path):
+        faiss.write_index(self.index, path)
+        if self.exact is not None:
+            self.exact.save(path + EXACT_SUFFIX)
+
+    @classmethod
+    def load(cls, path, backend, storage="float32", rescore_factor=RESCORE_FACTOR, io_flags=0):
+        index = faiss.read_index(path, io_flags)
+        exact = None
+        if os.path.exists(path + EXACT_SUFFIX):
+            exact = ExactVectors.load(path + EXACT_SUFFIX, index.d, mmap=io_flags != 0)
+        return cls(index.d, backend, storage, rescore_factor, index, exact)
+
+
+class UsearchVectorIndex:
+    """HNSW from usearch (f32 / f16 / i8 codes); keys are the chunk ids"""
+    backend = "usearch"
+
+    def __init__(self, d, storage="float32", rescore_factor=RESCORE_FACTOR, index=None, exact=None):
+        if UsearchIndex is None:
+            raise ImportError("vector_backend 'usearch' needs the usearch package (pip install usearch)")
+        if storage not in USEARCH_DTYPES:
+            raise ValueError(f"usearch has no '{storage}' codes (use one of {', '.join(USEARCH_DTYPES)})")
+        self.d = d
+        self.storage = storage
+        self.rescore_factor = rescore_factor if storage in LOSSY_STORAGES else 0
+        if exact is None and self.rescore_factor:
+            exact = ExactVectors(d)
+        self.exact = exact
+        self.index = index if index is not None else UsearchIndex(
+            ndim=d, metric='ip', dtype=USEARCH_DTYPES[storage], connectivity=HNSW_M,
+            expansion_add=HNSW_EF_CONSTRUCTION, expansion_search=HNSW_EF_SEARCH)
+
+    @property
+    def ntotal(self):
+        return len(self.index)
+
+    def add(self, vectors):
+        vectors = normalize(vectors)
+        start = len(self.index)
+        self.index.add(np.arange(start, start + len(vectors)), vectors)
+        if self.exact is not None:
+            self.exact.add(vectors)
+
+    def _search(self, queries, k):
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        sims = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        matches = self.index.search(queries, k)
+        if isinstance(matches, Matches):
+            matches = [matches]
+        for row, match in enumerate(matches):
+            n = len(match.keys)
+            ids[row, :n] = match.keys
+            sims[row, :n] = 1.0 - match.distances  # usearch "ip" distance is 1 - dot
+        return sims, ids
+
+    def search(self, queries, k):
+        queries = normalize(queries)
+        if self.exact is None:
+            return self._search(queries, k)
+        sims, ids = self._search(queries, k * self.rescore_factor)
+        return _rescore(self.exact, queries, sims, ids, k)
+
+    def reconstruct_all(self):
+        if self.exact is not None:
+            return np.array(self.exact.data[:self.exact.n])
+        return np.asarray(self.index.get(np.arange(len(self.index))), dtype=np.float32)
+
+    def bytes_per_vector(self):
+        return self.index.serialized_length / max(1, len(self.index))
+
+    def copy(self):
+        return UsearchVectorIndex(self.d, self.storage, self.rescore_factor, self.index.copy(),
+                                  self.exact.copy() if self.exact is not None else None)
+
+    def save(self, path):
+        self.index.save(path)
+        if self.exact is not None:
+            self.exact.save(path + EXACT_SUFFIX)
+
+    @classmethod
+    def load(cls, path, storage="float32", rescore_factor=RESCORE_FACTOR, mmap=True):
+        index = UsearchIndex.restore(path, view=mmap)
+        index.expansion_search = HNSW_EF_SEARCH
+        exact = None
+        if os.path.exists(path + EXACT_SUFFIX):
+            exact = ExactVectors.load(path + EXACT_SUFFIX, index.ndim, mmap=mmap)
+        return cls(index.ndim, storage, rescore_factor, index, exact)
+
+
+class Projection:
+    """
+    Maps full-width embeddings to `dim` dims before they reach the index:
+        matryoshka -> keep the first `dim` coordinates (for models trained for it, like nomic-embed-text v1.5)
+        pca        -> project on the top `dim` principal components, fitted once on the corpus
+    Outputs are re-normalised, so inner product stays cosine similarity.
+    """
+    def __init__(self, method, dim, input_dim, mean=None, components=None):
+        self.method = method
+        self.dim = dim
+        self.input_dim = input_dim
+        self.mean = mean
+        self.components = components
+
+    @property
+    def is_fitted(self):
+        return self.method == "matryoshka" or self.components is not None
+
+    def copy(self):
+        return Projection(self.method, self.dim, self.input_dim, self.mean, self.components)
+
+    def fit(self, vectors):
+        vectors = normalize(vectors)
+        self.mean = vectors.mean(axis=0)
+        centered = vectors - self.mean
+        # Eigenvectors of the d x d covariance: O(n d^2), never an n x n matrix
+        _, eigvecs = np.linalg.eigh(centered.T @ centered)
+        self.components = np.ascontiguousarray(eigvecs[:, ::-1][:, :self.dim].T, dtype=np.float32)
+
+    def apply(self, vectors):
+        vectors = normalize(vectors)
+        if self.method == "matryoshka":
+            return normalize(vectors[:, :self.dim])
+        return normalize((vectors - self.mean) @ self.components.T)
+
+    def save(self, path):
+        arrays = {"mean": self.mean, "components": self.components} if self.components is not None else {}
+        with open(path, 'wb') as f:
+            np.savez(f, method=self.method, dim=self.dim, input_dim=self.input_dim, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(str(data["method"]), int(data["dim"]), int(data["input_dim"]),
+                       data["mean"] if "mean" in data else None,
+                       data["components"] if "components" in data else None)
+
+
+class ReducedVectorIndex:
+    """
+    Any backend fed projected vectors; queries go through the same projection.
+    A PCA cannot be fitted on the first upload batch, so until VECTOR_TRAIN_MIN
+    vectors exist they sit (and are searched) in an exact full-width buffer.
+    """
+    def __init__(self, projection, backend, storage, rescore_factor=RESCORE_FACTOR, inner=None, buffer=None):
+        self.d = projection.input_dim
+        self.projection = projection
+        self.backend = backend
+        self.storage = storage
+        self.rescore_factor = rescore_factor
+        if inner is None and buffer is None:
+            if projection.is_fitted:
+                inner = create_vector_index(projection.dim, backend, storage, rescore_factor, reduction="none")
+            else:
+                buffer = FaissVectorIndex(self.d)
+        self.inner = inner
+        self.buffer = buffer
+
+    @property
+    def reduction(self):
+        return self.projection.method
+
+    @property
+    def ntotal(self):
+        return (self.buffer or self.inner).ntotal
+
+    def fit(self):
+        """Fits the PCA on the buffered vectors now instead of waiting for VECTOR_TRAIN_MIN of them"""
+        if self.buffer is None:
+            return
+        vectors = self.buffer.reconstruct_all()
+        print(f"🧭 [VectorIndex] Fitting PCA {self.d} -> {self.projection.dim} dims on {len(vectors)} vectors...")
+        self.projection.fit(vectors)
+        self.inner = create_vector_index(self.projection.dim, self.backend, self.storage, self.rescore_factor, reduction="none")
+        self.inner.add(self.projection.apply(vectors))
+        self.buffer = None
+
+    def add(self, vectors):
+        if self.buffer is None:
+            self.inner.add(self.projection.apply(vectors))
+            return
+        self.buffer.add(vectors)
+        if self.buffer.ntotal >= VECTOR_TRAIN_MIN:
+            self.fit()
+
+    def search(self, queries, k):
+        if self.buffer is not None:
+            return self.buffer.search(queries, k)
+        return self.inner.search(self.projection.apply(queries), k)
+
+    def reconstruct_all(self):
+        if self.buffer is not None:
+            return self.buffer.reconstruct_all()
+        raise ValueError("a reduced index only keeps projected vectors")
+
+    def bytes_per_vector(self):
+        return (self.buffer or self.inner).bytes_per_vector()
+
+    def copy(self):
+        return ReducedVectorIndex(self.projection.copy(), self.backend, self.storage, self.rescore_factor,
+                                  self.inner.copy() if self.inner is not None else None,
+                                  self.buffer.copy() if self.buffer is not None else None)
+
+    def save(self, path):
+        self.projection.save(path + PROJECTION_SUFFIX)
+        (self.buffer or self.inner).save(path)
+
+
+def resolve_layout(backend, storage):
+    """
+    The (backend, storage) pair that is actually built for the requested one:
+    unknown names fall back to flat / float32, and usearch has no pq codes.
+    """
+    if backend not in BACKENDS:
+        print(f"⚠️ [VectorIndex] Unknown vector_backend '{backend}', using 'flat'")
+        backend = "flat"
+    if storage not in STORAGES:
+        print(f"⚠️ [VectorIndex] Unknown vector_storage '{storage}', using 'float32'")
+        storage = "float32"
+    if backend == "usearch" and storage not in USEARCH_DTYPES:
+        print(f"⚠️ [VectorIndex] usearch has no '{storage}' codes, using 'sq8'")
+        storage = "sq8"
+    return backend, storage
+
+
+def create_vector_index(d, backend=VECTOR_BACKEND, storage=VECTOR_STORAGE, rescore_factor=RESCORE_FACTOR,
+                        reduction=EMBED_REDUCTION, reduced_dim=EMBED_REDUCED_DIM):
+    backend, storage = resolve_layout(backend, storage)
+    if reduction in REDUCTIONS and reduction != "none" and reduced_dim < d:
+        return ReducedVectorIndex(Projection(reduction, reduced_dim, d), backend, storage, rescore_factor)
+    if backend == "usearch":
+        return UsearchVectorIndex(d, storage, rescore_factor)
+    return FaissVectorIndex(d, backend, storage, rescore_factor)
+
+
+def load_vector_index(path, backend, storage="float32", io_flags=0):
+    """Opens a saved index; io_flags != 0 memory-maps whatever the backend allows"""
+    projection = None
+    if os.path.exists(path + PROJECTION_SUFFIX):
+        projection = Projection.load(path + PROJECTION_SUFFIX)
+        if not projection.is_fitted:
+            buffer = FaissVectorIndex.load(path, "flat", io_flags=io_flags)
+            return ReducedVectorIndex(projection, backend, storage, buffer=buffer)
+
+    if backend == "usearch":
+        index = UsearchVectorIndex.load(path, storage, mmap=io_flags != 0)
+    else:
+        index = FaissVectorIndex.load(path, backend, storage, io_flags=io_flags)
+    return ReducedVectorIndex(projection, backend, storage, inner=index) if projection else index
+
+
+def layout(vector_index):
+    """What create_vector_index was asked for; stored in the manifest and compared on load"""
+    reduction = getattr(vector_index, "reduction", "none")
+    reduced_dim = vector_index.projection.dim if reduction != "none" else vector_index.d
+    return {"vector_backend": vector_index.backend, "vector_storage": vector_index.storage,
+            "embed_reduction": reduction, "reduced_dim": reduced_dim}
+
+
+def configured_layout(d):
+    """The layout settings.json asks for, for d-dim embeddings (after the same fallbacks
+    create_vector_index applies, so a saved index built from it compares equal)"""
+    reduced = EMBED_REDUCTION in REDUCTIONS and EMBED_REDUCTION != "none" and EMBED_REDUCED_DIM < d
+    backend, storage = resolve_layout(VECTOR_BACKEND, VECTOR_STORAGE)
+    return {"vector_backend": backend, "vector_storage": storage,
+            "embed_reduction": EMBED_REDUCTION if reduced else "none",
+            "reduced_dim": EMBED_REDUCED_DIM if reduced else d}
+
+
+def convert_vector_index(vector_index, backend=VECTOR_BACKEND, storage=VECTOR_STORAGE,
+                         reduction=EMBED_REDUCTION, reduced_dim=EMBED_REDUCED_DIM):
+    """
+    Rebuilds an index with another backend / storage / reduction from its stored
+    vectors (no re-embedding). Raises ValueError for a fitted reduced index, whose
+    full-width vectors are gone.
+    """
+    converted = create_vector_index(vector_index.d, backend, storage, reduction=reduction, reduced_dim=reduced_dim)
+    converted.add(vector_index.reconstruct_all())
+    return converted
@@ -0,0 +1,88 @@
+"""
+Background Warm-Up
+==================
+Startup work that used to run at import time (restoring the persisted index,
+loading the rerankers, importing the PDF stack and the Ollama client) runs
+here, in order, on one daemon thread, so the web server starts answering
+right away. Each step is a component with a status:
+
+    pending -> loading -> ready | failed   (plus load seconds and the error)
+
+The app is *ready* once every required component is ready; /health and
+/ready report the table. wait(name) blocks until a component has finished.
+"""
+
+import time
+import atexit
+import threading
+import traceback
+from collections import OrderedDict
+
+PENDING, LOADING, READY, FAILED = "pending", "loading", "ready", "failed"
+
+
+class WarmUp:
+    def __init__(self):
+        self.steps = OrderedDict()  # name -> (load, required)
+        self.components = OrderedDict()
+        self.events = {}
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.thread = None
+
+    def add(self, name, load, required=True):
+        self.steps[name] = (load, required)
+        self.components[name] = {"status": PENDING, "required": required, "seconds": None, "error": None}
+        self.events[name] = threading.Event()
+
+    def start(self):
+        """Starts the warm-up thread once; later calls are no-ops"""
+        with self.lock:
+            if self.thread is not None:
+                return self
+            self.started_at = time.time()
+            self.thread = threading.Thread(target=self._run, name="warm-up", daemon=True)
+            self.thread.start()
+        # Exiting while the thread is inside a native import (PyMuPDF, onnxruntime) can abort
+        # the interpreter, so short-lived processes give it a moment to finish
+        atexit.register(self.thread.join, 60)
+        return self
+
+    def _run(self):
+        for name, (load, _) in self.steps.items():
+            self._set(name, status=LOADING)
+            start = time.perf_counter()
+            try:
+                load()
+                self._set(name, status=READY, seconds=round(time.perf_counter() - start, 3))
+            except Exception as e:
+                traceback.print_exc()
+                self._set(name, status=FAILED, seconds=round(time.perf_counter() - start, 3), error=str(e))
+            self.events[name].set()
+        print(f"✅ Warm-up finished in {time.time() - self.started_at:.2f}s")
+
+    def _set(self, name, **fields):
+        with self.lock:
+            self.components[name].update(fields)
+
+    def wait(self, name, timeout=None):
+        """Blocks until the component finished loading (either way); True if it is ready"""
+        self.events[name].wait(timeout)
+        return self.status(name) == READY
+
+    def status(self, name):
+        with self.lock:
+            return self.components[name]["status"]
+
+    def is_ready(self):
+        with self.lock:
+            return all(c["status"] == READY for c in self.components.values() if c["required"])
+
+    def report(self):
+        with self.lock:
+            components = {name: dict(c) for name, c in self.components.items()}
+        return {
+            "ready": all(c["status"] == READY for c in components.values() if c["required"]),
+            "uptime_s": round(time.time() - self.started_at, 3),
+            "components": components,
+        }